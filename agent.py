@@ -1,208 +1,514 @@
-import google.generativeai as genai
+import json
 import os
-import streamlit as st
-import time
+import queue
+import re
+import threading
+import draft_cache
+import extraction
+import metrics
+import model_pool
+import prompts
+import rate_limiter
+import templates
+
+MODEL_NAME = 'gemini-2.5-flash'
+RETRY_BASE_DELAY = float(os.environ.get('GEMINI_RETRY_BASE_DELAY', 10))
+
+_genai = None
+_api_key = None
+_genai_lock = threading.Lock()
+
 
 def configure_genai(api_key):
-    """Configures the Gemini API."""
-    genai.configure(api_key=api_key)
+    """
+    Sets the Gemini API key. The SDK itself is only imported when the first
+    model is created, so calling this on every app start is cheap.
+    """
+    global _api_key
+    with _genai_lock:
+        if api_key == _api_key:
+            return
+        _api_key = api_key
+        if _genai is not None:
+            _genai.configure(api_key=api_key)
+    # Pooled clients and cooldowns belong to the previous key
+    _pool.clear()
+
+
+def get_genai():
+    """google.generativeai, imported and configured on first use."""
+    global _genai
+    with _genai_lock:
+        if _genai is None:
+            import google.generativeai as genai
+            if _api_key:
+                genai.configure(api_key=_api_key)
+            _genai = genai
+        return _genai
+
+
+def _new_model(model_name, system_instruction):
+    return get_genai().GenerativeModel(model_name, system_instruction=system_instruction)
+
+
+# Shared by every thread and session; see model_pool for the fallback chain
+_pool = model_pool.ModelPool(_new_model)
+
+
+def get_model(model_name=MODEL_NAME, system_instruction=None):
+    """The shared GenerativeModel for a model name and system instruction (one API key per process)."""
+    return _pool.get(model_name, system_instruction)
+
+
+def get_task_model(task, model_name=MODEL_NAME):
+    """The model set up with the system instruction for a prompts.INSTRUCTIONS task."""
+    return get_model(model_name, system_instruction=prompts.INSTRUCTIONS[task])
+
+
+# Configure safety settings to prevent false positives
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+]
+
 
+# Structured output schemas
+FIELDS_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {'type': {'type': 'STRING'}, 'subject': {'type': 'STRING'}},
+    'required': ['type', 'subject'],
+}
+REPLY_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {'answer': {'type': 'STRING', 'enum': ['yes', 'no', 'unclear']}},
+    'required': ['answer'],
+}
+EMAIL_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {'subject': {'type': 'STRING'}, 'body': {'type': 'STRING'}},
+    'required': ['subject', 'body'],
+}
+DRAFTS_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {'student': EMAIL_SCHEMA, 'teacher': EMAIL_SCHEMA},
+    'required': ['student', 'teacher'],
+}
 
-def generate_content_with_retry(model, prompt, retries=4, base_delay=10):
+
+def json_config(schema):
+    """generation_config asking Gemini for JSON matching schema."""
+    return {'response_mime_type': 'application/json', 'response_schema': schema}
+
+
+def generate_content_with_retry(model, prompt, retries=4, base_delay=None, generation_config=None, task=None):
     """
     Generates content with retry logic for 429 or 503 errors.
     Also handles blocked responses (RECITATION, SAFETY).
+    Calls go through the shared per-model rate limiter, which spaces requests
+    to the configured RPM/TPM and backs off with jitter on throttling.
+    task (a prompts.INSTRUCTIONS key) labels the token metrics and adds the
+    system instruction to the token reservation.
+    A throttled model hands over to the next one in its fallback chain
+    (model_pool); only the last one is retried with backoff.
     """
-    for attempt in range(retries):
+    kwargs = _request_kwargs(generation_config)
+    tokens = _prompt_tokens(model, prompt, task)
+    chain = _pool.chain(model)
+    for i, candidate in enumerate(chain):
+        last = i == len(chain) - 1
+
+        def _call():
+            return _response_text(candidate.generate_content(prompt, **kwargs), task)
+
         try:
-            # Configure safety settings to prevent false positives
-            safety_settings = [
-                {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-            ]
-            
-            response = model.generate_content(prompt, safety_settings=safety_settings)
-            
-            # Check if response was blocked
-            if not response.candidates or not response.candidates[0].content.parts:
-                # Response was blocked (RECITATION, SAFETY, etc.)
-                finish_reason = response.candidates[0].finish_reason if response.candidates else "UNKNOWN"
-                raise ValueError(f"Response blocked by safety filters. Finish reason: {finish_reason}")
-            
-            return response.text
-        except ValueError as ve:
-            # Safety/recitation block - don't retry, just fail
-            raise ve
+            return rate_limiter.call_with_limits(_limiter(candidate), _call, prompt, retries=retries if last else 1,
+                                                 base_delay=RETRY_BASE_DELAY if base_delay is None else base_delay,
+                                                 tokens=tokens)
         except Exception as e:
-            error_str = str(e)
-            if "429" in error_str or "503" in error_str:
-                if attempt < retries - 1:
-                    wait_time = base_delay * (2 ** attempt)  # Exponential backoff: 10, 20, 40...
-                    time.sleep(wait_time)
-                    continue
-            raise e
+            if last or not rate_limiter.is_throttle_error(e):
+                raise
+            _fall_back(candidate, chain[i + 1])
+
 
-def generate_email_content(event_details, teacher_name="Teacher", student_name="Student"):
+async def generate_content_with_retry_async(model, prompt, retries=4, base_delay=None, generation_config=None,
+                                            task=None):
     """
-    Generates a confirmation email for the STUDENT using Gemini.
+    generate_content_with_retry using the SDK's generate_content_async, so
+    many calls can be in flight on one event loop. Shares the same limiters
+    and fallback chain.
     """
-    
-    # Extract event info
-    summary = event_details.get('summary', 'Appointment')
-    
-    # Time Parsing Logic
-    start_raw = event_details['start'].get('dateTime', event_details['start'].get('date'))
-    end_raw = event_details['end'].get('dateTime', event_details['end'].get('date'))
-    description = event_details.get('description', '')
+    kwargs = _request_kwargs(generation_config)
+    tokens = _prompt_tokens(model, prompt, task)
+    chain = _pool.chain(model)
+    for i, candidate in enumerate(chain):
+        last = i == len(chain) - 1
 
-    formatted_time_str = start_raw 
-    formatted_date_str = start_raw 
+        async def _call():
+            return _response_text(await candidate.generate_content_async(prompt, **kwargs), task)
 
-    try:
-        import datetime
-        if 'T' in start_raw:
-            dt_start = datetime.datetime.fromisoformat(start_raw)
-            dt_end = datetime.datetime.fromisoformat(end_raw)
-            
-            # Format: 3:30pm - 5:00pm
-            start_str = dt_start.strftime('%I:%M%p').lower()
-            end_str = dt_end.strftime('%I:%M%p').lower()
-            if start_str.startswith('0'): start_str = start_str[1:]
-            if end_str.startswith('0'): end_str = end_str[1:]
-            
-            formatted_time_str = f"{start_str} - {end_str}"
-            formatted_date_str = dt_start.strftime('%B, %d, %Y')
-        else:
-            formatted_time_str = "All Day"
-            formatted_date_str = start_raw
-    except:
-        pass
-
-    model = genai.GenerativeModel('gemini-2.5-flash')
-    
-    prompt = f"""
-    You are an automated email assistant for Elite Prep Suwanee.
-    Please generate a confirmation email for a tutoring appointment using the EXACT format below.
-    Do not add any extra text or conversational filler.
-    
-    Event Details:
-    - Subject/Topic: {summary}
-    - Date: {formatted_date_str}
-    - Time Range: {formatted_time_str}
-    - Description/Type: {description}
-    - Teacher Name: {teacher_name}
-    - Student Name: {student_name}
-    
-    Format Requirements:
-    - Date format: 'Month, Day, Year' (e.g. December, 06, 2025)
-    - Time format: 'h:mmam - h:mmpm' (e.g. 3:30pm - 5:00pm)
-    - [Type] and [Subject] should be extracted from the event details.
-    
-    Output Format:
-    Subject: REMINDER: {student_name}'s tutoring with {teacher_name} Teacher - [Date] at [Time]
-    
-    Dear {student_name},
-    
-    This is a reminder that {student_name} has a tutoring session with {teacher_name} Teacher, [Date] at [Time]
-    
-    Date: [Date]
-    Time: [Time]
-    Type: [Type]
-    Subject: [Subject]
-    
-    If you cannot attend the tutoring session, please reply with **[N]**, and if you can attend, please reply with **[Y]** as soon as possible.
-    
-    If you have any questions or need further details, please feel free to contact us anytime.
-    
-    Best regards,
-    
-    Andy Lee / Elite Prep Suwanee
+        try:
+            return await rate_limiter.call_with_limits_async(
+                _limiter(candidate), _call, prompt, retries=retries if last else 1,
+                base_delay=RETRY_BASE_DELAY if base_delay is None else base_delay, tokens=tokens)
+        except Exception as e:
+            if last or not rate_limiter.is_throttle_error(e):
+                raise
+            _fall_back(candidate, chain[i + 1])
+
+
+_SAFETY_KWARGS = {'safety_settings': SAFETY_SETTINGS}
+
+
+def _request_kwargs(generation_config):
+    if not generation_config:
+        return _SAFETY_KWARGS
+    return dict(_SAFETY_KWARGS, generation_config=generation_config)
+
+
+def _limiter(model):
+    return rate_limiter.get_limiter(getattr(model, 'model_name', MODEL_NAME))
+
+
+def _fall_back(model, fallback):
+    """Puts a throttled model on cooldown and records the switch."""
+    _pool.mark_throttled(model)
+    model_name = getattr(model, 'model_name', MODEL_NAME)
+    fallback_name = getattr(fallback, 'model_name', MODEL_NAME)
+    metrics.inc('gemini_fallbacks_total', model=model_name, fallback=fallback_name)
+    print(f"{model_name} is throttled, falling back to {fallback_name}")
+
+
+def _prompt_tokens(model, prompt, task):
+    """Input tokens for a request (system instruction + prompt), recorded per task."""
+    tokens = prompts.count_tokens(model, prompts.INSTRUCTIONS.get(task, '')) + prompts.count_tokens(model, prompt)
+    metrics.observe('gemini_prompt_tokens', tokens, task=task or 'other')
+    return tokens
+
+
+def _record_usage(response, task):
+    """Adds the response's usage metadata to gemini_tokens_total."""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is not None:
+        task = task or 'other'
+        metrics.inc('gemini_tokens_total', getattr(usage, 'prompt_token_count', 0) or 0, kind='prompt', task=task)
+        metrics.inc('gemini_tokens_total', getattr(usage, 'candidates_token_count', 0) or 0, kind='output',
+                    task=task)
+
+
+def _response_text(response, task=None):
+    """Returns response.text, raising ValueError if the response was blocked."""
+    if not response.candidates or not response.candidates[0].content.parts:
+        # Response was blocked (RECITATION, SAFETY, etc.)
+        finish_reason = response.candidates[0].finish_reason if response.candidates else "UNKNOWN"
+        raise ValueError(f"Response blocked by safety filters. Finish reason: {finish_reason}")
+    _record_usage(response, task)
+    return response.text
+
+
+def extract_fields_with_llm(event_details):
+    """
+    Asks Gemini for only the [Type] and [Subject] of an event.
+    Used when extraction.extract_fields cannot find them locally.
+    """
+    text = generate_content_with_retry(get_task_model('fields'), prompts.fields_prompt(event_details),
+                                       generation_config=json_config(FIELDS_SCHEMA), task='fields')
+    return _parse_fields(text)
+
+
+async def extract_fields_with_llm_async(event_details):
+    text = await generate_content_with_retry_async(get_task_model('fields'), prompts.fields_prompt(event_details),
+                                                   generation_config=json_config(FIELDS_SCHEMA), task='fields')
+    return _parse_fields(text)
+
+
+def _parse_fields(text):
+    data = json.loads(text)
+    return {'type': data.get('type') or None, 'subject': data.get('subject') or None}
+
+
+def _fields_inputs(event_details):
+    return {'summary': event_details.get('summary', ''), 'description': event_details.get('description', '')}
+
+
+def resolve_fields(event_details):
+    """Local extraction (rules and roster) first; Gemini only fills what is still missing."""
+    fields = extraction.extract_fields(event_details)
+    missing = templates.missing_fields(fields)
+    if missing:
+        llm_fields = draft_cache.cached('fields', event_details, _fields_inputs(event_details), MODEL_NAME,
+                                        lambda: extract_fields_with_llm(event_details))
+        for name in missing:
+            fields[name] = llm_fields.get(name)
+    return fields
+
+
+async def resolve_fields_async(event_details):
+    fields = extraction.extract_fields(event_details)
+    missing = templates.missing_fields(fields)
+    if missing:
+        llm_fields = await draft_cache.cached_async('fields', event_details, _fields_inputs(event_details), MODEL_NAME,
+                                                    lambda: extract_fields_with_llm_async(event_details))
+        for name in missing:
+            fields[name] = llm_fields.get(name)
+    return fields
+
+def classify_reply_with_llm(text):
+    """
+    Asks Gemini whether a reply to a confirmation email says the student
+    will attend. Returns 'yes', 'no' or None when it can't tell.
+    Used when replies.parse_reply finds no clear answer.
+    """
+    answer = json.loads(generate_content_with_retry(get_task_model('reply'), prompts.reply_prompt(text),
+                                                    generation_config=json_config(REPLY_SCHEMA),
+                                                    task='reply')).get('answer')
+    return answer if answer in ('yes', 'no') else None
+
+
+def validate_drafts(data):
+    """Checks a parsed drafts object against DRAFTS_SCHEMA; raises ValueError if it does not match."""
+    if not isinstance(data, dict):
+        raise ValueError("Drafts must be a JSON object")
+    for recipient in DRAFTS_SCHEMA['required']:
+        draft = data.get(recipient)
+        if not isinstance(draft, dict):
+            raise ValueError(f"Missing '{recipient}' draft")
+        for field in EMAIL_SCHEMA['required']:
+            if not isinstance(draft.get(field), str) or not draft[field].strip():
+                raise ValueError(f"'{recipient}.{field}' must be a non-empty string")
+    return {r: {'subject': data[r]['subject'].strip(), 'body': data[r]['body'].strip()}
+            for r in DRAFTS_SCHEMA['required']}
+
+
+def generate_drafts(event_details, teacher_name="Teacher", student_name="Student", use_template=True, fields=None):
+    """
+    Generates both confirmation emails as
+    {'student': {'subject', 'body'}, 'teacher': {'subject', 'body'}}.
+    The template path renders them locally; use_template=False asks Gemini
+    for both in a single structured (JSON) call.
+    """
+    if use_template:
+        fields = fields or resolve_fields(event_details)
+        return templates.render_drafts(event_details, teacher_name, student_name, fields)
+
+    prompt = prompts.drafts_prompt(event_details, teacher_name, student_name)
+    model = get_task_model('drafts')
+
+    def _generate():
+        text = generate_content_with_retry(model, prompt, generation_config=json_config(DRAFTS_SCHEMA), task='drafts')
+        return validate_drafts(json.loads(text))
+
+    return draft_cache.cached('drafts', event_details, _cache_inputs(prompt, 'drafts'), MODEL_NAME, _generate)
+
+
+async def generate_drafts_async(event_details, teacher_name="Teacher", student_name="Student", use_template=True,
+                                fields=None):
+    """generate_drafts for the asyncio pipeline; Gemini calls use generate_content_async."""
+    if use_template:
+        fields = fields or await resolve_fields_async(event_details)
+        return templates.render_drafts(event_details, teacher_name, student_name, fields)
+
+    prompt = prompts.drafts_prompt(event_details, teacher_name, student_name)
+    model = get_task_model('drafts')
+
+    async def _generate():
+        text = await generate_content_with_retry_async(model, prompt, generation_config=json_config(DRAFTS_SCHEMA),
+                                                       task='drafts')
+        return validate_drafts(json.loads(text))
+
+    return await draft_cache.cached_async('drafts', event_details, _cache_inputs(prompt, 'drafts'), MODEL_NAME,
+                                          _generate)
+
+
+def _cache_inputs(prompt, task):
+    """draft_cache inputs: the prompt plus its system instruction, so editing either misses the cache."""
+    return {'prompt': prompt, 'system': prompts.INSTRUCTIONS[task]}
+
+
+def build_email_prompt(event_details, teacher_name="Teacher", student_name="Student", kind='student'):
+    """Per-call Gemini prompt for the STUDENT or TEACHER email; the format is in prompts.EMAIL_INSTRUCTIONS."""
+    return prompts.email_prompt(event_details, teacher_name, student_name, kind)
+
+def generate_email_content(event_details, teacher_name="Teacher", student_name="Student", use_template=True, fields=None):
+    """
+    Generates a confirmation email for the STUDENT.
+    The fixed format is rendered locally; set use_template=False to have
+    Gemini write the whole email. Pass fields from resolve_fields to
+    reuse one extraction for both emails.
     """
+    if use_template:
+        try:
+            fields = fields or resolve_fields(event_details)
+            return templates.render_student_email(event_details, teacher_name, student_name, fields)
+        except Exception as e:
+            return f"Error generating email: {e}"
+
+    model = get_task_model('student')
+    prompt = build_email_prompt(event_details, teacher_name, student_name, 'student')
     
     try:
-        return generate_content_with_retry(model, prompt)
+        return draft_cache.cached('student', event_details, _cache_inputs(prompt, 'student'), MODEL_NAME,
+                                  lambda: generate_content_with_retry(model, prompt, task='student'))
     except Exception as e:
         return f"Error generating email: {e}"
 
-def generate_teacher_email_content(event_details, teacher_name="Teacher", student_name="Student"):
+def generate_teacher_email_content(event_details, teacher_name="Teacher", student_name="Student", use_template=True, fields=None):
     """
-    Generates a confirmation email for the TEACHER using Gemini.
+    Generates a confirmation email for the TEACHER.
+    The fixed format is rendered locally; set use_template=False to have
+    Gemini write the whole email. Pass fields from resolve_fields to
+    reuse one extraction for both emails.
     """
+    if use_template:
+        try:
+            fields = fields or resolve_fields(event_details)
+            return templates.render_teacher_email(event_details, teacher_name, student_name, fields)
+        except Exception as e:
+            return f"Error generating email: {e}"
+
+    model = get_task_model('teacher')
+    prompt = build_email_prompt(event_details, teacher_name, student_name, 'teacher')
     
-    # Extract event info
-    summary = event_details.get('summary', 'Appointment')
-    
-    # Time Parsing Logic
-    start_raw = event_details['start'].get('dateTime', event_details['start'].get('date'))
-    end_raw = event_details['end'].get('dateTime', event_details['end'].get('date'))
-    description = event_details.get('description', '')
+    try:
+        return draft_cache.cached('teacher', event_details, _cache_inputs(prompt, 'teacher'), MODEL_NAME,
+                                  lambda: generate_content_with_retry(model, prompt, task='teacher'))
+    except Exception as e:
+        return f"Error generating email: {e}"
+
+
+# Give up on a stream that produces nothing for this many seconds
+STREAM_STALL_TIMEOUT = 30
+
+
+class StreamCancelled(Exception):
+    """Raised when a streaming generation is cancelled or stalls."""
+
+
+def parse_partial_email(text, default_subject=""):
+    """
+    Splits a (possibly incomplete) generated email into subject and body.
+    Until the Subject line is finished, it is returned as the subject so far.
+    """
+    stripped = text.lstrip()
+    if not stripped.startswith("Subject:"):
+        return {'subject': default_subject, 'body': stripped}
+    subject, newline, body = stripped[len("Subject:"):].partition("\n")
+    return {'subject': subject.strip(), 'body': body.strip() if newline else ""}
+
 
-    formatted_time_str = start_raw 
-    formatted_date_str = start_raw 
+def stream_email_content(event_details, teacher_name="Teacher", student_name="Student", kind='student',
+                         stall_timeout=STREAM_STALL_TIMEOUT, cancel_event=None):
+    """
+    Streams a Gemini-written STUDENT or TEACHER email.
+    Yields the accumulated text after every chunk. Raises StreamCancelled if
+    cancel_event is set or no chunk arrives within stall_timeout seconds.
+    """
+    prompt = build_email_prompt(event_details, teacher_name, student_name, kind)
+    return _stream(get_task_model(kind), prompt, kind, None, stall_timeout, cancel_event)
 
+
+def _partial_json_string(text, recipient, field):
+    """The (possibly unterminated) JSON string value of recipient.field in text, or None."""
+    match = re.search(r'"%s"\s*:\s*\{[^{]*?"%s"\s*:\s*"((?:[^"\\]|\\.)*)' % (recipient, field), text)
+    if not match:
+        return None
+    value = match.group(1)
+    # Drop an escape sequence cut off mid-chunk
+    value = re.sub(r'\\(u[0-9a-fA-F]{0,3})?$', '', value)
     try:
-        import datetime
-        if 'T' in start_raw:
-            dt_start = datetime.datetime.fromisoformat(start_raw)
-            dt_end = datetime.datetime.fromisoformat(end_raw)
-            
-            # Format: 3:30pm - 5:00pm
-            start_str = dt_start.strftime('%I:%M%p').lower()
-            end_str = dt_end.strftime('%I:%M%p').lower()
-            if start_str.startswith('0'): start_str = start_str[1:]
-            if end_str.startswith('0'): end_str = end_str[1:]
-            
-            formatted_time_str = f"{start_str} - {end_str}"
-            # Teacher format: MM. dd, yyyy
-            formatted_date_str = dt_start.strftime('%m. %d, %Y')
-        else:
-            formatted_time_str = "All Day"
-            formatted_date_str = start_raw
-    except:
-        pass
-    
-    model = genai.GenerativeModel('gemini-2.5-flash')
-    
-    prompt = f"""
-    You are an automated email assistant for Elite Prep Suwanee.
-    Please generate a confirmation email for a tutoring appointment using the EXACT format below.
-    Do not add any extra text or conversational filler.
-    
-    Event Details:
-    - Subject/Topic: {summary}
-    - Date: {formatted_date_str}
-    - Time Range: {formatted_time_str}
-    - Description/Type: {description}
-    - Teacher Name: {teacher_name}
-    - Student Name: {student_name}
-    
-    Format Requirements:
-    - Date format: 'MM. dd, yyyy' (e.g. 12. 06, 2025)
-    - Time format: 'h:mmam - h:mmpm' (e.g. 3:30pm - 5:00pm)
-    - [Type] and [Subject] should be extracted from the event details.
-    
-    Output Format:
-    Subject: REMINDER: {teacher_name} teacher has tutoring with {student_name} - [Date] at [Time]
-    
-    Dear {teacher_name} teacher,
-    
-    This is a reminder that {teacher_name} teacher has a tutoring session with {student_name}, [Date] at [Time]
-    
-    Date: [Date]
-    Time: [Time]
-    Type: [Type]
-    Subject: [Subject]
-    
-    If you have any questions or need further details, please feel free to contact us.
-    
-    Best regards,
-    
-    Andy Lee / Elite Prep Suwanee
+        return json.loads(f'"{value}"')
+    except ValueError:
+        return value
+
+
+def parse_partial_drafts(text):
     """
-    
+    Pulls the subjects and bodies written so far out of an incomplete
+    DRAFTS_SCHEMA response. Fields not started yet are empty strings.
+    """
+    return {recipient: {field: (_partial_json_string(text, recipient, field) or '').strip()
+                        for field in EMAIL_SCHEMA['required']}
+            for recipient in DRAFTS_SCHEMA['required']}
+
+
+def stream_drafts(event_details, teacher_name="Teacher", student_name="Student",
+                  stall_timeout=STREAM_STALL_TIMEOUT, cancel_event=None):
+    """
+    Streams both emails from the single structured call generate_drafts
+    makes with use_template=False. Yields parse_partial_drafts of the text
+    so far after every chunk, then the validated drafts as the last value.
+    """
+    prompt = prompts.drafts_prompt(event_details, teacher_name, student_name)
+
+    def _generate():
+        text = ""
+        for text in _stream(get_task_model('drafts'), prompt, 'drafts', json_config(DRAFTS_SCHEMA),
+                            stall_timeout, cancel_event):
+            yield parse_partial_drafts(text)
+        yield validate_drafts(json.loads(text))
+
+    return draft_cache.cached_stream('drafts', event_details, _cache_inputs(prompt, 'drafts'), MODEL_NAME, _generate)
+
+
+def _stream(model, prompt, task, generation_config, stall_timeout, cancel_event):
+    """Streams one Gemini call under the model's limiter, yielding the accumulated text."""
+    # Streams can't switch models midway; start on the first model not on cooldown
+    model = _pool.chain(model)[0]
+    kwargs = _request_kwargs(generation_config)
+    limiter = _limiter(model)
+    chunks = queue.Queue()
+    done = object()
+
+    def _produce():
+        try:
+            chunk = None
+            for chunk in model.generate_content(prompt, stream=True, **kwargs):
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                try:
+                    chunks.put(chunk.text)
+                except ValueError:
+                    # Chunk without text parts (e.g. only a finish reason)
+                    continue
+            # The last chunk carries the usage for the whole stream
+            _record_usage(chunk, task)
+            chunks.put(done)
+        except Exception as e:
+            chunks.put(e)
+
+    limiter.acquire(_prompt_tokens(model, prompt, task))
+    throttled = failed = False
     try:
-        return generate_content_with_retry(model, prompt)
-    except Exception as e:
-        return f"Error generating email: {e}"
+        threading.Thread(target=_produce, name='gemini-stream', daemon=True).start()
+        text = ""
+        waited = 0.0
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise StreamCancelled("Generation cancelled")
+            try:
+                item = chunks.get(timeout=0.25)
+            except queue.Empty:
+                waited += 0.25
+                if waited >= stall_timeout:
+                    raise StreamCancelled(f"No output from Gemini for {stall_timeout}s")
+                continue
+            waited = 0.0
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                throttled = rate_limiter.is_throttle_error(item)
+                failed = not throttled
+                if throttled:
+                    _pool.mark_throttled(model)
+                raise item
+            text += item
+            yield text
+        if not text:
+            failed = True
+            raise ValueError("Response blocked by safety filters or empty.")
+    except (StreamCancelled, GeneratorExit):
+        failed = True
+        raise
+    finally:
+        limiter.release(throttled=throttled, failed=failed)
@@ -2,9 +2,22 @@ import streamlit as st
 import datetime
 import auth
 import calendar_api
+import calendar_sync
 import gmail_api
+import outbox
 import agent
+import batch
+import draft_cache
+import extraction
+import metrics
+import rate_limiter
+import replies
+import services
+import templates
+import tenants
+import atexit
 import os
+import time
 
 # Page Config
 st.set_page_config(page_title="Calendar Confirmation Agent", page_icon="📅", layout="wide")
@@ -24,13 +37,17 @@ if "APP_PASSWORD" in st.secrets:
 # Sidebar - Configuration
 st.sidebar.header("Configuration")
 # Try to load from secrets or env
-default_api_key = ""
+default_api_key = os.environ.get('GEMINI_API_KEY', "")
 try:
     default_api_key = st.secrets["GEMINI_API_KEY"]
 except:
     pass
 
-gemini_api_key = st.sidebar.text_input("Gemini API Key", value=default_api_key, type="password", help="Get it from aistudio.google.com")
+if tenants.MULTI_USER:
+    # The Gemini key is process-wide (see model_pool), so sessions can't bring their own
+    gemini_api_key = default_api_key
+else:
+    gemini_api_key = st.sidebar.text_input("Gemini API Key", value=default_api_key, type="password", help="Get it from aistudio.google.com")
 
 if not gemini_api_key:
     pass
@@ -41,23 +58,294 @@ if gemini_api_key:
 else:
     st.sidebar.warning("Please enter Gemini API Key to use AI features.")
 
+if "BUSINESS_TIMEZONE" in st.secrets and st.secrets["BUSINESS_TIMEZONE"] != calendar_api.BUSINESS_TIMEZONE:
+    calendar_api.set_business_timezone(st.secrets["BUSINESS_TIMEZONE"])
+
 # Authentication
-creds = auth.get_credentials()
+if tenants.MULTI_USER:
+    # One tenant per Google account: own token, outbox, replies and calendar sync.
+    # Each user authorizes their own account in their browser (web OAuth flow).
+    registry = tenants.get_registry()
+    user = getattr(st, 'user', None)
+    signed_in = user.get('email') if user is not None and user.get('is_logged_in') else None
+    tenant_email = signed_in or st.session_state.get('tenant_email')
+    tenant = registry.get(tenant_email) if tenant_email else None
+    if tenant is None and 'code' in st.query_params:
+        code, state = st.query_params.get('code'), st.query_params.get('state')
+        st.query_params.clear()
+        try:
+            login_creds = auth.finish_authorization(code, state)
+            tenant_email = gmail_api.get_profile(gmail_api.get_gmail_service(login_creds))['emailAddress']
+            if signed_in and tenant_email.lower() != signed_in.lower():
+                raise RuntimeError(f"Signed in as {signed_in} but authorized {tenant_email}")
+            tenant = registry.login(tenant_email, login_creds)
+        except Exception as e:
+            st.error(f"Authentication failed: {e}")
+    if tenant is None:
+        try:
+            login_url = auth.authorization_url()
+        except Exception as e:
+            st.error(f"Authentication is not configured: {e}")
+            st.stop()
+        st.info("Please log in to continue.")
+        st.link_button("Sign in with Google", login_url)
+        st.stop()
+    st.session_state.tenant_email = tenant.email
+    creds = tenant.creds()
+    cred_manager = tenant.credentials
+    box = tenant.outbox
+    st.sidebar.success(f"Authenticated as {tenant.email}")
+    if st.sidebar.button("Log out"):
+        registry.logout(tenant.email)
+        st.session_state.clear()
+        st.rerun()
+else:
+    tenant = None
+    creds = auth.get_credentials()
 
-if not creds:
-    st.info("Please log in to continue.")
-    st.stop()
+    if not creds:
+        st.info("Please log in to continue.")
+        st.stop()
+
+    st.sidebar.success("Authenticated with Google")
+
+    cred_manager = auth.get_credential_manager()
+    box = outbox.get_outbox()
+if cred_manager:
+    cred_metrics = cred_manager.metrics()
+    if cred_metrics['last_error']:
+        st.sidebar.warning(f"Token refresh failing: {cred_metrics['last_error']}")
+    elif cred_metrics['refreshes']:
+        st.sidebar.caption(f"Token refreshed {cred_metrics['refreshes']}x in background "
+                           f"(avg {cred_metrics['avg_latency'] * 1000:.0f} ms)")
+
+if draft_cache.ENABLED:
+    cache_stats = draft_cache.get_cache().stats()
+    st.sidebar.caption(f"Draft cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+                       f"({cache_stats['size']} entries)")
+
+# Roster of students and teachers, used to fill in names from attendees and summaries
+roster = extraction.get_roster()
+with st.sidebar.expander(f"Roster ({len(roster.people)} people)"):
+    st.caption("CSV with columns name, email, role (student/teacher), aliases, subject")
+    roster_file = st.file_uploader("Upload roster", type=['csv'], label_visibility="collapsed")
+    if roster_file is not None and st.session_state.get('roster_uploaded') != roster_file.name:
+        st.session_state.roster_uploaded = roster_file.name
+        roster = extraction.save_roster(roster_file.getvalue())
+        st.success(f"Loaded {len(roster.people)} people")
 
-st.sidebar.success("Authenticated with Google")
+# Per-stage latency; METRICS_PORT also serves them to Prometheus at /metrics
+if os.environ.get('METRICS_PORT'):
+    metrics.start_http_server(int(os.environ['METRICS_PORT']))
+with st.sidebar.expander("Latency"):
+    stages = metrics.summary()
+    if stages:
+        st.dataframe([{'Stage': row['stage'], 'Calls': row['count'], 'Errors': row['errors'],
+                       'p50 (ms)': round(row['p50'] * 1000), 'p95 (ms)': round(row['p95'] * 1000)}
+                      for row in stages], use_container_width=True)
+        tokens, by_task = {}, {}
+        for labels, value in metrics.counters('gemini_tokens_total').items():
+            labels = dict(labels)
+            tokens[labels['kind']] = tokens.get(labels['kind'], 0) + value
+            if labels['kind'] == 'prompt':
+                by_task[labels.get('task', 'other')] = by_task.get(labels.get('task', 'other'), 0) + value
+        if tokens:
+            st.caption(f"Gemini tokens: {tokens.get('prompt', 0):.0f} in / {tokens.get('output', 0):.0f} out")
+            st.caption("Input by task: " + ", ".join(f"{task} {n:.0f}" for task, n in sorted(by_task.items())))
+        hit_rates = metrics.cache_hit_rates()
+        if hit_rates:
+            st.caption("Cache hit rate: " + ", ".join(f"{cache} {rate:.0%}" for cache, rate in sorted(hit_rates.items())))
+    else:
+        st.caption("No calls yet.")
 
 # Initialize Services
+@st.cache_resource(show_spinner=False, max_entries=services.MAX_SERVICES)
+def _google_services(_creds, credential_key):
+    """Built once per credential and shared by every session."""
+    return calendar_api.get_calendar_service(_creds), gmail_api.get_gmail_service(_creds)
+
 try:
-    calendar_service = calendar_api.get_calendar_service(creds)
-    gmail_service = gmail_api.get_gmail_service(creds)
+    calendar_service, gmail_service = _google_services(creds, services.credential_key(creds))
 except Exception as e:
     st.error(f"Failed to connect to Google Services: {e}")
     st.stop()
 
+@st.cache_resource(show_spinner=False)
+def _outbox_worker(_box, _gmail_service, path, credential_key, verify):
+    """One background sender per outbox: retries due sends and recovers interrupted ones."""
+    worker = outbox.OutboxWorker(_box, _gmail_service, verify=verify)
+    worker.start()
+    atexit.register(worker.stop, 5)
+    return worker
+
+if tenant:
+    tenant.start_worker(gmail_service)
+else:
+    _outbox_worker(box, gmail_service, box.path, services.credential_key(creds), outbox.can_verify(creds))
+
+# [Y]/[N] replies to sent confirmations, picked up from the Gmail history
+REPLY_ICONS = {replies.CONFIRMED: "✅", replies.DECLINED: "❌", replies.UNCLEAR: "❓"}
+reply_tracker = tenant.replies if tenant else replies.get_tracker()
+if not replies.available(creds):
+    st.sidebar.caption("Reply tracking off (set REPLY_TRACKING=1 and re-authorize to enable)")
+else:
+    if st.sidebar.button("Check Replies") or \
+            time.time() - st.session_state.get('replies_synced_at', 0) > replies.SYNC_INTERVAL:
+        st.session_state.replies_synced_at = time.time()
+        try:
+            reply_tracker.sync(gmail_service)
+        except Exception as e:
+            st.sidebar.warning(f"Could not check replies: {e}")
+    reply_counts = reply_tracker.counts()
+    st.sidebar.caption(f"Replies: {reply_counts[replies.CONFIRMED]} confirmed, "
+                       f"{reply_counts[replies.DECLINED]} declined, {reply_counts[replies.UNCLEAR]} to review")
+
+# One calendar per teacher; the teacher name comes from the calendar an event is on
+if 'calendars' not in st.session_state:
+    try:
+        st.session_state.calendars = calendar_api.list_calendars(calendar_service)
+    except Exception as e:
+        st.sidebar.warning(f"Could not list calendars: {e}")
+        st.session_state.calendars = [{'id': 'primary', 'summary': 'Primary', 'primary': True}]
+calendars_by_name = {calendar_api.calendar_name(c): c for c in st.session_state.calendars}
+selected_names = st.sidebar.multiselect(
+    "Calendars", list(calendars_by_name),
+    default=[name for name, c in calendars_by_name.items() if c.get('primary')] or list(calendars_by_name)[:1])
+selected_calendars = [calendars_by_name[name] for name in selected_names]
+
+# Local copy of the calendars, kept current with incremental syncs per calendar
+if tenant:
+    # Shared by the account's sessions, synced at most every tenants.SYNC_MAX_AGE seconds
+    sync = tenant.calendar_sync(calendar_service, selected_calendars)
+else:
+    if 'calendar_sync' not in st.session_state:
+        st.session_state.calendar_sync = calendar_sync.MultiCalendarSync(
+            calendar_service, time_min=datetime.date.today() - datetime.timedelta(days=30))
+    sync = st.session_state.calendar_sync
+    if set(sync.syncs) != {c['id'] for c in selected_calendars}:
+        sync.set_calendars(selected_calendars)
+        sync.sync()
+
+mode = st.sidebar.radio("Mode", ["Single Event", "Batch (whole day)"])
+
+if mode == "Batch (whole day)":
+    st.subheader("Batch Confirmation")
+    b_col1, b_col2 = st.columns([1, 1])
+    with b_col1:
+        batch_start = st.date_input("Start Date", value=datetime.date.today(), key="batch_start")
+        batch_end = st.date_input("End Date", value=batch_start, key="batch_end")
+        b_teacher_name = st.text_input("Teacher Name (if the event doesn't name one)", value="Teacher",
+                                       key="batch_teacher")
+        b_student_name = st.text_input("Student Name (if the event doesn't name one)", value="Student",
+                                       key="batch_student")
+    with b_col2:
+        b_teacher_email = st.text_input("Teacher Email", value="", key="batch_teacher_email")
+        b_workers = st.number_input("Concurrent workers", min_value=1, max_value=16, value=4)
+        b_rpm = st.number_input("Gemini requests per minute (0 = unlimited)", min_value=0, value=10)
+
+    if st.button("Generate All Drafts"):
+        if sync.covers(batch_start):
+            # The local copy is only synced at session start or on a calendar change; a delta
+            # sync keeps cancelled or moved sessions out of the batch
+            with st.spinner("Refreshing calendar..."):
+                sync.sync()
+            events = sync.get_events(batch_start, batch_end)
+        else:
+            events = calendar_api.get_events_for_calendars(calendar_service, selected_calendars, batch_start, batch_end)
+        if not events:
+            st.info("No events found in this range.")
+        else:
+            progress = st.progress(0.0, text=f"0 / {len(events)} events")
+            status = st.empty()
+
+            def _on_progress(done, total, result):
+                progress.progress(done / total, text=f"{done} / {total} events")
+                label = result['event'].get('summary', 'Appointment')
+                if result['error']:
+                    status.write(f"❌ {label}: {result['error']}")
+                else:
+                    status.write(f"✅ {label}")
+
+            st.session_state.batch_results = batch.generate_drafts(
+                events, b_teacher_name, b_student_name,
+                max_workers=int(b_workers), rpm=int(b_rpm), on_progress=_on_progress)
+            limits = rate_limiter.get_limiter(agent.MODEL_NAME).stats()
+            fallbacks = sum(metrics.counters('gemini_fallbacks_total').values())
+            st.caption(f"Gemini: {limits['successes']} calls, {limits['throttled']} throttled, "
+                       f"{fallbacks:.0f} sent to a fallback model, "
+                       f"avg queue wait {limits['avg_queue_wait']:.1f}s, "
+                       f"{limits['throughput_per_min']:.1f} calls/min")
+
+    results = st.session_state.get('batch_results', [])
+    if results:
+        reply_statuses = reply_tracker.statuses(r['event'].get('id') for r in results)
+        names = [extraction.resolve_names(r['event'], b_teacher_name, b_student_name) for r in results]
+        rows = [{
+            'Event': r['event'].get('summary', 'Appointment'),
+            'When': calendar_api.format_event_dt(r['event']),
+            'Teacher': teacher,
+            'Student': student,
+            'Student Email': batch.student_recipients(r['event']),
+            'Status': r.get('error') or 'Ready',
+            'Reply': reply_statuses.get(r['event'].get('id'), {}).get('status', ''),
+        } for r, (teacher, student) in zip(results, names)]
+        st.dataframe(rows, use_container_width=True)
+
+        for r in results:
+            if r['student_draft']:
+                with st.expander(f"{r['event'].get('summary', 'Appointment')} ({calendar_api.format_event_dt(r['event'])})"):
+                    st.text_area("Student", value=f"Subject: {r['student_draft']['subject']}\n\n{r['student_draft']['body']}", height=200, key=f"bs_{r['event'].get('id')}", disabled=True)
+                    st.text_area("Teacher", value=f"Subject: {r['teacher_draft']['subject']}\n\n{r['teacher_draft']['body']}", height=200, key=f"bt_{r['event'].get('id')}", disabled=True)
+
+        if st.button("Send All 🚀"):
+            with st.spinner("Sending emails..."):
+                batch.send_drafts(gmail_service, results, b_teacher_email, box=box)
+            sent = sum(1 for r in results if r.get('student_sent'))
+            pending = sum(1 for r in results if r.get('send_pending'))
+            failed = [r['event'].get('summary', 'Appointment') for r in results
+                      if batch.student_recipients(r['event']) and not r.get('student_sent') and not r.get('send_pending')]
+            st.success(f"Sent {sent} student emails.")
+            if pending:
+                st.info(f"{pending} still being sent in the background; see the outbox counts below.")
+            if failed:
+                st.error(f"Failed to send: {', '.join(failed)}")
+
+    box_counts = box.counts()
+    st.caption(f"Outbox: {box_counts['sent']} sent, {box_counts['queued']} queued, "
+               f"{box_counts['sending']} in flight, {box_counts['failed']} failed, "
+               f"{box_counts['unknown']} delivery unknown")
+    can_verify = outbox.can_verify(creds)
+    if not can_verify:
+        st.caption("Sends interrupted by a restart can't be checked against your mailbox without a Gmail read "
+                   "scope (REPLY_TRACKING=1 and re-authorize); they are listed as delivery unknown.")
+    if box_counts['queued'] or box_counts['sending']:
+        st.caption("Pending sends are retried in the background; resume to send the due ones now.")
+        if st.button("Resume Pending Sends"):
+            with st.spinner("Resuming..."):
+                # Younger 'sending' rows may still be in flight on the background worker
+                box.resume(gmail_service if can_verify else None, min_age=outbox.STALE_SENDING)
+                box.drain(gmail_service)
+            st.rerun()
+    if box_counts['unknown']:
+        st.warning(f"{box_counts['unknown']} email(s) were interrupted while sending and may or may not have "
+                   "gone out. Check your Sent mail, then:")
+        u_col1, u_col2 = st.columns(2)
+        if u_col1.button("They were sent"):
+            box.resolve_unknown(delivered=True)
+            st.rerun()
+        if u_col2.button("They were not sent, send again"):
+            with st.spinner("Sending..."):
+                box.resolve_unknown(delivered=False)
+                box.drain(gmail_service)
+            st.rerun()
+    if box_counts['failed']:
+        if st.button("Retry Failed Sends"):
+            with st.spinner("Retrying..."):
+                box.requeue_failed()
+                box.drain(gmail_service)
+            st.rerun()
+    st.stop()
+
 # Main Interface
 col1, col2 = st.columns([1, 1])
 
@@ -68,15 +356,17 @@ with col1:
     selected_date = st.date_input("Filter by Date", value=datetime.date.today())
     
     if st.button("Refresh Events"):
-        st.session_state.events = calendar_api.get_upcoming_events(calendar_service, start_date=selected_date)
+        sync.sync()
         # Clear drafts when refreshing
         if 'student_draft' in st.session_state:
             del st.session_state.student_draft
         if 'teacher_draft' in st.session_state:
             del st.session_state.teacher_draft
         
-    if 'events' not in st.session_state:
-        st.session_state.events = calendar_api.get_upcoming_events(calendar_service, start_date=selected_date)
+    if sync.covers(selected_date):
+        st.session_state.events = sync.get_events(selected_date)
+    else:
+        st.session_state.events = calendar_api.get_events_for_calendars(calendar_service, selected_calendars, selected_date)
         
     events = st.session_state.events
     
@@ -84,7 +374,11 @@ with col1:
         st.info("No upcoming events found.")
     else:
         # Create a selection list
-        event_options = {f"{e['summary']} ({calendar_api.format_event_dt(e)})": e for e in events}
+        reply_statuses = reply_tracker.statuses(e.get('id') for e in events)
+        event_options = {f"{e['summary']} ({calendar_api.format_event_dt(e)})"
+                         + (f" · {e['_calendar_name']}" if len(selected_calendars) > 1 else "")
+                         + (f" {REPLY_ICONS[reply_statuses[e['id']]['status']]}" if e.get('id') in reply_statuses else ""):
+                         e for e in events}
         selected_event_label = st.radio("Select an event:", list(event_options.keys()))
         selected_event = event_options[selected_event_label]
         
@@ -107,8 +401,11 @@ with col2:
     # Draft Email Section
     if 'selected_event' in st.session_state and st.session_state.selected_event:
         selected_event = st.session_state.selected_event
-        teacher_name = st.text_input("Teacher Name", value="Teacher")
-        student_name = st.text_input("Student Name", value="Student")
+        extracted = extraction.extract(selected_event)
+        teacher_name = st.text_input("Teacher Name", value=extracted['teacher'] or "Teacher",
+                                     key=f"teacher_name_{selected_event.get('id')}")
+        student_name = st.text_input("Student Name", value=extracted['student'] or "Student",
+                                     key=f"student_name_{selected_event.get('id')}")
         
         # Get attendees emails if available
         attendees = selected_event.get('attendees', [])
@@ -118,51 +415,48 @@ with col2:
         st.write("---")
         st.write("📧 **Email Settings**")
         student_email = st.text_input("Student Email (sep by comma)", value=default_emails)
-        teacher_email = st.text_input("Teacher Email", value="")
+        teacher_email = st.text_input("Teacher Email", value=extracted['teacher_email'] or "",
+                                      key=f"teacher_email_{selected_event.get('id')}")
+        
+        ai_write = st.checkbox("Let Gemini write the full emails (streams live)", value=False)
         
         if st.button("Generate Email Drafts"):
             if not gemini_api_key:
                 st.error("Please configure Gemini API Key first.")
+            elif ai_write:
+                # Pressing Cancel (or any widget) reruns the script, which closes the stream
+                st.button("Cancel")
+                # Both emails come from one structured call, streamed into two placeholders
+                placeholders = {}
+                for kind, label in (('student', 'Student'), ('teacher', 'Teacher')):
+                    st.write(f"#### {label} Email (streaming)")
+                    placeholders[kind] = st.empty()
+                try:
+                    for drafts in agent.stream_drafts(selected_event, teacher_name, student_name):
+                        for kind, placeholder in placeholders.items():
+                            placeholder.markdown(f"**Subject:** {drafts[kind]['subject']}\n\n{drafts[kind]['body']}")
+                    st.session_state.student_draft = drafts['student']
+                    st.session_state.teacher_draft = drafts['teacher']
+                except Exception as e:
+                    st.error(f"Failed to generate emails: {str(e)}")
+                    st.session_state.student_draft = {'subject': 'Error', 'body': f'Error generating email: {str(e)}'}
+                    st.session_state.teacher_draft = {'subject': 'Error', 'body': f'Error generating email: {str(e)}'}
             else:
                 with st.spinner("Generating emails..."):
-                    # Generate Student Email
                     try:
-                        student_content = agent.generate_email_content(selected_event, teacher_name, student_name)
-                        s_subject = "Appointment Confirmation"
-                        s_body = student_content
-                        if "Subject:" in student_content:
-                            parts = student_content.split("Subject:", 1)
-                            if len(parts) > 1:
-                                subject_part = parts[1].split("\n", 1)
-                                s_subject = subject_part[0].strip()
-                                if len(subject_part) > 1:
-                                    s_body = subject_part[1].strip()
-                        
-                        st.session_state.student_draft = {'subject': s_subject, 'body': s_body}
+                        fields = agent.resolve_fields(selected_event)
                     except Exception as e:
-                        st.error(f"Failed to generate student email: {str(e)}")
-                        st.session_state.student_draft = {'subject': 'Error', 'body': f'Error generating email: {str(e)}'}
-                    
-                    # Add delay to avoid rate limiting
-                    import time
-                    time.sleep(2)
-                    
-                    # Generate Teacher Email
+                        st.error(f"Failed to extract event details: {str(e)}")
+                        fields = templates.extract_fields(selected_event)
+
+                    # One pass produces both the student and teacher drafts
                     try:
-                        teacher_content = agent.generate_teacher_email_content(selected_event, teacher_name, student_name)
-                        t_subject = "Appointment Reminder"
-                        t_body = teacher_content
-                        if "Subject:" in teacher_content:
-                            parts = teacher_content.split("Subject:", 1)
-                            if len(parts) > 1:
-                                subject_part = parts[1].split("\n", 1)
-                                t_subject = subject_part[0].strip()
-                                if len(subject_part) > 1:
-                                    t_body = subject_part[1].strip()
-
-                        st.session_state.teacher_draft = {'subject': t_subject, 'body': t_body}
+                        drafts = agent.generate_drafts(selected_event, teacher_name, student_name, fields=fields)
+                        st.session_state.student_draft = drafts['student']
+                        st.session_state.teacher_draft = drafts['teacher']
                     except Exception as e:
-                        st.error(f"Failed to generate teacher email: {str(e)}")
+                        st.error(f"Failed to generate emails: {str(e)}")
+                        st.session_state.student_draft = {'subject': 'Error', 'body': f'Error generating email: {str(e)}'}
                         st.session_state.teacher_draft = {'subject': 'Error', 'body': f'Error generating email: {str(e)}'}
 
     # Display Drafts
@@ -178,16 +472,19 @@ with col2:
                 if not student_email:
                     st.error("Please enter Student Email.")
                 else:
-                    user_profile = gmail_service.users().getProfile(userId='me').execute()
-                    user_email = user_profile['emailAddress']
+                    entry, already_sent = outbox.send_now(
+                        box, gmail_service, selected_event.get('id'), student_email, 'student', s_subj_input, s_body_input)
                     
-                    msg = gmail_api.create_message(user_email, student_email, s_subj_input, s_body_input)
-                    sent_msg = gmail_api.send_message(gmail_service, 'me', msg)
-                    
-                    if sent_msg:
-                        st.success(f"Student email sent! ID: {sent_msg['id']}")
+                    if already_sent:
+                        st.info(f"Student email was already sent. ID: {entry['message_id']}")
+                    elif entry['state'] == outbox.SENT:
+                        st.success(f"Student email sent! ID: {entry['message_id']}")
+                    elif entry['state'] == outbox.SENDING:
+                        st.info("Student email is being sent in the background.")
+                    elif entry['state'] == outbox.QUEUED:
+                        st.warning(f"Student email queued for retry: {entry['last_error']}")
                     else:
-                        st.error("Failed to send student email.")
+                        st.error(f"Failed to send student email: {entry['last_error']}")
 
     with tab2:
         if 'teacher_draft' in st.session_state:
@@ -199,13 +496,16 @@ with col2:
                 if not teacher_email:
                     st.error("Please enter Teacher Email.")
                 else:
-                    user_profile = gmail_service.users().getProfile(userId='me').execute()
-                    user_email = user_profile['emailAddress']
-                    
-                    msg = gmail_api.create_message(user_email, teacher_email, t_subj_input, t_body_input)
-                    sent_msg = gmail_api.send_message(gmail_service, 'me', msg)
+                    entry, already_sent = outbox.send_now(
+                        box, gmail_service, selected_event.get('id'), teacher_email, 'teacher', t_subj_input, t_body_input)
                     
-                    if sent_msg:
-                        st.success(f"Teacher email sent! ID: {sent_msg['id']}")
+                    if already_sent:
+                        st.info(f"Teacher email was already sent. ID: {entry['message_id']}")
+                    elif entry['state'] == outbox.SENT:
+                        st.success(f"Teacher email sent! ID: {entry['message_id']}")
+                    elif entry['state'] == outbox.SENDING:
+                        st.info("Teacher email is being sent in the background.")
+                    elif entry['state'] == outbox.QUEUED:
+                        st.warning(f"Teacher email queued for retry: {entry['last_error']}")
                     else:
-                        st.error("Failed to send teacher email.")
+                        st.error(f"Failed to send teacher email: {entry['last_error']}")
@@ -0,0 +1,253 @@
+"""
+Asyncio core for the batch pipeline.
+
+Calendar and Gmail calls go through googleapiclient, which only has a
+blocking .execute(); they run in worker threads (safe with the per-thread
+HTTP connections in services) under one semaphore per API. Gemini calls
+use the SDK's generate_content_async under the shared rate limiter.
+
+run_pipeline overlaps the stages: drafts are generated as each page of
+events arrives, and finished drafts are sent in small batches while the
+rest are still being generated.
+
+Everything runs on one long-lived event loop in a background thread (the
+Gemini async client is bound to the loop it was first used on). Sync
+callers use run_sync(), which also delivers on_progress callbacks on the
+calling thread so Streamlit widgets can be updated from them.
+"""
+import asyncio
+import os
+import queue
+import threading
+import weakref
+
+import agent
+import batch
+import calendar_api
+import event_view
+import extraction
+import gmail_api
+import metrics
+import outbox
+
+CONCURRENCY = {
+    'calendar': int(os.environ.get('CALENDAR_CONCURRENCY', 4)),
+    'gmail': int(os.environ.get('GMAIL_CONCURRENCY', 2)),
+}
+
+_semaphores = weakref.WeakKeyDictionary()
+_loop = None
+_loop_thread = None
+_loop_lock = threading.Lock()
+
+
+def get_semaphore(api):
+    """The semaphore shared by every call to `api` on the running loop."""
+    loop = asyncio.get_running_loop()
+    semaphores = _semaphores.setdefault(loop, {})
+    if api not in semaphores:
+        semaphores[api] = asyncio.Semaphore(CONCURRENCY[api])
+    return semaphores[api]
+
+
+async def execute(request, api, stage=None, **labels):
+    """Awaits a googleapiclient request without blocking the loop; timed as `stage` if given."""
+    async with get_semaphore(api):
+        if stage is None:
+            return await asyncio.to_thread(request.execute)
+        with metrics.span(stage, **labels):
+            return await asyncio.to_thread(request.execute)
+
+
+async def iter_event_pages(service, start_date, end_date=None, calendar_id='primary'):
+    """Yields the events for start_date..end_date one result page at a time."""
+    time_min, time_max = calendar_api.day_bounds(start_date, end_date)
+    params = {'calendarId': calendar_id, 'timeMin': time_min, 'timeMax': time_max,
+              'singleEvents': True, 'orderBy': 'startTime'}
+    while True:
+        result = await execute(service.events().list(**params), 'calendar', 'calendar.events.list',
+                               calendar=calendar_id)
+        yield result.get('items', [])
+        page_token = result.get('nextPageToken')
+        if not page_token:
+            return
+        params['pageToken'] = page_token
+
+
+async def fetch_events(service, start_date, end_date=None, calendar_id='primary'):
+    events = []
+    async for page in iter_event_pages(service, start_date, end_date, calendar_id):
+        events.extend(page)
+    return events
+
+
+async def fetch_calendars(service, calendars, start_date, end_date=None):
+    """Async calendar_api.get_events_for_calendars: all calendars at once, merged by start time."""
+    async def _one(calendar):
+        try:
+            events = await fetch_events(service, start_date, end_date, calendar['id'])
+        except Exception as e:
+            print(f"Could not read calendar {calendar_api.calendar_name(calendar)}: {e}")
+            return []
+        return [calendar_api.tag_event(event, calendar) for event in events]
+
+    return calendar_api.merge_events(await asyncio.gather(*(_one(calendar) for calendar in calendars)))
+
+
+async def generate_event_drafts(event, teacher_name="Teacher", student_name="Student"):
+    """Async batch.generate_event_drafts: same result dict, errors captured in 'error'."""
+    result = {'event': event, 'student_draft': None, 'teacher_draft': None, 'error': None}
+    try:
+        with metrics.span('draft.generate'):
+            drafts = await agent.generate_drafts_async(event, *extraction.resolve_names(event, teacher_name,
+                                                                                        student_name))
+        result['student_draft'] = drafts['student']
+        result['teacher_draft'] = drafts['teacher']
+    except Exception as e:
+        result['error'] = str(e)
+    return result
+
+
+async def generate_all(events, teacher_name="Teacher", student_name="Student", max_concurrency=4,
+                       on_progress=None):
+    """Generates drafts for all events, at most max_concurrency at a time. Results keep the event order."""
+    limit = asyncio.Semaphore(max(1, max_concurrency))
+    done = 0
+
+    async def _one(event):
+        nonlocal done
+        async with limit:
+            result = await generate_event_drafts(event, teacher_name, student_name)
+        done += 1
+        if on_progress:
+            on_progress(done, len(events), result)
+        return result
+
+    return list(await asyncio.gather(*(_one(event) for event in events)))
+
+
+async def send_results(gmail_service, results, teacher_email="", box=None):
+    """batch.send_drafts in a worker thread, under the Gmail semaphore."""
+    async with get_semaphore('gmail'):
+        return await asyncio.to_thread(batch.send_drafts, gmail_service, results, teacher_email, None, box)
+
+
+async def run_pipeline(calendar_service, gmail_service, start_date, end_date=None, teacher_name="Teacher",
+                       student_name="Student", teacher_email="", max_concurrency=4, send=False,
+                       on_progress=None, box=None, send_batch_size=gmail_api.BATCH_SIZE, calendars=None):
+    """
+    Fetches, generates and (optionally) sends with the stages overlapping.
+    calendars (calendarList entries) are read concurrently; default is the
+    primary calendar. on_progress(done, total, result) reports generated
+    drafts; total is the number of events fetched so far. Results are
+    sorted by start time.
+    """
+    with metrics.span('pipeline.run', send=send) as attributes:
+        results = []
+        seen = set()
+        limit = asyncio.Semaphore(max(1, max_concurrency))
+        to_send = asyncio.Queue()
+        done = 0
+
+        async def _generate(index, event):
+            nonlocal done
+            async with limit:
+                result = await generate_event_drafts(event, teacher_name, student_name)
+            results[index] = result
+            done += 1
+            if on_progress:
+                on_progress(done, len(results), result)
+            if send and not result['error']:
+                await to_send.put(result)
+
+        async def _produce(calendar):
+            try:
+                async for page in iter_event_pages(calendar_service, start_date, end_date, calendar['id']):
+                    for event in page:
+                        if calendars:
+                            calendar_api.tag_event(event, calendar)
+                        # The same session can be on several calendars; generate it once
+                        key = (event.get('iCalUID') or event.get('id'), str(event['start']))
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                        results.append(None)
+                        tasks.append(asyncio.create_task(_generate(len(results) - 1, event)))
+            except Exception as e:
+                if not calendars:
+                    raise
+                print(f"Could not read calendar {calendar_api.calendar_name(calendar)}: {e}")
+
+        async def _sender():
+            box_ = box or outbox.get_outbox()
+            finished = False
+            while not finished:
+                pending = [await to_send.get()]
+                # Take whatever else is ready so each round trip carries a full batch
+                while len(pending) < send_batch_size and not to_send.empty():
+                    pending.append(to_send.get_nowait())
+                if pending[-1] is None:
+                    pending.pop()
+                    finished = True
+                if pending:
+                    await send_results(gmail_service, pending, teacher_email, box_)
+
+        sender = asyncio.create_task(_sender()) if send else None
+        tasks = []
+        try:
+            sources = calendars or [{'id': 'primary', 'primary': True}]
+            # Teacher calendars first, so a session also on the primary calendar keeps its teacher name
+            await asyncio.gather(*(_produce(calendar) for calendar in sources if not calendar.get('primary')))
+            await asyncio.gather(*(_produce(calendar) for calendar in sources if calendar.get('primary')))
+            await asyncio.gather(*tasks)
+            if sender:
+                await to_send.put(None)
+                await sender
+        except BaseException:
+            for task in tasks + ([sender] if sender else []):
+                task.cancel()
+            raise
+        results.sort(key=lambda r: event_view.get_view(r['event']).start_ts)
+        attributes['events'] = len(results)
+        return results
+
+
+def get_loop():
+    """The shared event loop, started in a daemon thread on first use."""
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name='async-core', daemon=True)
+            _loop_thread.start()
+        return _loop
+
+
+_DONE = object()
+
+
+def run_sync(coro_fn, *args, on_progress=None, **kwargs):
+    """
+    Runs coro_fn(*args, **kwargs) on the shared loop and waits for it.
+    If on_progress is given it is passed to coro_fn, and its calls are
+    replayed on the calling thread.
+    """
+    loop = get_loop()
+    if threading.current_thread() is _loop_thread:
+        raise RuntimeError("run_sync cannot be called from the async core's own loop")
+    calls = queue.Queue()
+    if on_progress:
+        kwargs['on_progress'] = lambda *a: calls.put(a)
+    future = asyncio.run_coroutine_threadsafe(coro_fn(*args, **kwargs), loop)
+    future.add_done_callback(lambda _: calls.put(_DONE))
+    try:
+        while True:
+            item = calls.get()
+            if item is _DONE:
+                break
+            on_progress(*item)
+    except BaseException:
+        # e.g. Streamlit stopping the script from inside a callback
+        future.cancel()
+        raise
+    return future.result()
@@ -1,22 +1,99 @@
-import os.path
-import streamlit as st
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
 import json
+import os.path
+import threading
+import time
+import credential_manager
 
 # If modifying these scopes, delete the file token.json.
 SCOPES = [
     'https://www.googleapis.com/auth/calendar.readonly',
     'https://www.googleapis.com/auth/gmail.compose'
 ]
+# Reading replies to sent confirmations (replies.py) is opt-in, so tokens
+# granted without gmail.readonly keep working; turning it on needs a new token.
+GMAIL_READONLY_SCOPE = 'https://www.googleapis.com/auth/gmail.readonly'
+REPLY_TRACKING = os.environ.get('REPLY_TRACKING', '0') == '1'
+if REPLY_TRACKING:
+    SCOPES.append(GMAIL_READONLY_SCOPE)
+
+def has_granted(creds, scope):
+    """True if the token was issued for scope (not just asked for it)."""
+    # granted_scopes is what the token was issued for; scopes is only what was asked for
+    granted = getattr(creds, 'granted_scopes', None)
+    if granted is not None:
+        return scope in granted
+    return creds.has_scopes([scope])
+
+_manager = None
+_manager_lock = threading.Lock()
+
+# Web logins in progress (multi-user mode), {state: (code_verifier, started)}
+PENDING_TTL = 600
+_pending = {}
+_pending_lock = threading.Lock()
+
+def get_credential_manager():
+    """The process-wide CredentialManager, or None before the first login."""
+    return _manager
 
 def get_credentials():
+    """Gets valid user credentials.
+
+    Credentials are loaded once per process; afterwards they come from the
+    shared CredentialManager, which refreshes them in the background.
+
+    Returns:
+        Credentials, the obtained credential.
+    """
+    global _manager
+    if _manager is not None:
+        creds = _manager.get()
+        if creds is not None:
+            return creds
+
+    with _manager_lock:
+        # Another session may have finished loading while we waited
+        if _manager is not None:
+            creds = _manager.get()
+            if creds is not None:
+                return creds
+        creds = _load_credentials()
+        if creds:
+            _manager = credential_manager.CredentialManager(
+                creds, token_path='token.json' if os.path.exists('token.json') else None)
+            _manager.start()
+        return creds
+
+def load_token_credentials(token_path='token.json'):
+    """Loads credentials from a token file without Streamlit or a browser.
+
+    Expired tokens are refreshed and written back.
+
+    Returns:
+        Credentials, or None if the file is missing or cannot be refreshed.
+    """
+    if not os.path.exists(token_path):
+        return None
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    creds = Credentials.from_authorized_user_file(token_path, SCOPES)
+    if not creds.valid and creds.expired and creds.refresh_token:
+        creds.refresh(Request())
+        credential_manager.write_token_atomically(token_path, creds)
+    return creds if creds.valid else None
+
+def _load_credentials():
     """Gets valid user credentials from storage.
 
     Returns:
         Credentials, the obtained credential.
     """
+    # Imported here so that importing this module stays cheap and headless
+    # callers never load Streamlit or the OAuth flow
+    import streamlit as st
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+
     creds = None
     # The file token.json stores the user's access and refresh tokens, and is
     # created automatically when the authorization flow completes for the first
@@ -51,55 +128,106 @@ def get_credentials():
                 creds = None
         
         if not creds:
-            try:
-                # Check for secrets first (Cloud Deployment)
-                if 'google' in st.secrets:
-                    client_config = {
-                        "web": {
-                            "client_id": st.secrets["google"]["client_id"],
-                            "client_secret": st.secrets["google"]["client_secret"],
-                            "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                            "token_uri": "https://oauth2.googleapis.com/token",
-                            "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-                            "redirect_uris": [st.secrets["google"].get("redirect_uri", "http://localhost:8501")]
-                        }
-                    }
-                    flow = InstalledAppFlow.from_client_config(client_config, SCOPES)
-                    
-                # Fallback to local file
-                elif os.path.exists('credentials.json'):
-                    flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
-                    
-                else:
-                    st.error("Error: Authentication credentials found (neither in secrets nor 'credentials.json').")
-                    return None
-
-                # For cloud deployment, we cannot launch a local server browser.
-                # If running locally, run_local_server works.
-                # If running in cloud, we might need a different flow, but run_local_server fails in cloud without a display.
-                # HOWEVER, for this specific user request, they are likely just deploying.
-                # Streamlit Cloud usually requires 'from_client_config' but still needs a way to auth.
-                # Standard 'InstalledAppFlow' opens a local browser. This DOES NOT WORK in Streamlit Cloud.
-                # We need to use 'flow.authorization_url()' and manual copy-paste or similar if not identical to local behavior.
-                # But for now, let's keep it simple as a first step or use the existing flow if they run locally.
-                
-                # IMPORTANT: InstalledAppFlow.run_local_server DOES NOT work on Streamlit Cloud.
-                # We need to stick to the current logic for local, but merely enable loading config from secrets.
-                # The user will probably authorize LOCALLY and push token.json (not recommended but easiest) OR
-                # we need a full web-based auth flow which is complex.
-                # GIVEN the context, the user is likely running this as a personal app.
-                # The EASIEST path for Streamlit Cloud with personal Google Creds is to upload 'token.json' to the repo (private repo).
-                # Wait, the user has 'token.json' in .gitignore.
-                
-                # Let's stick to enabling config source for now.
-                creds = flow.run_local_server(port=0)
-                
+            creds = authorize()
+            if creds:
                 # Save the credentials for the next run
-                with open('token.json', 'w') as token:
-                    token.write(creds.to_json())
-                    
-            except Exception as e:
-                st.error(f"Authentication failed: {e}")
-                return None
+                credential_manager.write_token_atomically('token.json', creds)
                 
     return creds
+
+
+def _client_config():
+    """OAuth client from secrets (Cloud Deployment) or credentials.json, or None."""
+    import streamlit as st
+
+    if 'google' in st.secrets:
+        return {
+            "web": {
+                "client_id": st.secrets["google"]["client_id"],
+                "client_secret": st.secrets["google"]["client_secret"],
+                "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+                "token_uri": "https://oauth2.googleapis.com/token",
+                "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
+                "redirect_uris": [redirect_uri()]
+            }
+        }
+    if os.path.exists('credentials.json'):
+        with open('credentials.json') as f:
+            return json.load(f)
+    return None
+
+
+def redirect_uri():
+    """Where Google sends the browser back to: OAUTH_REDIRECT_URI, secrets google.redirect_uri or localhost."""
+    import streamlit as st
+
+    if os.environ.get('OAUTH_REDIRECT_URI'):
+        return os.environ['OAUTH_REDIRECT_URI']
+    if 'google' in st.secrets and st.secrets['google'].get('redirect_uri'):
+        return st.secrets['google']['redirect_uri']
+    return "http://localhost:8501"
+
+
+def authorize():
+    """Runs the OAuth flow with the client from secrets or credentials.json.
+
+    Opens a browser on this machine, so it is only for the single-user app
+    run locally; multi-user mode uses authorization_url/finish_authorization.
+    Nothing is written to disk; the caller decides where the token goes.
+
+    Returns:
+        Credentials, or None if the flow could not run.
+    """
+    import streamlit as st
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
+    try:
+        client_config = _client_config()
+        if client_config is None:
+            st.error("Error: Authentication credentials found (neither in secrets nor 'credentials.json').")
+            return None
+        flow = InstalledAppFlow.from_client_config(client_config, SCOPES)
+        return flow.run_local_server(port=0)
+
+    except Exception as e:
+        st.error(f"Authentication failed: {e}")
+        return None
+
+
+def _web_flow(state=None, code_verifier=None):
+    from google_auth_oauthlib.flow import Flow
+
+    client_config = _client_config()
+    if client_config is None:
+        raise RuntimeError("No OAuth client (neither in secrets nor 'credentials.json')")
+    return Flow.from_client_config(client_config, SCOPES, state=state, code_verifier=code_verifier,
+                                   redirect_uri=redirect_uri())
+
+
+def authorization_url():
+    """
+    Starts a web OAuth flow for the user of this browser: returns the Google
+    URL to send them to. Google redirects back to redirect_uri() with ?code
+    and ?state, which finish_authorization exchanges for credentials.
+    """
+    flow = _web_flow()
+    # prompt=consent so Google returns a refresh token on every login
+    url, state = flow.authorization_url(access_type='offline', prompt='consent', include_granted_scopes='true')
+    now = time.time()
+    with _pending_lock:
+        # The redirect arrives in a new Streamlit session, so the flow is kept here by state
+        for key in [key for key, (_, started) in _pending.items() if now - started > PENDING_TTL]:
+            del _pending[key]
+        _pending[state] = (getattr(flow, 'code_verifier', None), now)
+    return url
+
+
+def finish_authorization(code, state):
+    """Credentials for a redirect from authorization_url; raises on an unknown or expired state."""
+    with _pending_lock:
+        code_verifier, started = _pending.pop(state, (None, None))
+    if started is None or time.time() - started > PENDING_TTL:
+        raise RuntimeError("Login expired or was not started here; please sign in again")
+    flow = _web_flow(state=state, code_verifier=code_verifier)
+    flow.fetch_token(code=code)
+    return flow.credentials
@@ -0,0 +1,115 @@
+"""
+Batch confirmation pipeline: generate and send drafts for every event in a
+date range. Has no Streamlit dependency so it can also run headless.
+
+generate_drafts and run_batch are sync wrappers around async_core.
+"""
+import agent
+import async_core
+import event_view
+import extraction
+import outbox
+import rate_limiter
+
+
+def student_recipients(event):
+    """Comma separated attendee emails, as the single-event form defaults to."""
+    return ", ".join(event_view.get_view(event).attendees)
+
+
+def generate_event_drafts(event, teacher_name="Teacher", student_name="Student"):
+    """
+    Generates student and teacher drafts for one event. Names found in the
+    event (its calendar, description, summary or the roster) win over
+    teacher_name and student_name.
+    """
+    result = {'event': event, 'student_draft': None, 'teacher_draft': None, 'error': None}
+    try:
+        drafts = agent.generate_drafts(event, *extraction.resolve_names(event, teacher_name, student_name))
+        result['student_draft'] = drafts['student']
+        result['teacher_draft'] = drafts['teacher']
+    except Exception as e:
+        result['error'] = str(e)
+    return result
+
+
+def generate_drafts(events, teacher_name="Teacher", student_name="Student", max_workers=4, rpm=None, on_progress=None):
+    """
+    Generates drafts for all events concurrently.
+    on_progress(done, total, result) is called as each event finishes.
+    Results are returned in the same order as events.
+    rpm, if given, replaces the shared Gemini rate limit for the model
+    (0 = no requests-per-minute limit).
+    """
+    _configure_rpm(rpm)
+    return async_core.run_sync(async_core.generate_all, events, teacher_name, student_name,
+                               max_concurrency=max_workers, on_progress=on_progress)
+
+
+def _configure_rpm(rpm):
+    """None keeps the current limit; 0 removes the requests-per-minute bucket."""
+    limiter = rate_limiter.get_limiter(agent.MODEL_NAME)
+    if rpm is not None and (limiter.rpm or 0) != rpm:
+        rate_limiter.configure(agent.MODEL_NAME, rpm=rpm, tpm=limiter.tpm,
+                               max_concurrency=limiter.concurrency.max_limit)
+
+
+def record_send(result, field, entry):
+    """
+    Sets result[field] to the message id once sent. A message still in
+    flight (claimed by the background worker) is 'send_pending', not an
+    error; anything else records 'send_error'.
+    """
+    result[field] = entry['message_id'] if entry['state'] == outbox.SENT else None
+    if entry['state'] == outbox.SENDING:
+        result['send_pending'] = True
+    elif entry['state'] != outbox.SENT:
+        result['send_error'] = entry['last_error']
+
+
+def send_drafts(gmail_service, results, teacher_email="", on_progress=None, box=None):
+    """
+    Queues the student and teacher drafts for each generated result in the
+    durable outbox and drains it. Drafts already sent for the same event and
+    recipient are not sent again.
+    Adds 'student_sent'/'teacher_sent' (message id or None) to each result.
+    """
+    box = box or outbox.get_outbox()
+    to_send = [r for r in results if not r.get('error') and r.get('student_draft')]
+    targets = []
+    for result in to_send:
+        result['student_sent'] = None
+        result['teacher_sent'] = None
+        event_id = result['event'].get('id')
+        student_email = student_recipients(result['event'])
+        if student_email:
+            draft = result['student_draft']
+            key = box.enqueue(event_id, student_email, 'student', draft['subject'], draft['body'])
+            targets.append((result, 'student_sent', key))
+        if teacher_email:
+            draft = result['teacher_draft']
+            key = box.enqueue(event_id, teacher_email, 'teacher', draft['subject'], draft['body'])
+            targets.append((result, 'teacher_sent', key))
+
+    box.drain(gmail_service)
+    entries = box.settle([key for _, _, key in targets])
+    for result, field, key in targets:
+        record_send(result, field, entries[key])
+    if on_progress:
+        for done, result in enumerate(to_send, 1):
+            on_progress(done, len(to_send), result)
+    return results
+
+
+def run_batch(calendar_service, gmail_service, start_date, end_date=None, teacher_name="Teacher",
+              student_name="Student", teacher_email="", max_workers=4, rpm=None, send=False, on_progress=None,
+              calendars=None):
+    """
+    Fetches the events for a date range, generates drafts and optionally
+    sends them, with fetching, generation and sending overlapped.
+    calendars: calendarList entries to read (default: the primary calendar).
+    """
+    _configure_rpm(rpm)
+    return async_core.run_sync(async_core.run_pipeline, calendar_service, gmail_service, start_date, end_date,
+                               teacher_name, student_name, teacher_email, max_concurrency=max_workers, send=send,
+                               on_progress=on_progress, calendars=calendars)
@@ -0,0 +1,114 @@
+"""
+End-to-end batch time with simulated network latency: fetch, generate and
+send run back to back (the old synchronous path) vs. the asyncio pipeline
+in async_core, where the stages overlap.
+
+Events are missing their Subject line so every draft needs one Gemini
+call (FakeModel). Calendar pages and Gmail batch sends sleep for their
+configured latency.
+
+Usage: python bench_async_pipeline.py [--events 60] [--page-size 10] [--calendar-latency 0.2]
+       [--gemini-latency 0.5] [--gmail-latency 0.3] [--workers 4]
+"""
+import argparse
+import datetime
+import json
+import tempfile
+import time
+
+import agent
+import async_core
+import batch
+import calendar_api
+import draft_cache
+import fakes
+import outbox
+import rate_limiter
+
+
+def make_events(count, day):
+    events = []
+    for i in range(count):
+        start = datetime.datetime.combine(day, datetime.time(8)) + datetime.timedelta(minutes=10 * i)
+        events.append({
+            'id': f'evt{i}',
+            'summary': f'Session {i}',
+            'description': 'Type: Online',
+            'start': {'dateTime': start.isoformat() + '-04:00'},
+            'end': {'dateTime': (start + datetime.timedelta(minutes=50)).isoformat() + '-04:00'},
+            'attendees': [{'email': f'student{i}@example.com'}],
+        })
+    return events
+
+
+def setup(args, events):
+    calendar = fakes.FakeCalendarService(events, page_size=args.page_size, latency=args.calendar_latency)
+    gmail = fakes.FakeGmailService(latency=args.gmail_latency)
+    model = fakes.FakeModel(model_name=agent.MODEL_NAME, latency=args.gemini_latency,
+                            reply=json.dumps({'type': 'Online', 'subject': 'Math'}))
+    agent.get_model = lambda *a, **k: model
+    rate_limiter.configure(agent.MODEL_NAME, rpm=None, tpm=None, max_concurrency=args.workers)
+    box = outbox.Outbox(tempfile.mktemp(suffix='.sqlite3'))
+    return calendar, gmail, box
+
+
+def run_sequential(args, events, day):
+    """Old path: blocking fetch, one draft at a time, then one send."""
+    calendar, gmail, box = setup(args, events)
+    start = time.perf_counter()
+    fetched = calendar_api.get_upcoming_events(calendar, start_date=day)
+    results = [batch.generate_event_drafts(event) for event in fetched]
+    batch.send_drafts(gmail, results, box=box)
+    return time.perf_counter() - start, results, gmail
+
+
+def run_stages(args, events, day):
+    """Async calls, but each stage waits for the previous one to finish."""
+    calendar, gmail, box = setup(args, events)
+
+    async def _stages():
+        fetched = await async_core.fetch_events(calendar, day)
+        results = await async_core.generate_all(fetched, max_concurrency=args.workers)
+        await async_core.send_results(gmail, results, box=box)
+        return results
+
+    start = time.perf_counter()
+    results = async_core.run_sync(_stages)
+    return time.perf_counter() - start, results, gmail
+
+
+def run_pipelined(args, events, day):
+    calendar, gmail, box = setup(args, events)
+    start = time.perf_counter()
+    results = async_core.run_sync(async_core.run_pipeline, calendar, gmail, day, max_concurrency=args.workers,
+                                  send=True, box=box)
+    return time.perf_counter() - start, results, gmail
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=60)
+    parser.add_argument('--page-size', type=int, default=10)
+    parser.add_argument('--calendar-latency', type=float, default=0.2)
+    parser.add_argument('--gemini-latency', type=float, default=0.5)
+    parser.add_argument('--gmail-latency', type=float, default=0.3)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--skip-sequential', action='store_true', help='The sequential run is slow with many events')
+    args = parser.parse_args()
+
+    draft_cache.ENABLED = False
+    day = datetime.date.today() + datetime.timedelta(days=1)
+    events = make_events(args.events, day)
+
+    runs = [('Stages back to back (async)', run_stages), ('Pipelined (async)', run_pipelined)]
+    if not args.skip_sequential:
+        runs.insert(0, ('Sequential (old sync path)', run_sequential))
+    for label, fn in runs:
+        elapsed, results, gmail = fn(args, events, day)
+        errors = sum(1 for r in results if r['error'])
+        print(f"{label:<28} {elapsed:7.2f} s  drafts={len(results) - errors} errors={errors} "
+              f"sent={len(gmail.sent)} gmail_round_trips={gmail.round_trips}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Fetching one day from many teacher calendars: one calendar after another
+vs. the concurrent fan-out (threads and asyncio), plus a MultiCalendarSync
+refresh where only one calendar changed.
+
+Every teacher calendar has --events sessions; the first session of each is
+also on the primary calendar, to check the merged stream keeps it once and
+with the teacher's name.
+
+Usage: python bench_calendar_fanout.py [--calendars 8] [--events 12] [--page-size 5] [--latency 0.15]
+"""
+import argparse
+import datetime
+import time
+
+import async_core
+import calendar_api
+import calendar_sync
+import fakes
+
+
+def build_service(args, day):
+    calendars = [{'id': 'primary', 'summary': 'center@example.com', 'primary': True, 'accessRole': 'owner'}]
+    calendars += [{'id': f'teacher{t}@group.calendar.google.com', 'summary': f'Teacher {t}', 'accessRole': 'owner'}
+                  for t in range(args.calendars)]
+    calendars.append({'id': 'en.usa#holiday@group.v.calendar.google.com', 'summary': 'Holidays', 'accessRole': 'reader'})
+    service = fakes.FakeCalendarService(page_size=args.page_size, latency=args.latency, calendars=calendars)
+    for t in range(args.calendars):
+        for i in range(args.events):
+            start = datetime.datetime.combine(day, datetime.time(9)) + datetime.timedelta(minutes=30 * i + t)
+            event = {
+                'id': f't{t}e{i}', 'iCalUID': f't{t}e{i}@example.com', 'summary': f'Session {t}-{i}',
+                'start': {'dateTime': start.isoformat() + '-04:00'},
+                'end': {'dateTime': (start + datetime.timedelta(minutes=50)).isoformat() + '-04:00'},
+            }
+            service.put_event(event, f'teacher{t}@group.calendar.google.com')
+            if i == 0:
+                service.put_event(event, 'primary')
+    return service
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calendars', type=int, default=8)
+    parser.add_argument('--events', type=int, default=12)
+    parser.add_argument('--page-size', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.15)
+    args = parser.parse_args()
+
+    day = datetime.date.today() + datetime.timedelta(days=1)
+    service = build_service(args, day)
+    calendars = calendar_api.list_calendars(service)
+    expected = args.calendars * args.events
+    print(f"{len(calendars)} calendars listed (holiday feed skipped), {expected} distinct sessions")
+
+    start = time.perf_counter()
+    sequential = []
+    for calendar in calendars:
+        events = calendar_api.get_upcoming_events(service, start_date=day, calendar_id=calendar['id'])
+        sequential.extend(calendar_api.tag_event(e, calendar) for e in events)
+    print(f"One calendar at a time: {time.perf_counter() - start:.2f}s, {len(sequential)} events (with duplicates)")
+
+    start = time.perf_counter()
+    merged = calendar_api.get_events_for_calendars(service, calendars, day)
+    print(f"Thread fan-out:         {time.perf_counter() - start:.2f}s, {len(merged)} events")
+
+    start = time.perf_counter()
+    merged_async = async_core.run_sync(async_core.fetch_calendars, service, calendars, day)
+    print(f"Async fan-out:          {time.perf_counter() - start:.2f}s, {len(merged_async)} events")
+
+    starts = [calendar_api.parse_event_time(e['start'])[0] for e in merged]
+    assert starts == sorted(starts), "merged stream is not time-sorted"
+    assert len(merged) == expected, "duplicates were not removed"
+    assert all(e['_teacher_name'] for e in merged), "a session lost its teacher name"
+
+    sync = calendar_sync.MultiCalendarSync(service, calendars, time_min=day)
+    start = time.perf_counter()
+    sync.sync()
+    print(f"MultiCalendarSync first sync: {time.perf_counter() - start:.2f}s")
+    service.update_event('t0e1', 'teacher0@group.calendar.google.com', summary='Session 0-1 (moved)')
+    calls = service.list_calls
+    start = time.perf_counter()
+    sync.sync()
+    print(f"MultiCalendarSync refresh:    {time.perf_counter() - start:.2f}s, "
+          f"{service.list_calls - calls} list calls, {len(sync.get_events(day))} events")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Full sync vs. syncToken delta refreshes against the fake Calendar service.
+
+Usage: python bench_calendar_sync.py [--events 500] [--page-size 250] [--latency 0.1]
+"""
+import argparse
+import time
+
+import calendar_sync
+import fakes
+
+
+def _make_events(n):
+    events = []
+    for i in range(n):
+        day = 1 + (i // 40) % 28
+        hour = 9 + i % 10
+        events.append({
+            'id': f"evt{i}",
+            'summary': f"Session {i}",
+            'start': {'dateTime': f"2025-12-{day:02d}T{hour:02d}:00:00-05:00"},
+            'end': {'dateTime': f"2025-12-{day:02d}T{hour:02d}:50:00-05:00"},
+        })
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=500)
+    parser.add_argument('--page-size', type=int, default=250)
+    parser.add_argument('--latency', type=float, default=0.1, help='Simulated latency per list call (s)')
+    args = parser.parse_args()
+
+    service = fakes.FakeCalendarService(_make_events(args.events), page_size=args.page_size, latency=args.latency)
+    sync = calendar_sync.CalendarSync(service)
+
+    start = time.perf_counter()
+    summary = sync.sync()
+    full_time = time.perf_counter() - start
+    full_calls = service.list_calls
+    print(f"Full sync: {summary['changed']} events, {full_calls} list calls, {full_time:.3f}s")
+
+    service.update_event('evt3', summary='Session 3 (moved)')
+    service.cancel_event('evt4')
+    start = time.perf_counter()
+    summary = sync.sync()
+    delta_time = time.perf_counter() - start
+    print(f"Delta sync: {summary['changed']} changed, {summary['removed']} removed, "
+          f"{service.list_calls - full_calls} list calls, {delta_time:.3f}s")
+    assert sync.store.get('evt3')['summary'] == 'Session 3 (moved)' and sync.store.get('evt4') is None
+
+    service.expire_sync_tokens()
+    summary = sync.sync()
+    print(f"After token expiry: full={summary['full']}, {sync.store.count()} events")
+
+
+if __name__ == '__main__':
+    main()
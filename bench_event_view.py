@@ -0,0 +1,97 @@
+"""
+Rendering a 500-event list (radio labels plus student/teacher dates and
+time ranges) on every Streamlit rerun: parsing the start/end strings each
+time, as format_event_dt / format_date_time used to, vs. cached EventViews.
+
+Each rerun works on fresh dict copies of the events, like a rerun reading
+them back from the event store.
+
+Usage: python bench_event_view.py [--events 500] [--reruns 20]
+"""
+import argparse
+import datetime
+import json
+import time
+
+import calendar_api
+import event_view
+import templates
+
+
+def make_events(count):
+    day = datetime.date.today()
+    events = []
+    for i in range(count):
+        start = datetime.datetime.combine(day, datetime.time(8)) + datetime.timedelta(minutes=15 * i)
+        if i % 50 == 0:
+            start_value, end_value = {'date': start.date().isoformat()}, {'date': start.date().isoformat()}
+        else:
+            start_value = {'dateTime': start.isoformat() + '-04:00'}
+            end_value = {'dateTime': (start + datetime.timedelta(minutes=50)).isoformat() + '-04:00'}
+        events.append({'id': f'evt{i}', 'updated': f'2025-01-01T00:00:{i % 60:02d}Z', 'summary': f'Session {i}',
+                       'start': start_value, 'end': end_value, 'attendees': [{'email': f's{i}@example.com'}]})
+    return events
+
+
+def _legacy_short_time(dt):
+    value = dt.strftime('%I:%M%p').lower()
+    return value[1:] if value.startswith('0') else value
+
+
+def legacy_render(event):
+    """The per-call parsing the old format_event_dt + format_date_time did."""
+    start = event['start'].get('dateTime', event['start'].get('date'))
+    end = event['end'].get('dateTime', event['end'].get('date'))
+    if 'T' not in start:
+        return f"{start} (All Day)", start, start, "All Day"
+    dt_start = datetime.datetime.fromisoformat(start)
+    dt_end = datetime.datetime.fromisoformat(end)
+    label = f"{dt_start.strftime('%I:%M%p')} - {dt_end.strftime('%I:%M%p')}"
+    student = datetime.datetime.fromisoformat(start).strftime(templates.STUDENT_DATE_FORMAT)
+    teacher = datetime.datetime.fromisoformat(start).strftime(templates.TEACHER_DATE_FORMAT)
+    time_range = f"{_legacy_short_time(dt_start)} - {_legacy_short_time(dt_end)}"
+    return label, student, teacher, time_range
+
+
+def view_render(event):
+    view = event_view.get_view(event)
+    return (view.display, view.date(templates.STUDENT_DATE_FORMAT), view.date(templates.TEACHER_DATE_FORMAT),
+            view.time_range)
+
+
+def run(render, events, reruns):
+    stored = json.dumps(events)
+    timings = []
+    for _ in range(reruns):
+        batch = json.loads(stored)
+        start = time.perf_counter()
+        for event in batch:
+            render(event)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=500)
+    parser.add_argument('--reruns', type=int, default=20)
+    args = parser.parse_args()
+
+    events = make_events(args.events)
+    calendar_api.business_timezone()  # load pytz outside the timings
+
+    legacy = run(legacy_render, events, args.reruns)
+    print(f"Parse every rerun: {sum(legacy) / len(legacy) * 1000:.2f} ms per rerun")
+
+    event_view.clear()
+    views = run(view_render, events, args.reruns)
+    steady = views[1:] or views
+    print(f"EventView: first rerun {views[0] * 1000:.2f} ms (builds views), "
+          f"then {sum(steady) / len(steady) * 1000:.2f} ms per rerun")
+
+    mismatches = sum(1 for e in events if legacy_render(e)[1:] != view_render(e)[1:])
+    print(f"Student/teacher date and time range mismatches vs. the old output: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
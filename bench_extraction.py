@@ -0,0 +1,92 @@
+"""
+How much of a day's events the local extraction fills in: Type/Subject
+(each miss is a Gemini call in agent.resolve_fields) and student/teacher
+names (each miss is a name someone has to type), for description lines
+only (templates.extract_fields, the old path) vs. extraction.extract with
+the roster. Also times a first pass and a memoized rerun.
+
+Usage: python bench_extraction.py [--events 500] [--roster 60] [--reruns 10]
+"""
+import argparse
+import datetime
+import random
+import time
+
+import extraction
+import templates
+
+SUBJECTS = ['SAT Math', 'AP Chemistry', 'Algebra 2', 'English Essay', 'ACT Reading', 'Physics']
+
+
+def make_roster(count):
+    teachers = [{'name': f'Teacher{t} Lee', 'email': f'teacher{t}@prep.example.com', 'role': 'teacher',
+                 'subject': SUBJECTS[t % len(SUBJECTS)]} for t in range(max(1, count // 10))]
+    students = [{'name': f'Student{s} Kim', 'email': f'student{s}@example.com', 'role': 'student',
+                 'aliases': f'S{s}'} for s in range(count - len(teachers))]
+    return teachers + students
+
+
+def make_events(count, roster, seed=0):
+    rng = random.Random(seed)
+    teachers = [p for p in roster if p['role'] == 'teacher']
+    students = [p for p in roster if p['role'] == 'student']
+    day = datetime.date.today()
+    events = []
+    for i in range(count):
+        teacher, student, subject = rng.choice(teachers), rng.choice(students), rng.choice(SUBJECTS)
+        style = i % 4
+        if style == 0:      # everything in the description
+            summary = 'Tutoring'
+            description = f"Student: {student['name']}\nTeacher: {teacher['name']}\nType: Online\nSubject: {subject}"
+            attendees = []
+        elif style == 1:    # "Subject - Student", student invited
+            summary, description = f"{subject} - {student['name']}", 'Zoom link to follow'
+            attendees = [{'email': student['email']}]
+        elif style == 2:    # "Student with Teacher", nothing else
+            summary, description = f"{student['aliases']} with {teacher['name']}", ''
+            attendees = []
+        else:               # only attendees
+            summary, description = 'Session', 'In-person at the Suwanee office'
+            attendees = [{'email': student['email']}, {'email': teacher['email']}]
+        start = datetime.datetime.combine(day, datetime.time(8)) + datetime.timedelta(minutes=15 * i)
+        events.append({'id': f'evt{i}', 'updated': '2025-01-01T00:00:00Z', 'summary': summary,
+                       'description': description, 'attendees': attendees,
+                       'start': {'dateTime': start.isoformat() + '-04:00'},
+                       'end': {'dateTime': (start + datetime.timedelta(minutes=50)).isoformat() + '-04:00'}})
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=500)
+    parser.add_argument('--roster', type=int, default=60)
+    parser.add_argument('--reruns', type=int, default=10)
+    args = parser.parse_args()
+
+    people = make_roster(args.roster)
+    extraction.get_roster().load(people)
+    events = make_events(args.events, people)
+
+    old_calls = sum(1 for e in events if templates.missing_fields(templates.extract_fields(e)))
+    print(f"Description lines only: {old_calls}/{len(events)} events need Gemini for Type/Subject, "
+          f"names typed by hand for all of them")
+
+    start = time.perf_counter()
+    infos = [extraction.extract(e) for e in events]
+    first = time.perf_counter() - start
+    new_calls = sum(1 for info in infos if templates.missing_fields(info))
+    no_student = sum(1 for info in infos if not info['student'])
+    no_teacher = sum(1 for info in infos if not info['teacher'])
+    print(f"Extraction + roster:    {new_calls}/{len(events)} need Gemini, "
+          f"{no_student} without a student name, {no_teacher} without a teacher name")
+
+    start = time.perf_counter()
+    for _ in range(args.reruns):
+        for event in events:
+            extraction.extract(event)
+    rerun = (time.perf_counter() - start) / args.reruns
+    print(f"First pass {first * 1000:.1f} ms, memoized rerun {rerun * 1000:.2f} ms for {len(events)} events")
+
+
+if __name__ == '__main__':
+    main()
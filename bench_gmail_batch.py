@@ -0,0 +1,46 @@
+"""
+Sequential per-message sending (getProfile + send per click, as app.py did)
+vs. gmail_api.send_messages_batch, against a stubbed Gmail transport.
+
+Usage: python bench_gmail_batch.py [--messages 80] [--latency 0.15] [--fail-every 0]
+"""
+import argparse
+import time
+
+import fakes
+import gmail_api
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=80)
+    parser.add_argument('--latency', type=float, default=0.15, help='Simulated latency per HTTP round trip (s)')
+    parser.add_argument('--fail-every', type=int, default=0, help='Every Nth send returns 429')
+    args = parser.parse_args()
+
+    def _messages(sender):
+        return [gmail_api.create_message(sender, f"student{i}@example.com", f"Reminder {i}", "Body")
+                for i in range(args.messages)]
+
+    service = fakes.FakeGmailService(latency=args.latency, fail_every=args.fail_every)
+    start = time.perf_counter()
+    sent = 0
+    for message in _messages('me@example.com'):
+        service.users().getProfile(userId='me').execute()
+        if gmail_api.send_message(service, 'me', message):
+            sent += 1
+    sequential = time.perf_counter() - start
+    print(f"Sequential: {sent}/{args.messages} sent, {service.round_trips} round trips, {sequential:.2f}s")
+
+    service = fakes.FakeGmailService(latency=args.latency, fail_every=args.fail_every)
+    start = time.perf_counter()
+    sender = gmail_api.get_sender_address(service)
+    results = gmail_api.send_messages_batch(service, _messages(sender), base_delay=args.latency)
+    batched = time.perf_counter() - start
+    sent = sum(1 for r in results if r['status'] == 'sent')
+    print(f"Batched: {sent}/{args.messages} sent, {service.round_trips} round trips, {batched:.2f}s")
+    print(f"Speedup: {sequential / batched:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
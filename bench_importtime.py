@@ -0,0 +1,112 @@
+"""
+Cold import time of the core modules, measured with `python -X importtime`
+in a fresh interpreter so nothing is already cached in sys.modules.
+
+Reports the cumulative time per top-level package, the slowest imports, and
+whether any heavy SDK (Streamlit, Gemini, Google API client, pytz) was loaded
+eagerly. Exits 1 if the total exceeds --max-ms or a heavy SDK was loaded, so
+it can guard against startup regressions in CI.
+
+Usage: python bench_importtime.py [--modules agent batch] [--runs 5] [--max-ms 300] [--json results.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+CORE_MODULES = ['agent', 'auth', 'batch', 'calendar_api', 'calendar_sync', 'cli', 'credential_manager',
+                'draft_cache', 'event_store', 'gmail_api', 'outbox', 'rate_limiter', 'services', 'templates']
+HEAVY_PACKAGES = ['streamlit', 'google.generativeai', 'googleapiclient', 'google_auth_oauthlib', 'pytz']
+
+
+def parse_importtime(stderr):
+    """Parses -X importtime output into [(module, self_us, cumulative_us, depth)]."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def measure(modules):
+    """Imports modules in a fresh interpreter; returns (wall seconds, importtime rows)."""
+    code = "import " + ", ".join(modules)
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    return wall, parse_importtime(proc.stderr)
+
+
+def summarize(rows, modules):
+    """
+    Cumulative ms for each requested module imported at top level and the
+    heavy packages seen. A module first pulled in by another one is counted
+    in that module's time.
+    """
+    per_module = {name: cumulative / 1000 for name, _, cumulative, depth in rows if depth == 0 and name in modules}
+    loaded = {name for name, _, _, _ in rows}
+    heavy = [pkg for pkg in HEAVY_PACKAGES if pkg in loaded]
+    return per_module, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--modules', nargs='+', default=CORE_MODULES)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='Slowest imports to list')
+    parser.add_argument('--max-ms', type=float, default=None, help='Fail if median total import time exceeds this')
+    parser.add_argument('--json', help='Append the results to this JSON file')
+    args = parser.parse_args()
+
+    totals, walls, last_rows = [], [], []
+    for _ in range(args.runs):
+        wall, rows = measure(args.modules)
+        per_module, heavy = summarize(rows, args.modules)
+        totals.append(sum(per_module.values()))
+        walls.append(wall * 1000)
+        last_rows = rows
+
+    per_module, heavy = summarize(last_rows, args.modules)
+    total = statistics.median(totals)
+    print(f"Core imports: median {total:.1f} ms over {args.runs} runs "
+          f"(interpreter wall time {statistics.median(walls):.1f} ms)")
+    for name, ms in sorted(per_module.items(), key=lambda item: -item[1]):
+        print(f"  {name:<20} {ms:8.1f} ms")
+
+    print("Slowest imports (self time):")
+    for name, self_us, _, _ in sorted(last_rows, key=lambda row: -row[1])[:args.top]:
+        print(f"  {name:<40} {self_us / 1000:8.1f} ms")
+
+    if heavy:
+        print(f"Heavy SDKs loaded eagerly: {', '.join(heavy)}")
+    else:
+        print("Heavy SDKs loaded eagerly: none")
+
+    if args.json:
+        history = []
+        if os.path.exists(args.json):
+            with open(args.json) as f:
+                history = json.load(f)
+        history.append({'timestamp': time.time(), 'python': sys.version.split()[0], 'total_ms': total,
+                        'per_module_ms': per_module, 'heavy_loaded': heavy})
+        with open(args.json, 'w') as f:
+            json.dump(history, f, indent=2)
+
+    failed = bool(heavy)
+    if args.max_ms is not None and total > args.max_ms:
+        print(f"FAIL: {total:.1f} ms exceeds budget of {args.max_ms:.1f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Load test: the real fetch -> generate -> send path (async_core.run_pipeline)
+against the fakes, with configurable latency, jitter, error rates and 429s.
+
+Reports end-to-end throughput and p50 / p95 / p99 latency per stage (from
+the metrics spans), appends the run to a JSON-lines results file and
+compares it with the last stored run of the same scenario, so a change to
+agent.py or calendar_api.py can be measured before and after.
+
+--llm-fraction is the share of events missing their Subject line, which
+need a Gemini call; the rest are drafted from templates alone.
+
+Usage: python bench_load.py [--events 50] [--runs 3] [--label NAME] [--gemini-429-rate 0.05] ...
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+
+import agent
+import async_core
+import draft_cache
+import event_view
+import fakes
+import metrics
+import outbox
+import rate_limiter
+
+RESULTS_PATH = 'bench_results.jsonl'
+# Arguments that name or store a run rather than describe the scenario
+NOT_SCENARIO = ('runs', 'label', 'results', 'no_save')
+
+
+def make_events(count, day, llm_fraction):
+    events = []
+    llm_every = round(1 / llm_fraction) if llm_fraction > 0 else 0
+    for i in range(count):
+        start = datetime.datetime.combine(day, datetime.time(8)) + datetime.timedelta(minutes=10 * i)
+        needs_llm = llm_every and i % llm_every == 0
+        events.append({
+            'id': f'evt{i}',
+            'summary': f'Session {i}',
+            'description': 'Type: Online' if needs_llm else 'Type: Online\nSubject: Math',
+            'start': {'dateTime': start.isoformat() + '-04:00'},
+            'end': {'dateTime': (start + datetime.timedelta(minutes=50)).isoformat() + '-04:00'},
+            'attendees': [{'email': f'student{i}@example.com'}],
+        })
+    return events
+
+
+def run_once(args, events, day, seed):
+    calendar = fakes.FakeCalendarService(events, page_size=args.page_size, latency=args.calendar_latency,
+                                         jitter=args.jitter, throttle_rate=args.calendar_429_rate, seed=seed)
+    gmail = fakes.FakeGmailService(latency=args.gmail_latency, jitter=args.jitter, fail_status=500,
+                                   error_rate=args.gmail_error_rate, throttle_rate=args.gmail_429_rate, seed=seed)
+    model = fakes.FakeModel(model_name=agent.MODEL_NAME, latency=args.gemini_latency, jitter=args.jitter,
+                            throttle_rate=args.gemini_429_rate, error_rate=args.gemini_error_rate, seed=seed,
+                            reply=json.dumps({'type': 'Online', 'subject': 'Math'}))
+    agent.get_model = lambda *a, **k: model
+    rate_limiter.configure(agent.MODEL_NAME, rpm=args.rpm, tpm=None, max_concurrency=args.workers)
+    box = outbox.Outbox(tempfile.mktemp(suffix='.sqlite3'))
+    event_view.clear()
+
+    start = time.perf_counter()
+    try:
+        results = async_core.run_sync(async_core.run_pipeline, calendar, gmail, day, max_concurrency=args.workers,
+                                      send=True, box=box)
+        error = None
+    except Exception as e:
+        results, error = [], str(e)
+    elapsed = time.perf_counter() - start
+    os.remove(box.path)
+    return {
+        'elapsed': elapsed,
+        'error': error,
+        'events': len(results),
+        'generation_errors': sum(1 for r in results if r['error']),
+        'sent': len(gmail.sent),
+        'send_failures': sum(1 for r in results if r.get('send_error')),
+        'gemini_calls': model.calls,
+        'gemini_429s': model.throttled,
+        'gmail_round_trips': gmail.round_trips,
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def load_previous(path, scenario):
+    """The last stored record for the same scenario, or None."""
+    if not os.path.exists(path):
+        return None
+    previous = None
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            if record.get('scenario') == scenario:
+                previous = record
+    return previous
+
+
+def _change(old, new):
+    if not old:
+        return ''
+    return f"{(new - old) / old * 100:+.0f}%"
+
+
+def report(record, previous):
+    print(f"\n{record['events']} events x {len(record['runs'])} runs: "
+          f"{record['throughput']:.1f} events/s, run time p50 {record['elapsed_p50']:.2f} s "
+          f"{_change(previous and previous['elapsed_p50'], record['elapsed_p50'])}")
+    failed = [r['error'] for r in record['runs'] if r['error']]
+    if failed:
+        print(f"{len(failed)} runs failed: {failed[0]}")
+    totals = {key: sum(r[key] for r in record['runs'])
+              for key in ('generation_errors', 'sent', 'send_failures', 'gemini_calls', 'gemini_429s')}
+    print("  " + ", ".join(f"{key}={value}" for key, value in totals.items()))
+    print(f"  retries: gemini={record['counters']['gemini_retries_total']:.0f} "
+          f"(backoff {record['counters']['gemini_backoff_seconds_total']:.2f} s), "
+          f"gmail={record['counters']['gmail_retries_total']:.0f}")
+
+    print(f"\n{'stage':<26}{'calls':>7}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  p95 vs last")
+    old_stages = previous['stages'] if previous else {}
+    for stage, row in record['stages'].items():
+        old = old_stages.get(stage, {}).get('p95')
+        print(f"{stage:<26}{row['count']:>7}{row['errors']:>8}{row['p50'] * 1000:>9.1f}{row['p95'] * 1000:>9.1f}"
+              f"{row['p99'] * 1000:>9.1f}  {_change(old, row['p95'])}")
+    if previous:
+        print(f"\nCompared with {previous.get('label') or previous['timestamp']} "
+              f"(commit {previous.get('commit') or 'unknown'})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=50)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--page-size', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rpm', type=int, default=None, help='Client-side Gemini RPM limit (default none)')
+    parser.add_argument('--llm-fraction', type=float, default=0.5)
+    parser.add_argument('--calendar-latency', type=float, default=0.2)
+    parser.add_argument('--gemini-latency', type=float, default=0.5)
+    parser.add_argument('--gmail-latency', type=float, default=0.3)
+    parser.add_argument('--jitter', type=float, default=0.3, help='Latency spread, as a fraction of the latency')
+    parser.add_argument('--calendar-429-rate', type=float, default=0.0)
+    parser.add_argument('--gemini-429-rate', type=float, default=0.0)
+    parser.add_argument('--gemini-error-rate', type=float, default=0.0)
+    parser.add_argument('--gmail-429-rate', type=float, default=0.0)
+    parser.add_argument('--gmail-error-rate', type=float, default=0.0)
+    parser.add_argument('--retry-delay', type=float, default=0.2, help='Gemini retry base delay (s)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--label', help='Name for this run in the results file')
+    parser.add_argument('--results', default=RESULTS_PATH)
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args()
+
+    draft_cache.ENABLED = False
+    agent.RETRY_BASE_DELAY = args.retry_delay
+    metrics.RECENT = max(metrics.RECENT, args.events * args.runs * 4)
+    metrics.reset()
+    day = datetime.date.today() + datetime.timedelta(days=1)
+    events = make_events(args.events, day, args.llm_fraction)
+
+    runs = []
+    for i in range(args.runs):
+        run = run_once(args, events, day, args.seed + i)
+        print(f"run {i + 1}: {run['elapsed']:.2f} s, {run['sent']} sent"
+              + (f", failed: {run['error']}" if run['error'] else ""))
+        runs.append(run)
+
+    elapsed = [r['elapsed'] for r in runs]
+    scenario = {key: value for key, value in vars(args).items() if key not in NOT_SCENARIO}
+    record = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'label': args.label,
+        'commit': _commit(),
+        'scenario': scenario,
+        'events': args.events,
+        'runs': runs,
+        'elapsed_p50': statistics.median(elapsed),
+        'throughput': sum(r['events'] for r in runs) / sum(elapsed),
+        'stages': {row['stage']: {key: row[key] for key in ('count', 'errors', 'p50', 'p95', 'p99')}
+                   for row in metrics.summary()},
+        'counters': {name: sum(metrics.counters(name).values())
+                     for name in ('gemini_retries_total', 'gemini_backoff_seconds_total', 'gmail_retries_total')},
+    }
+    report(record, load_previous(args.results, scenario))
+    if not args.no_save:
+        with open(args.results, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        print(f"Saved to {args.results}")
+
+
+if __name__ == '__main__':
+    main()
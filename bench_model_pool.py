@@ -0,0 +1,110 @@
+"""
+Per-call overhead of getting a Gemini model, and what the fallback chain
+buys when the primary model is throttled.
+
+1. Model lookup: a new GenerativeModel plus a fresh safety_settings list
+   per call (the old generation functions) vs. model_pool.ModelPool.get.
+   Uses google.generativeai when it is installed (construction only, no
+   network), fakes.FakeModel otherwise.
+2. agent.generate_content_with_retry on a zero-latency fake through the
+   pool, i.e. the wrapper's own overhead per call.
+3. --calls calls while the primary answers 429 to its first --throttled
+   calls: backoff on the primary only vs. falling back to a lighter model.
+
+Usage: python bench_model_pool.py [--lookups 20000] [--calls 40] [--throttled 20] [--latency 0.05]
+"""
+import argparse
+import time
+
+import agent
+import fakes
+import model_pool
+import prompts
+import rate_limiter
+
+
+def _per_call(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def _factory():
+    try:
+        import google.generativeai as genai
+        return genai.GenerativeModel, 'google.generativeai'
+    except ImportError:
+        return (lambda name, system_instruction=None: fakes.FakeModel(name)), 'fakes.FakeModel'
+
+
+def bench_lookup(args):
+    create, source = _factory()
+    instruction = prompts.INSTRUCTIONS['drafts']
+
+    def fresh():
+        safety = [dict(s) for s in agent.SAFETY_SETTINGS]
+        return create(agent.MODEL_NAME, system_instruction=instruction), safety
+
+    pool = model_pool.ModelPool(lambda name, system_instruction: create(name, system_instruction=system_instruction))
+    print(f"{f'Model per call ({source}):':<40}{_per_call(fresh, args.lookups):8.2f} us")
+    print(f"{'ModelPool.get:':<40}{_per_call(lambda: pool.get(agent.MODEL_NAME, instruction), args.lookups):8.2f} us")
+
+
+def bench_wrapper(args):
+    agent._pool = model_pool.ModelPool(lambda name, system_instruction: fakes.FakeModel(name), fallbacks=[])
+    rate_limiter.configure(agent.MODEL_NAME, rpm=None, tpm=None)
+    model = agent.get_task_model('fields')
+    n = args.lookups // 10
+    overhead = _per_call(lambda: agent.generate_content_with_retry(model, 'Title: SAT Math', task='fields'), n)
+    print(f"{'generate_content_with_retry:':<40}{overhead:8.2f} us per call (zero-latency model)")
+
+
+def bench_fallback(args, fallbacks):
+    models = {}
+
+    def create(name, system_instruction):
+        schedule = [429] * args.throttled if name == agent.MODEL_NAME else None
+        models[name] = fakes.FakeModel(name, latency=args.latency, schedule=schedule)
+        return models[name]
+
+    agent._pool = model_pool.ModelPool(create, fallbacks=fallbacks)
+    for name in [agent.MODEL_NAME] + fallbacks:
+        rate_limiter.configure(name, rpm=None, tpm=None)
+    model = agent.get_task_model('fields')
+    start = time.perf_counter()
+    failed = 0
+    for _ in range(args.calls):
+        try:
+            agent.generate_content_with_retry(model, 'Title: SAT Math', task='fields', base_delay=args.base_delay,
+                                              retries=args.retries)
+        except Exception:
+            failed += 1
+    elapsed = time.perf_counter() - start
+    served = ", ".join(f"{name} {m.calls - m.throttled}" for name, m in models.items())
+    label = f"fallback to {', '.join(fallbacks)}" if fallbacks else "primary only, backoff"
+    print(f"{label:<40} {elapsed:6.2f}s, {failed} failed; served by {served}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lookups', type=int, default=20000)
+    parser.add_argument('--calls', type=int, default=40)
+    parser.add_argument('--throttled', type=int, default=20, help='Calls the primary rejects with 429')
+    parser.add_argument('--latency', type=float, default=0.05, help='Simulated Gemini latency per call (s)')
+    parser.add_argument('--base-delay', type=float, default=0.2, help='Retry backoff base (s)')
+    parser.add_argument('--retries', type=int, default=4)
+    args = parser.parse_args()
+
+    original = agent._pool
+    try:
+        bench_lookup(args)
+        bench_wrapper(args)
+        bench_fallback(args, [])
+        bench_fallback(args, ['gemini-2.5-flash-lite'])
+    finally:
+        agent._pool = original
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Concurrent claims on one outbox file: --processes processes (like the
+Streamlit app and the cron job) each open their own Outbox on the same
+SQLite file and claim batches until the queue is empty.
+
+Every message must be claimed exactly once; exits 1 if any was claimed
+twice or not at all.
+
+Usage: python bench_outbox.py [--messages 2000] [--processes 4] [--batch 50]
+"""
+import argparse
+import collections
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import outbox
+
+
+def _claim_all(path, batch):
+    box = outbox.Outbox(path)
+    keys = []
+    while True:
+        rows = box.claim(batch)
+        if not rows:
+            return keys
+        keys.extend(row['key'] for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--batch', type=int, default=50, help='Messages per claim')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'outbox.sqlite3')
+    box = outbox.Outbox(path)
+    for i in range(args.messages):
+        box.enqueue(f'event{i}', f'student{i}@example.com', 'student', 'Subject', 'Body')
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.processes) as pool:
+        claimed = pool.starmap(_claim_all, [(path, args.batch)] * args.processes)
+    elapsed = time.perf_counter() - start
+
+    counts = collections.Counter(key for keys in claimed for key in keys)
+    duplicates = sum(n - 1 for n in counts.values() if n > 1)
+    missing = args.messages - len(counts)
+    per_process = ", ".join(str(len(keys)) for keys in claimed)
+    print(f"{sum(counts.values())} claims of {args.messages} messages in {elapsed:.2f}s "
+          f"(per process: {per_process}); {duplicates} duplicates, {missing} unclaimed")
+    return 1 if duplicates or missing else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Week-ahead planning over recurring sessions: Gemini calls and Gmail sends
+per session (async_core-style, one Gemini draft and one student email per
+instance) vs. planner (one Gemini draft per series, rendered per instance,
+plus one digest per student and week).
+
+Each student has --slots weekly recurring sessions over --weeks weeks,
+plus a one-off session for every fifth student. Drafts are written by a
+fake Gemini model (use_template=False) with --latency per call.
+
+Usage: python bench_planner.py [--students 30] [--slots 2] [--weeks 4] [--latency 0.2] [--workers 8]
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import re
+import tempfile
+import time
+
+import agent
+import async_core
+import batch
+import draft_cache
+import fakes
+import outbox
+import planner
+import rate_limiter
+import templates
+
+
+def make_events(students, slots, weeks):
+    monday = datetime.date.today() - datetime.timedelta(days=datetime.date.today().weekday())
+    events = []
+    for s in range(students):
+        for slot in range(slots):
+            first = datetime.datetime.combine(monday + datetime.timedelta(days=slot * 2 + s % 2),
+                                              datetime.time(14 + s % 6))
+            for week in range(weeks):
+                start = first + datetime.timedelta(weeks=week)
+                events.append(_event(f'series{s}_{slot}_{week}', start, s, recurring=f'series{s}_{slot}'))
+        if s % 5 == 0:
+            events.append(_event(f'oneoff{s}', datetime.datetime.combine(monday, datetime.time(9)), s))
+    return events
+
+
+def _event(event_id, start, s, recurring=None):
+    event = {'id': event_id, 'updated': '2025-01-01T00:00:00Z', 'summary': f'SAT Math - Student{s}',
+             'description': 'Type: Online\nSubject: SAT Math', 'attendees': [{'email': f'student{s}@example.com'}],
+             'start': {'dateTime': start.isoformat() + '-04:00'},
+             'end': {'dateTime': (start + datetime.timedelta(minutes=50)).isoformat() + '-04:00'}}
+    if recurring:
+        event['recurringEventId'] = recurring
+    return event
+
+
+def reply(prompt):
+    """A drafts JSON answer built from the prompt's Key: value lines, like the model would write."""
+    values = dict(re.findall(r'^([\w ]+): (.*)$', prompt, re.M))
+    fields = dict(type='Online', subject='SAT Math', student=values.get('Student'), teacher=values.get('Teacher'),
+                  time=values.get('Time'))
+    student = templates.STUDENT_TEMPLATE.format(date=values.get('Student date'), **fields)
+    teacher = templates.TEACHER_TEMPLATE.format(date=values.get('Teacher date'), **fields)
+    return json.dumps({'student': templates._split_subject(student), 'teacher': templates._split_subject(teacher)})
+
+
+async def per_instance(events, workers):
+    limit = asyncio.Semaphore(workers)
+
+    async def _one(event):
+        result = {'event': event, 'student_draft': None, 'teacher_draft': None, 'error': None}
+        async with limit:
+            try:
+                drafts = await agent.generate_drafts_async(event, 'Andy', 'Student', use_template=False)
+                result['student_draft'], result['teacher_draft'] = drafts['student'], drafts['teacher']
+            except Exception as e:
+                result['error'] = str(e)
+        return result
+
+    return list(await asyncio.gather(*(_one(event) for event in events)))
+
+
+def run(label, model, generate, send):
+    gmail = fakes.FakeGmailService()
+    box = outbox.Outbox(tempfile.mktemp(suffix='.sqlite3'))
+    calls = model.calls
+    start = time.perf_counter()
+    results = generate()
+    generated = time.perf_counter() - start
+    send(gmail, results, box)
+    errors = sum(1 for r in results if r['error'])
+    print(f"{label:<28}{model.calls - calls:>8}{len(gmail.sent):>8}{generated:>10.2f}s{errors:>8}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--students', type=int, default=30)
+    parser.add_argument('--slots', type=int, default=2, help='Weekly recurring sessions per student')
+    parser.add_argument('--weeks', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.2, help='Simulated Gemini latency per call (s)')
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    draft_cache.ENABLED = False
+    model = fakes.FakeModel(model_name=agent.MODEL_NAME, latency=args.latency, reply=reply)
+    agent.get_model = lambda *a, **k: model
+    rate_limiter.configure(agent.MODEL_NAME, rpm=None, tpm=None, max_concurrency=args.workers)
+    events = make_events(args.students, args.slots, args.weeks)
+    print(f"{len(events)} sessions in {len(planner.group_series(events))} series, {args.students} students")
+    print(f"{'':<28}{'gemini':>8}{'sends':>8}{'generate':>11}{'errors':>8}")
+
+    run("Per session", model,
+        lambda: async_core.run_sync(per_instance, events, args.workers),
+        lambda gmail, results, box: batch.send_drafts(gmail, results, box=box))
+    planned = run("Planner", model,
+                  lambda: planner.plan(events, 'Andy', 'Student', use_template=False, max_workers=args.workers),
+                  lambda gmail, results, box: planner.send_plan(gmail, results, box=box))
+    run("Planner + weekly digest", model,
+        lambda: planned,
+        lambda gmail, results, box: planner.send_plan(gmail, results, digest=True, box=box))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Input tokens per Gemini request: the old prompts (instructions, example
+formats and the raw description inline in every prompt) vs. prompts.py
+(system instruction + compact "Key: value" lines, description bounded to
+DESCRIPTION_TOKEN_BUDGET), for the fields and drafts calls.
+
+Half of the events carry a long description (meeting links, pasted notes),
+as synced calendars often do. Tokens are estimated with rate_limiter's
+4 chars / token rule, the same estimate the TPM limiter uses offline.
+
+Usage: python bench_prompts.py [--events 200] [--notes 40]
+"""
+import argparse
+import datetime
+import json
+
+import prompts
+import templates
+
+
+def make_events(count, notes):
+    day = datetime.date.today()
+    events = []
+    for i in range(count):
+        start = datetime.datetime.combine(day, datetime.time(8)) + datetime.timedelta(minutes=15 * i)
+        description = "Type: Online\nSubject: SAT Math"
+        if i % 2:
+            description += (
+                "\n\nJoin Zoom Meeting\nhttps://us02web.zoom.us/j/8123456789?pwd=QWxhZGRpbjpvcGVuIHNlc2FtZQ\n"
+                "Meeting ID: 812 345 6789\n\n" +
+                "\n".join(f"Note {n}: covered practice test section {n}, review the missed questions." for n in
+                          range(notes)))
+        events.append({'id': f'evt{i}', 'summary': f'SAT Math - Student{i}', 'description': description,
+                       'start': {'dateTime': start.isoformat() + '-04:00'},
+                       'end': {'dateTime': (start + datetime.timedelta(minutes=50)).isoformat() + '-04:00'}})
+    return events
+
+
+def legacy_fields_prompt(event_details):
+    """agent._fields_prompt before prompts.py."""
+    return (
+        "Extract the tutoring session Type and Subject from this calendar event.\n"
+        f"Title: {event_details.get('summary', '')}\n"
+        f"Description: {event_details.get('description', '')}"
+    )
+
+
+def legacy_drafts_prompt(event_details, teacher_name, student_name):
+    """agent._drafts_prompt before prompts.py."""
+    student_date, time_str = templates.format_date_time(event_details, templates.STUDENT_DATE_FORMAT)
+    teacher_date, _ = templates.format_date_time(event_details, templates.TEACHER_DATE_FORMAT)
+    example = templates.render_drafts(
+        event_details, teacher_name, student_name, {'type': '[Type]', 'subject': '[Subject]'})
+    return (
+        "You are an automated email assistant for Elite Prep Suwanee.\n"
+        "Write the student and teacher confirmation emails for this tutoring appointment, "
+        "following the example formats exactly and filling in [Type] and [Subject] from the event details.\n\n"
+        "Event Details:\n"
+        f"- Subject/Topic: {event_details.get('summary', 'Appointment')}\n"
+        f"- Description/Type: {event_details.get('description', '')}\n"
+        f"- Student date: {student_date}\n"
+        f"- Teacher date: {teacher_date}\n"
+        f"- Time Range: {time_str}\n"
+        f"- Teacher Name: {teacher_name}\n"
+        f"- Student Name: {student_name}\n\n"
+        f"Example formats (JSON):\n{json.dumps(example, indent=1)}"
+    )
+
+
+def _stats(counts):
+    counts = sorted(counts)
+    return sum(counts) / len(counts), counts[int(len(counts) * 0.95) - 1], counts[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=200)
+    parser.add_argument('--notes', type=int, default=40, help='Note lines in the long descriptions')
+    args = parser.parse_args()
+
+    events = make_events(args.events, args.notes)
+    cases = [
+        ('fields', legacy_fields_prompt, prompts.fields_prompt, prompts.FIELDS_INSTRUCTION),
+        ('drafts', lambda e: legacy_drafts_prompt(e, 'Andy', 'Kevin'),
+         lambda e: prompts.drafts_prompt(e, 'Andy', 'Kevin'), prompts.DRAFTS_INSTRUCTION),
+    ]
+    print(f"{'task':<8}{'':>10}{'mean':>8}{'p95':>8}{'max':>8}")
+    for task, legacy, current, instruction in cases:
+        old = _stats([prompts.estimate_tokens(legacy(e)) for e in events])
+        new = _stats([prompts.estimate_tokens(instruction) + prompts.estimate_tokens(current(e)) for e in events])
+        print(f"{task:<8}{'before':>10}{old[0]:>8.0f}{old[1]:>8}{old[2]:>8}")
+        print(f"{'':<8}{'after':>10}{new[0]:>8.0f}{new[1]:>8}{new[2]:>8}  ({1 - new[0] / old[0]:.0%} fewer on average)")
+    print("System instructions (same prefix on every call): "
+          + ", ".join(f"{task} {prompts.estimate_tokens(text)}" for task, text in sorted(prompts.INSTRUCTIONS.items())))
+
+
+if __name__ == '__main__':
+    main()
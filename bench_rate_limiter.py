@@ -0,0 +1,50 @@
+"""
+Exercise the Gemini rate limiter against a fake model that returns 429s on
+a schedule, and report how the adaptive concurrency limit and throughput
+respond.
+
+Usage: python bench_rate_limiter.py [--calls 60] [--workers 8] [--rpm 600]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import fakes
+import rate_limiter
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=60)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rpm', type=int, default=600)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--throttle-every', type=int, default=7, help='Every Nth model call returns 429')
+    parser.add_argument('--base-delay', type=float, default=0.05)
+    args = parser.parse_args()
+
+    schedule = [429 if (i + 1) % args.throttle_every == 0 else 200 for i in range(args.calls * 4)]
+    model = fakes.FakeModel('bench-model', latency=args.latency, schedule=schedule)
+    limiter = rate_limiter.configure('bench-model', rpm=args.rpm, tpm=None, max_concurrency=args.workers)
+
+    def one_call(i):
+        return rate_limiter.call_with_limits(
+            limiter, lambda: model.generate_content(f"prompt {i}").text, f"prompt {i}",
+            retries=6, base_delay=args.base_delay)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        list(pool.map(one_call, range(args.calls)))
+    elapsed = time.perf_counter() - start
+
+    stats = limiter.stats()
+    print(f"{args.calls} calls in {elapsed:.2f}s ({args.calls / elapsed:.1f}/s)")
+    print(f"model calls: {model.calls}, 429s injected: {model.throttled}")
+    for key in ('successes', 'throttled', 'errors', 'concurrency_limit', 'avg_queue_wait',
+                'backoff_wait', 'throughput_per_min'):
+        value = stats[key]
+        print(f"  {key}: {value:.3f}" if isinstance(value, float) else f"  {key}: {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Picking up [Y]/[N] replies: ReplyTracker's Gmail history deltas vs.
+reading every tracked confirmation thread on each check, as a tracker
+without history would.
+
+--confirmations student emails are sent, then each check receives
+--replies-per-check new replies (a mix of clear and unclear answers).
+
+Usage: python bench_replies.py [--confirmations 200] [--checks 5] [--replies-per-check 10] [--latency 0.1]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import agent
+import fakes
+import gmail_api
+import outbox
+import replies
+
+ANSWERS = ['Y', '[N]', 'Yes, see you then!', "Sorry, I can't make it", 'y', 'Which room is it in?']
+
+
+def setup(args):
+    gmail = fakes.FakeGmailService(latency=args.latency)
+    box = outbox.Outbox(tempfile.mktemp(suffix='.sqlite3'))
+    for i in range(args.confirmations):
+        box.enqueue(f'evt{i}', f'student{i}@example.com', 'student', 'Appointment Confirmation',
+                    'Please reply with [Y] or [N].')
+    box.drain(gmail)
+    return gmail, box
+
+
+def receive(gmail, args, check):
+    for j in range(args.replies_per_check):
+        n = (check * args.replies_per_check + j) % args.confirmations + 1
+        gmail.receive_reply(f'thread{n}', f'student{n - 1}@example.com', ANSWERS[(n + check) % len(ANSWERS)])
+
+
+def rescan_all(gmail, box):
+    """One check without history: read every tracked thread again."""
+    thread_ids = [row['thread_id'] for row in box.sent('student')]
+    found = 0
+    for thread in gmail_api.get_threads(gmail, thread_ids).values():
+        found += sum(1 for m in thread['messages'] if 'SENT' not in m['labelIds'])
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--confirmations', type=int, default=200)
+    parser.add_argument('--checks', type=int, default=5)
+    parser.add_argument('--replies-per-check', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.1, help='Simulated Gmail round trip (s)')
+    args = parser.parse_args()
+
+    # Unclear replies would go to Gemini; count them instead
+    llm_calls = []
+    agent.classify_reply_with_llm = lambda text: llm_calls.append(text)
+
+    gmail, box = setup(args)
+    start_trips = gmail.round_trips
+    start = time.perf_counter()
+    for check in range(args.checks):
+        receive(gmail, args, check)
+        rescan_all(gmail, box)
+    print(f"Rescan every thread: {time.perf_counter() - start:.2f}s, "
+          f"{gmail.round_trips - start_trips} round trips for {args.checks} checks")
+
+    gmail, box = setup(args)
+    tracker = replies.ReplyTracker(tempfile.mktemp(suffix='.sqlite3'), box=box)
+    tracker.sync(gmail)  # first sync reads the threads once
+    start_trips = gmail.round_trips
+    start = time.perf_counter()
+    for check in range(args.checks):
+        receive(gmail, args, check)
+        tracker.sync(gmail)
+    print(f"History deltas:      {time.perf_counter() - start:.2f}s, "
+          f"{gmail.round_trips - start_trips} round trips for {args.checks} checks")
+
+    counts = tracker.counts()
+    print(f"Recorded: {counts}; Gemini asked for {len(llm_calls)} of "
+          f"{args.checks * args.replies_per_check} replies")
+    os.remove(tracker.path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Startup latency of the Google service layer: building Calendar + Gmail
+services from scratch (what every Streamlit rerun used to do) vs. fetching
+them from the shared services cache.
+
+Usage: python bench_startup.py [--reruns 20]
+"""
+import argparse
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--reruns', type=int, default=20)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    from google.oauth2.credentials import Credentials
+    from googleapiclient.discovery import build
+    import calendar_api
+    import gmail_api
+    import services
+    import_time = time.perf_counter() - start
+    print(f"Imports: {import_time * 1000:.1f} ms")
+
+    creds = Credentials(token='bench-token', refresh_token='bench-refresh')
+
+    start = time.perf_counter()
+    for _ in range(args.reruns):
+        build('calendar', 'v3', credentials=creds)
+        build('gmail', 'v1', credentials=creds)
+    before = (time.perf_counter() - start) / args.reruns
+    print(f"Before (build per rerun): {before * 1000:.1f} ms per rerun")
+
+    start = time.perf_counter()
+    calendar_api.get_calendar_service(creds)
+    gmail_api.get_gmail_service(creds)
+    first = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(args.reruns):
+        calendar_api.get_calendar_service(creds)
+        gmail_api.get_gmail_service(creds)
+    after = (time.perf_counter() - start) / args.reruns
+    print(f"After: first build {first * 1000:.1f} ms, then {after * 1000:.3f} ms per rerun")
+    services.clear()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark: local template rendering vs. the Gemini paths.
+
+The Gemini paths are driven through agent with use_template=False and a
+stubbed model, so only prompt building, the retry wrapper and the
+simulated model latency are measured. Each iteration produces both the
+student and the teacher draft:
+- two calls: generate_email_content + generate_teacher_email_content
+- combined: generate_drafts, one structured JSON call
+
+Usage: python bench_templates.py [--latency 0.8] [--n 200]
+"""
+import argparse
+import json
+import time
+
+import agent
+import draft_cache
+import fakes
+import prompts
+import rate_limiter
+import templates
+
+SAMPLE_EVENT = {
+    'id': 'evt1',
+    'summary': 'SAT Math - Kevin',
+    'description': 'Type: In-Person\nSubject: SAT Math',
+    'start': {'dateTime': '2025-12-06T15:30:00-05:00'},
+    'end': {'dateTime': '2025-12-06T17:00:00-05:00'},
+}
+
+
+def _rate(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    elapsed = time.perf_counter() - start
+    return n / elapsed if elapsed else float('inf'), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.0, help='Simulated Gemini latency per call (s)')
+    parser.add_argument('--n', type=int, default=200, help='Events per path')
+    args = parser.parse_args()
+
+    # No client-side limiting or caching: measure the raw paths
+    draft_cache.ENABLED = False
+    rate_limiter.configure('stub', rpm=None, tpm=None, max_concurrency=1)
+    drafts = templates.render_drafts(SAMPLE_EVENT, 'Andy', 'Kevin')
+
+    def stub_model(model_name=agent.MODEL_NAME, system_instruction=None):
+        if system_instruction == prompts.DRAFTS_INSTRUCTION:
+            reply = json.dumps(drafts)
+        else:
+            reply = templates.render_student_email(SAMPLE_EVENT, 'Andy', 'Kevin')
+        return fakes.FakeModel('stub', latency=args.latency, reply=reply)
+
+    original = agent.get_model
+    agent.get_model = stub_model
+    try:
+        gemini_rate, gemini_time = _rate(lambda: (
+            agent.generate_email_content(SAMPLE_EVENT, 'Andy', 'Kevin', use_template=False),
+            agent.generate_teacher_email_content(SAMPLE_EVENT, 'Andy', 'Kevin', use_template=False)), args.n)
+        combined_rate, combined_time = _rate(
+            lambda: agent.generate_drafts(SAMPLE_EVENT, 'Andy', 'Kevin', use_template=False), args.n)
+        template_rate, template_time = _rate(
+            lambda: agent.generate_drafts(SAMPLE_EVENT, 'Andy', 'Kevin'), args.n)
+    finally:
+        agent.get_model = original
+
+    print(f"Gemini, two calls (stub, {args.latency:.3f}s latency): {gemini_rate:,.0f} events/s ({gemini_time:.3f}s for {args.n})")
+    print(f"Gemini, combined call: {combined_rate:,.0f} events/s ({combined_time:.3f}s for {args.n})")
+    print(f"Template path: {template_rate:,.0f} events/s ({template_time:.3f}s for {args.n})")
+    if gemini_rate:
+        print(f"Speedup: {template_rate / gemini_rate:,.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Multi-user load test: --sessions concurrent browser sessions over
+--accounts Google accounts, each session doing --reruns Streamlit reruns
+(read the selected day from the local calendar copy).
+
+Per session: every session keeps its own MultiCalendarSync in
+session_state, like the single-user app, so each one does a full sync of
+its account and holds its own copy of the events. Tenants: sessions look
+up their account in a tenants.TenantRegistry and share its calendar sync.
+
+Reports calendar round trips, RSS growth per session and per calendar
+copy (a session's own sync, or an added tenant with its SQLite stores),
+and reruns per second. The shared caches are warmed up first and each
+scenario runs in a process forked from there, so the RSS deltas are the
+per-session cost only (needs the fork start method). Calendars are
+fakes.FakeCalendarService with --latency per call and --events events per
+account.
+
+Usage: python bench_tenants.py [--sessions 10 50 100 200] [--accounts 10] [--reruns 5] [--events 200] [--latency 0.02]
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import datetime
+import io
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import calendar_sync
+import fakes
+import tenants
+
+
+def make_service(account, events, latency):
+    today = datetime.date.today()
+    service = fakes.FakeCalendarService(latency=latency, calendars=[
+        {'id': 'primary', 'summary': f'teacher{account}@example.com', 'primary': True, 'accessRole': 'owner'}])
+    for i in range(events):
+        start = datetime.datetime.combine(today + datetime.timedelta(days=i % 14), datetime.time(8 + i % 10))
+        service.put_event({'id': f'a{account}e{i}', 'updated': '2025-01-01T00:00:00Z',
+                           'summary': f'SAT Math - Student{i}', 'description': 'Type: Online\nSubject: SAT Math',
+                           'attendees': [{'email': f'student{i}@example.com'}],
+                           'start': {'dateTime': start.isoformat() + '-04:00'},
+                           'end': {'dateTime': (start + datetime.timedelta(minutes=50)).isoformat() + '-04:00'}})
+    return service
+
+
+def per_session(service, reruns):
+    sync = calendar_sync.MultiCalendarSync(service, time_min=datetime.date.today() - datetime.timedelta(days=30))
+    sync.set_calendars(service.calendars)
+    sync.sync()
+    for _ in range(reruns):
+        sync.get_events(datetime.date.today())
+    return sync
+
+
+def shared(registry, email, service, reruns):
+    for _ in range(reruns):
+        tenant = registry.get(email)
+        tenant.calendar_sync(service, service.calendars).get_events(datetime.date.today())
+    return tenant
+
+
+_state = {}
+
+
+def _rss_kib():
+    """Resident set size of this process in KiB (peak RSS where /proc is missing)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _measure(label, sessions, args):
+    """Runs one scenario in a child forked from the warmed-up parent, so earlier runs don't skew its RSS."""
+    services, emails = _state['services'], _state['emails']
+    if label == "Tenants":
+        registry = tenants.TenantRegistry(tempfile.mkdtemp(), max_tenants=args.accounts,
+                                          load_credentials=lambda path: fakes.FakeCredentials())
+
+        def session(a):
+            if registry.get(emails[a]) is None:
+                registry.login(emails[a], fakes.FakeCredentials(refresh_token=emails[a]))
+            return shared(registry, emails[a], services[a], args.reruns)
+    else:
+        def session(a):
+            return per_session(services[a], args.reruns)
+    for service in services:
+        service.list_calls = 0
+    before = _rss_kib()
+    start = time.perf_counter()
+    # The syncs' progress prints would drown the table
+    with contextlib.redirect_stdout(io.StringIO()), \
+            concurrent.futures.ThreadPoolExecutor(max_workers=min(sessions, 32)) as pool:
+        held = list(pool.map(lambda s: session(s % args.accounts), range(sessions)))
+    elapsed = time.perf_counter() - start
+    grown = _rss_kib() - before
+    calls = sum(service.list_calls for service in services)
+    opened = len({id(h) for h in held}) if label == "Tenants" else sessions
+    return label, sessions, calls, grown / sessions, grown / opened, sessions * args.reruns / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, nargs='+', default=[10, 50, 100, 200])
+    parser.add_argument('--accounts', type=int, default=10)
+    parser.add_argument('--reruns', type=int, default=5, help='Reruns per session')
+    parser.add_argument('--events', type=int, default=200, help='Events per account over the next two weeks')
+    parser.add_argument('--latency', type=float, default=0.02, help='Simulated Calendar latency per call (s)')
+    args = parser.parse_args()
+
+    _state['services'] = [make_service(a, args.events, args.latency) for a in range(args.accounts)]
+    _state['emails'] = [f'teacher{a}@example.com' for a in range(args.accounts)]
+    # Warm the shared caches (imports, event views, SQLite) in the parent, outside every measurement
+    registry = tenants.TenantRegistry(tempfile.mkdtemp(), load_credentials=lambda path: fakes.FakeCredentials())
+    with contextlib.redirect_stdout(io.StringIO()):
+        for email, service in zip(_state['emails'], _state['services']):
+            per_session(service, 1)
+            registry.login(email, fakes.FakeCredentials(refresh_token=email))
+            shared(registry, email, service, 1)
+            registry.logout(email)
+
+    context = multiprocessing.get_context('fork')
+    print(f"{'':<14}{'sessions':>9}{'cal calls':>12}{'KiB/session':>12}{'KiB/copy':>12}{'reruns/s':>12}")
+    for sessions in args.sessions:
+        for label in ("Per session", "Tenants"):
+            with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as pool:
+                label, n, calls, per_session_kib, per_state_kib, rate = \
+                    pool.submit(_measure, label, sessions, args).result()
+            print(f"{label:<14}{n:>9}{calls:>12}{per_session_kib:>12.1f}{per_state_kib:>12.1f}{rate:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
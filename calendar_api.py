@@ -1,68 +1,191 @@
-from googleapiclient.discovery import build
 import datetime
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import event_view
+import metrics
+import services
 
 def get_calendar_service(creds):
-    """Builds and returns the Calendar service."""
-    return build('calendar', 'v3', credentials=creds)
+    """Returns the shared Calendar service for these credentials."""
+    return services.get_service('calendar', 'v3', creds)
+
+# Day boundaries and displayed times use this timezone
+BUSINESS_TIMEZONE = os.environ.get('BUSINESS_TIMEZONE', 'America/New_York')
+_business_tz = None
+
+def business_timezone():
+    """The pytz timezone for BUSINESS_TIMEZONE, loaded on first use."""
+    global _business_tz
+    if _business_tz is None:
+        import pytz
+        _business_tz = pytz.timezone(BUSINESS_TIMEZONE)
+    return _business_tz
+
+def set_business_timezone(name):
+    """Switches the business timezone (an IANA name such as 'America/Chicago')."""
+    global BUSINESS_TIMEZONE, _business_tz
+    import pytz
+    tz = pytz.timezone(name)
+    BUSINESS_TIMEZONE, _business_tz = name, tz
 
-def get_upcoming_events(service, start_date=None, max_results=10):
+def day_bounds(start_date, end_date=None):
+    """
+    Returns (timeMin, timeMax) in UTC ISO format covering start_date..end_date
+    in the business timezone.
+    This ensures consistency between Local (EST) and Cloud (UTC) execution
+    """
+    tz = business_timezone()
+    
+    # Create start/end of day in the business timezone
+    start_dt_et = tz.localize(datetime.datetime.combine(start_date, datetime.time.min))
+    end_dt_et = tz.localize(datetime.datetime.combine(end_date or start_date, datetime.time.max))
+    
+    # Convert to UTC for API query
+    utc = datetime.timezone.utc
+    return start_dt_et.astimezone(utc).isoformat(), end_dt_et.astimezone(utc).isoformat()
+
+def list_all_pages(service, **params):
+    """
+    Runs events().list following nextPageToken until exhausted.
+    Returns (items, nextSyncToken).
+    """
+    return _all_pages(service.events(), params, 'calendar.events.list')
+
+def _all_pages(resource, params, stage):
+    items = []
+    page_token = None
+    while True:
+        if page_token:
+            params['pageToken'] = page_token
+        with metrics.span(stage, calendar=params.get('calendarId')):
+            result = resource.list(**params).execute()
+        items.extend(result.get('items', []))
+        page_token = result.get('nextPageToken')
+        if not page_token:
+            return items, result.get('nextSyncToken')
+
+def get_upcoming_events(service, start_date=None, max_results=10, end_date=None, calendar_id='primary'):
     """
     Gets upcoming events.
-    If start_date is provided, fetches events for that specific day (local time).
+    If start_date is provided, fetches events for that specific day (local time),
+    or for start_date..end_date inclusive when end_date is also given.
+    All result pages are fetched so busy days are not truncated.
     """
     if start_date:
-        # Create datetime range for the selected day in US/Eastern timezone
-        # This ensures consistency between Local (EST) and Cloud (UTC) execution
-        import datetime as dt
-        import pytz
-        
-        # Define target timezone
-        tz = pytz.timezone('America/New_York')
+        timeMin, timeMax = day_bounds(start_date, end_date)
         
-        # Create start/end of day in Eastern Time
-        start_dt_et = tz.localize(dt.datetime.combine(start_date, dt.time.min))
-        end_dt_et = tz.localize(dt.datetime.combine(start_date, dt.time.max))
-        
-        # Convert to UTC for API query
-        timeMin = start_dt_et.astimezone(pytz.UTC).isoformat()
-        timeMax = end_dt_et.astimezone(pytz.UTC).isoformat()
-        
-        print(f"Getting events for {start_date} (Timezone: America/New_York)")
-        events_result = service.events().list(calendarId='primary', 
-                                            timeMin=timeMin,
-                                            timeMax=timeMax,
-                                            singleEvents=True,
-                                            orderBy='startTime').execute()
+        if end_date and end_date != start_date:
+            print(f"Getting events for {start_date} to {end_date} (Timezone: {BUSINESS_TIMEZONE})")
+        else:
+            print(f"Getting events for {start_date} (Timezone: {BUSINESS_TIMEZONE})")
+        events, _ = list_all_pages(service, calendarId=calendar_id,
+                                   timeMin=timeMin,
+                                   timeMax=timeMax,
+                                   singleEvents=True,
+                                   orderBy='startTime')
+        event_view.build_views(events)
+        return events
     else:
         # Default behavior: 10 upcoming events from now
         now = datetime.datetime.utcnow().isoformat() + 'Z' 
         print(f"Getting the upcoming {max_results} events")
-        events_result = service.events().list(calendarId='primary', timeMin=now,
-                                            maxResults=max_results, singleEvents=True,
-                                            orderBy='startTime').execute()
+        with metrics.span('calendar.events.list', calendar=calendar_id):
+            events_result = service.events().list(calendarId=calendar_id, timeMin=now,
+                                                maxResults=max_results, singleEvents=True,
+                                                orderBy='startTime').execute()
                                             
     events = events_result.get('items', [])
+    event_view.build_views(events)
+    return events
+
+# Calendars that never hold appointments
+_SKIPPED_CALENDAR_SUFFIXES = ('#holiday@group.v.calendar.google.com', '#contacts@group.v.calendar.google.com',
+                              '#weeknum@group.v.calendar.google.com')
+
+def list_calendars(service):
+    """
+    The calendars on the account (calendarList), primary first. Holiday /
+    birthday feeds and calendars only shared as free/busy are left out.
+    """
+    items, _ = _all_pages(service.calendarList(), {'minAccessRole': 'reader'}, 'calendar.calendarList.list')
+    calendars = [c for c in items if not c['id'].endswith(_SKIPPED_CALENDAR_SUFFIXES)]
+    return sorted(calendars, key=lambda c: (not c.get('primary'), calendar_name(c).lower()))
+
+def calendar_name(calendar):
+    return calendar.get('summaryOverride') or calendar.get('summary') or calendar['id']
+
+def tag_event(event, calendar):
+    """
+    Marks an event with the calendar it came from. On a teacher's calendar
+    (anything but the primary one) the calendar name is the teacher name.
+    """
+    event['_calendar_id'] = calendar['id']
+    event['_calendar_name'] = calendar_name(calendar)
+    event['_teacher_name'] = None if calendar.get('primary') else calendar_name(calendar)
+    return event
+
+def event_teacher_name(event, default="Teacher"):
+    """The teacher name from the event's calendar, or default if it has none."""
+    return event.get('_teacher_name') or default
+
+def parse_event_time(value):
+    """Parses a Calendar start/end value into (aware datetime, all_day)."""
+    if 'dateTime' in value:
+        return datetime.datetime.fromisoformat(value['dateTime'].replace('Z', '+00:00')), False
+    day = datetime.date.fromisoformat(value['date'])
+    return business_timezone().localize(datetime.datetime.combine(day, datetime.time.min)), True
+
+def _start_ts(event):
+    return event_view.get_view(event).start_ts
+
+def merge_events(per_calendar):
+    """
+    Merges per-calendar event lists (each sorted by start) into one list
+    sorted by start. An event found on several calendars (e.g. a session on
+    the teacher's calendar with the center's account invited) is kept once,
+    preferring the copy that names a teacher.
+    """
+    merged = []
+    seen = {}
+    for event in heapq.merge(*per_calendar, key=_start_ts):
+        key = (event.get('iCalUID') or event.get('id'), event['start'].get('dateTime') or event['start'].get('date'))
+        if key in seen:
+            index = seen[key]
+            if event.get('_teacher_name') and not merged[index].get('_teacher_name'):
+                merged[index] = event
+            continue
+        seen[key] = len(merged)
+        merged.append(event)
+    return merged
+
+def get_events_for_calendars(service, calendars, start_date, end_date=None, max_workers=8):
+    """
+    Fetches start_date..end_date from several calendars concurrently and
+    returns one tagged, time-sorted list. A calendar that cannot be read is
+    reported and skipped.
+    """
+    timeMin, timeMax = day_bounds(start_date, end_date)
+
+    def _fetch(calendar):
+        try:
+            items, _ = list_all_pages(service, calendarId=calendar['id'], timeMin=timeMin, timeMax=timeMax,
+                                      singleEvents=True, orderBy='startTime')
+        except Exception as e:
+            print(f"Could not read calendar {calendar_name(calendar)}: {e}")
+            return []
+        return [tag_event(event, calendar) for event in items]
+
+    print(f"Getting events for {start_date} from {len(calendars)} calendars")
+    if not calendars:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(calendars)))) as pool:
+        per_calendar = list(pool.map(_fetch, calendars))
+    events = merge_events(per_calendar)
+    event_view.build_views(events)
     return events
 
 def format_event_dt(event):
-    """Formats event date/time for display."""
-    start = event['start'].get('dateTime', event['start'].get('date'))
-    end = event['end'].get('dateTime', event['end'].get('date'))
-    
-    try:
-        # Check if it's a full day event (YYYY-MM-DD pattern)
-        if 'T' not in start:
-            return f"{start} (All Day)"
-            
-        # Parse datetime strings
-        dt_start = datetime.datetime.fromisoformat(start)
-        dt_end = datetime.datetime.fromisoformat(end)
-        
-        # Format as HH:MM - HH:MM
-        # Using %I:%M%p for 12-hour format (e.g. 03:30PM)
-        start_str = dt_start.strftime('%I:%M%p')
-        end_str = dt_end.strftime('%I:%M%p')
-        
-        return f"{start_str} - {end_str}"
-    except:
-        return start
+    """Formats event date/time for display, e.g. '03:30PM - 04:20PM' in the business timezone."""
+    return event_view.get_view(event).display
@@ -0,0 +1,137 @@
+"""
+Incremental Calendar sync.
+
+The first sync() lists the calendar from time_min onwards, following
+pageToken, into a local event store and keeps the returned nextSyncToken.
+Later calls send only that syncToken and apply the changed / cancelled
+events, so a refresh costs one small delta request. If Google expires the
+token (HTTP 410) a full sync is done again.
+
+MultiCalendarSync keeps one CalendarSync per calendar (sharing one store)
+so adding or removing a calendar does not resync the others.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import calendar_api
+import event_store
+
+
+def _is_gone(error):
+    """True only for an HTTP 410 (expired sync token); the message text is not inspected."""
+    resp = getattr(error, 'resp', None)
+    status = getattr(resp, 'status', None) if resp is not None else getattr(error, 'status_code', None)
+    try:
+        return int(status) == 410
+    except (TypeError, ValueError):
+        return False
+
+
+class CalendarSync:
+    """Keeps an EventStore copy of one calendar up to date with syncToken deltas."""
+
+    def __init__(self, service, calendar_id='primary', time_min=None, store=None, calendar=None):
+        self.service = service
+        self.calendar_id = calendar_id
+        # calendarList entry; when given, stored events are tagged with it
+        self.calendar = calendar
+        self.time_min = time_min
+        self.store = store or event_store.EventStore()
+        self.sync_token = None
+        self._lock = threading.Lock()
+
+    def covers(self, start_date):
+        """True if the synced window includes start_date."""
+        return self.time_min is None or start_date >= self.time_min
+
+    def _tag(self, items):
+        if self.calendar:
+            for event in items:
+                calendar_api.tag_event(event, self.calendar)
+        return items
+
+    def _full_sync(self):
+        params = {'calendarId': self.calendar_id, 'singleEvents': True}
+        if self.time_min:
+            params['timeMin'] = calendar_api.day_bounds(self.time_min)[0]
+        items, sync_token = calendar_api.list_all_pages(self.service, **params)
+        self.store.replace_calendar(self._tag(items), self.calendar_id)
+        self.sync_token = sync_token
+        count = self.store.count(self.calendar_id)
+        print(f"Full calendar sync: {count} events")
+        return {'full': True, 'changed': count, 'removed': 0}
+
+    def _delta_sync(self):
+        items, sync_token = calendar_api.list_all_pages(
+            self.service, calendarId=self.calendar_id, singleEvents=True, syncToken=self.sync_token)
+        removed = sum(1 for e in items if e.get('status') == 'cancelled')
+        changed = len(items) - removed
+        self.store.upsert(self._tag(items), self.calendar_id)
+        self.sync_token = sync_token or self.sync_token
+        print(f"Delta calendar sync: {changed} changed, {removed} removed")
+        return {'full': False, 'changed': changed, 'removed': removed}
+
+    def sync(self):
+        """Brings the local store up to date. Returns a summary of what changed."""
+        with self._lock:
+            if not self.sync_token:
+                return self._full_sync()
+            try:
+                return self._delta_sync()
+            except Exception as e:
+                if not _is_gone(e):
+                    raise
+                print("Sync token expired, running full sync")
+                self.sync_token = None
+                return self._full_sync()
+
+    def get_events(self, start_date, end_date=None):
+        """Events starting within start_date..end_date from the local store, sorted by start time."""
+        return self.store.events_between(start_date, end_date, calendar_id=self.calendar_id)
+
+
+class MultiCalendarSync:
+    """CalendarSync for several calendars, synced concurrently and queried as one stream."""
+
+    def __init__(self, service, calendars=(), time_min=None, store=None, max_workers=8):
+        self.service = service
+        self.time_min = time_min
+        self.store = store or event_store.EventStore()
+        self.max_workers = max_workers
+        self.syncs = {}
+        self.set_calendars(calendars)
+
+    def set_calendars(self, calendars):
+        """Switches to these calendarList entries, keeping the synced state of ones already present."""
+        syncs = {}
+        for calendar in calendars:
+            sync = self.syncs.get(calendar['id'])
+            if sync is None:
+                sync = CalendarSync(self.service, calendar['id'], time_min=self.time_min, store=self.store,
+                                    calendar=calendar)
+            syncs[calendar['id']] = sync
+        for calendar_id in set(self.syncs) - set(syncs):
+            self.store.replace_calendar([], calendar_id)
+        self.syncs = syncs
+
+    def covers(self, start_date):
+        return self.time_min is None or start_date >= self.time_min
+
+    def sync(self):
+        """Syncs every calendar (delta where possible). Returns {calendar_id: summary or error}."""
+        def _sync(item):
+            calendar_id, sync = item
+            try:
+                return calendar_id, sync.sync()
+            except Exception as e:
+                print(f"Calendar sync failed for {calendar_id}: {e}")
+                return calendar_id, {'error': str(e)}
+
+        if not self.syncs:
+            return {}
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(self.syncs)))) as pool:
+            return dict(pool.map(_sync, list(self.syncs.items())))
+
+    def get_events(self, start_date, end_date=None):
+        """Events from all calendars, merged by start time and de-duplicated."""
+        return calendar_api.merge_events([sync.get_events(start_date, end_date) for sync in self.syncs.values()])
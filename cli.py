@@ -0,0 +1,237 @@
+"""
+Headless runner for confirmation emails, e.g. from cron:
+
+    # Write tomorrow's drafts for review
+    python cli.py --output drafts.json
+    # Send them after review (or generate + send in one go with --send)
+    python cli.py --send-file drafts.json --teacher-email teacher@example.com
+    # Plan the coming week, one draft per recurring series and one email per student
+    python cli.py --weeks 1 --digest --send
+
+Prints a JSON summary on stdout (progress logs go to stderr) and exits
+non-zero if any event failed to generate or send:
+0 = success, 1 = some events failed or a runtime error (e.g. an API
+error), 2 = setup error (auth, arguments, input file).
+Does not import Streamlit.
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import sys
+
+import agent
+import auth
+import batch
+import calendar_api
+import credential_manager
+import gmail_api
+import metrics
+import outbox
+import planner
+import replies
+
+EXIT_OK = 0
+EXIT_FAILURES = 1
+EXIT_SETUP = 2
+
+
+class SetupError(Exception):
+    """A problem with the arguments, credentials or input; exits with EXIT_SETUP."""
+
+
+def _date(value):
+    return datetime.date.fromisoformat(value)
+
+
+def parse_args(argv=None):
+    tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+    parser = argparse.ArgumentParser(description="Generate and send appointment confirmation emails.")
+    parser.add_argument('--start', type=_date, default=tomorrow, help='First day (YYYY-MM-DD), default tomorrow')
+    parser.add_argument('--end', type=_date, default=None, help='Last day (YYYY-MM-DD), default same as --start')
+    parser.add_argument('--calendar', action='append', dest='calendars', metavar='ID',
+                        help='Calendar to read (repeatable); default is the primary calendar')
+    parser.add_argument('--all-calendars', action='store_true', help="Read every calendar on the account")
+    parser.add_argument('--timezone', default=calendar_api.BUSINESS_TIMEZONE,
+                        help='Business timezone for day boundaries and times (default from BUSINESS_TIMEZONE)')
+    parser.add_argument('--weeks', type=int, default=None,
+                        help='Plan this many weeks from --start, one draft per recurring series (ignores --end)')
+    parser.add_argument('--digest', action='store_true',
+                        help="With --weeks: send each student one email per week instead of one per session")
+    parser.add_argument('--teacher-name', default='Teacher', help="Used for events that don't name a teacher")
+    parser.add_argument('--student-name', default='Student', help="Used for events that don't name a student")
+    parser.add_argument('--teacher-email', default='', help='Also send the teacher email to this address')
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent draft generation workers')
+    parser.add_argument('--rpm', type=int, default=None, help='Gemini requests per minute (0 = unlimited)')
+    parser.add_argument('--token', default='token.json', help='Authorized user token file')
+    parser.add_argument('--gemini-api-key', default=os.environ.get('GEMINI_API_KEY', ''))
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--send', action='store_true', help='Send instead of writing a dry-run file')
+    mode.add_argument('--send-file', help='Send the drafts from a reviewed dry-run file')
+    mode.add_argument('--check-replies', action='store_true', help='Record new [Y]/[N] replies and exit')
+    parser.add_argument('--output', default='drafts.json', help='Dry-run output file')
+    parser.add_argument('--summary', help='Also write the JSON summary to this file')
+    parser.add_argument('--metrics-file', help='Write per-stage latency metrics here (Prometheus text format)')
+    args = parser.parse_args(argv)
+    if args.digest and not (args.weeks or args.send_file):
+        parser.error("--digest needs --weeks (or --send-file with planned drafts)")
+    return args
+
+
+def _serialize(results):
+    # Planner results also carry the series and what was resolved for it (digests need them)
+    planned = ('series', 'teacher_name', 'student_name', 'fields')
+    return [dict({
+        'event': r['event'],
+        'student_email': batch.student_recipients(r['event']),
+        'student_draft': r['student_draft'],
+        'teacher_draft': r['teacher_draft'],
+        'error': r['error'],
+    }, **{key: r[key] for key in planned if key in r}) for r in results]
+
+
+def _summary(results, sent=False):
+    summary = {
+        'events': len(results),
+        'generated': sum(1 for r in results if not r.get('error')),
+        'generation_errors': [{'event_id': r['event'].get('id'), 'error': r['error']}
+                              for r in results if r.get('error')],
+    }
+    if sent:
+        summary['sent_student'] = sum(1 for r in results if r.get('student_sent'))
+        summary['sent_teacher'] = sum(1 for r in results if r.get('teacher_sent'))
+        # Claimed by another process's outbox worker and still in flight there
+        summary['send_pending'] = sum(1 for r in results if r.get('send_pending'))
+        summary['send_failures'] = [{'event_id': r['event'].get('id'), 'error': r['send_error']}
+                                    for r in results if r.get('send_error')]
+    return summary
+
+
+def select_calendars(calendar_service, args):
+    """calendarList entries chosen by --calendar / --all-calendars, or None for just the primary calendar."""
+    if not args.calendars and not args.all_calendars:
+        return None
+    calendars = calendar_api.list_calendars(calendar_service)
+    if args.all_calendars:
+        return calendars
+    by_id = {c['id']: c for c in calendars}
+    unknown = [c for c in args.calendars if c not in by_id]
+    if unknown:
+        raise SetupError(f"Unknown calendar(s): {', '.join(unknown)}")
+    return [by_id[c] for c in args.calendars]
+
+
+def run(args):
+    try:
+        creds = auth.load_token_credentials(args.token)
+    except Exception as e:
+        raise SetupError(f"Could not load credentials from {args.token}: {e}")
+    if not creds:
+        print(f"No usable credentials in {args.token}; authorize once via the Streamlit app.", file=sys.stderr)
+        return EXIT_SETUP, None
+    manager = credential_manager.CredentialManager(creds, token_path=args.token)
+    manager.start()
+
+    if args.gemini_api_key:
+        agent.configure_genai(args.gemini_api_key)
+    if args.timezone != calendar_api.BUSINESS_TIMEZONE:
+        calendar_api.set_business_timezone(args.timezone)
+
+    def progress(done, total, result):
+        print(f"[{done}/{total}] {result['event'].get('summary', 'Appointment')}: {result['error'] or 'ok'}",
+              file=sys.stderr)
+
+    if args.check_replies:
+        if not replies.available(creds):
+            print("Reply tracking needs REPLY_TRACKING=1 and a token granted gmail.readonly; "
+                  "re-authorize via the Streamlit app.", file=sys.stderr)
+            manager.stop()
+            return EXIT_SETUP, None
+        tracker = replies.get_tracker()
+        new = tracker.sync(gmail_api.get_gmail_service(creds))
+        manager.stop()
+        return EXIT_OK, {'new_replies': new, 'totals': tracker.counts()}
+
+    if args.send or args.send_file:
+        gmail_service = gmail_api.get_gmail_service(creds)
+        # Settle anything a previous run left half-sent before queueing more
+        # Without a read scope interrupted sends can't be looked up; they are marked delivery unknown
+        outbox.get_outbox().resume(gmail_service if outbox.can_verify(creds) else None,
+                                   min_age=outbox.STALE_SENDING)
+
+    if args.send_file:
+        try:
+            with open(args.send_file) as f:
+                results = [dict(item, error=item.get('error')) for item in json.load(f)]
+        except (OSError, ValueError) as e:
+            raise SetupError(f"Could not read {args.send_file}: {e}")
+        planner.send_plan(gmail_service, results, args.teacher_email, digest=args.digest)
+        summary = _summary(results, sent=True)
+    elif args.weeks:
+        calendar_service = calendar_api.get_calendar_service(creds)
+        events = planner.fetch_events(calendar_service, args.start, args.weeks,
+                                      calendars=select_calendars(calendar_service, args))
+        results = planner.plan(events, args.teacher_name, args.student_name, max_workers=args.workers,
+                               rpm=args.rpm, on_progress=progress)
+        if args.send:
+            planner.send_plan(gmail_service, results, args.teacher_email, digest=args.digest)
+        else:
+            with open(args.output, 'w') as f:
+                json.dump(_serialize(results), f, indent=2)
+        summary = _summary(results, sent=args.send)
+        summary['series'] = len({r['series'] for r in results})
+        if not args.send:
+            summary['output'] = args.output
+    elif args.send:
+        calendar_service = calendar_api.get_calendar_service(creds)
+        results = batch.run_batch(calendar_service, gmail_service, args.start, args.end, args.teacher_name,
+                                  args.student_name, args.teacher_email, max_workers=args.workers, rpm=args.rpm,
+                                  send=True, on_progress=progress,
+                                  calendars=select_calendars(calendar_service, args))
+        summary = _summary(results, sent=True)
+    else:
+        calendar_service = calendar_api.get_calendar_service(creds)
+        calendars = select_calendars(calendar_service, args)
+        if calendars:
+            events = calendar_api.get_events_for_calendars(calendar_service, calendars, args.start, args.end)
+        else:
+            events = calendar_api.get_upcoming_events(calendar_service, start_date=args.start, end_date=args.end)
+        results = batch.generate_drafts(events, args.teacher_name, args.student_name, max_workers=args.workers,
+                                        rpm=args.rpm, on_progress=progress)
+        with open(args.output, 'w') as f:
+            json.dump(_serialize(results), f, indent=2)
+        summary = _summary(results)
+        summary['output'] = args.output
+
+    manager.stop()
+    failed = summary['generation_errors'] or summary.get('send_failures')
+    return (EXIT_FAILURES if failed else EXIT_OK), summary
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        # Library progress output goes to stderr so stdout stays machine-readable
+        with contextlib.redirect_stdout(sys.stderr):
+            code, summary = run(args)
+    except SetupError as e:
+        print(f"Setup error: {e}", file=sys.stderr)
+        code, summary = EXIT_SETUP, {'error': str(e)}
+    except Exception as e:
+        # Runtime failures (API errors, ...) are failures, not setup problems, so cron can tell them apart
+        print(f"Error: {e}", file=sys.stderr)
+        code, summary = EXIT_FAILURES, {'error': str(e)}
+    if summary is not None:
+        text = json.dumps(summary, indent=2)
+        print(text)
+        if args.summary:
+            with open(args.summary, 'w') as f:
+                f.write(text)
+    if args.metrics_file:
+        metrics.write_prometheus(args.metrics_file)
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+Process-wide Google credential manager.
+
+Credentials are loaded once per process and refreshed by a background
+thread shortly before they expire, so token refresh stays off the request
+path. A lock makes sure only one thread (or Streamlit session) talks to the
+token endpoint at a time, and refreshed tokens are written back to
+token.json atomically.
+"""
+import datetime
+import os
+import tempfile
+import threading
+import time
+
+import metrics
+
+REFRESH_MARGIN = 300      # refresh this many seconds before expiry
+RETRY_INTERVAL = 30       # wait after a failed background refresh
+
+
+def write_token_atomically(path, creds):
+    """Writes creds.to_json() to path via a temp file + rename."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.token-', suffix='.json', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as token:
+            token.write(creds.to_json())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class CredentialManager:
+    """Holds one Credentials object and keeps it fresh."""
+
+    def __init__(self, creds, token_path=None, refresh_margin=REFRESH_MARGIN, clock=time.time):
+        self.creds = creds
+        self.token_path = token_path
+        self.refresh_margin = refresh_margin
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._metrics = {'refreshes': 0, 'failures': 0, 'last_latency': None, 'total_latency': 0.0,
+                         'last_error': None}
+
+    def seconds_to_expiry(self):
+        expiry = getattr(self.creds, 'expiry', None)
+        if expiry is None:
+            return None
+        # google-auth stores expiry as a naive UTC datetime
+        now = datetime.datetime.fromtimestamp(self.clock(), datetime.timezone.utc).replace(tzinfo=None)
+        return (expiry - now).total_seconds()
+
+    def _needs_refresh(self):
+        remaining = self.seconds_to_expiry()
+        if remaining is None:
+            return not self.creds.valid
+        return remaining <= self.refresh_margin
+
+    def refresh(self, force=False):
+        """
+        Refreshes the token if it is close to expiry (or force=True).
+        Concurrent callers wait for the one refresh in progress instead of
+        issuing their own. Returns True if the credentials are usable.
+        """
+        with self._lock:
+            if not force and not self._needs_refresh():
+                return True
+            if not getattr(self.creds, 'refresh_token', None):
+                return self.creds.valid
+            from google.auth.transport.requests import Request
+            start = time.perf_counter()
+            try:
+                with metrics.span('auth.refresh'):
+                    self.creds.refresh(Request())
+            except Exception as e:
+                self._metrics['failures'] += 1
+                self._metrics['last_error'] = str(e)
+                print(f"Token refresh failed: {e}")
+                return self.creds.valid
+            latency = time.perf_counter() - start
+            self._metrics['refreshes'] += 1
+            self._metrics['last_latency'] = latency
+            self._metrics['total_latency'] += latency
+            self._metrics['last_error'] = None
+            if self.token_path:
+                try:
+                    write_token_atomically(self.token_path, self.creds)
+                except Exception as e:
+                    print(f"Could not save refreshed token: {e}")
+            return True
+
+    def get(self):
+        """Returns valid credentials, refreshing inline only if the background thread fell behind."""
+        if not self.creds.valid:
+            if not self.refresh(force=True) or not self.creds.valid:
+                return None
+        return self.creds
+
+    def start(self):
+        """Starts the background refresh thread (idempotent)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='credential-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5)
+
+    def _run(self):
+        while not self._stop.is_set():
+            remaining = self.seconds_to_expiry()
+            if remaining is None:
+                wait = 60
+            else:
+                wait = max(0, remaining - self.refresh_margin)
+            if wait > 0 and self._stop.wait(wait):
+                return
+            self.refresh()
+            # Still due means the refresh failed; back off before retrying
+            if self._needs_refresh() and self._stop.wait(RETRY_INTERVAL):
+                return
+
+    def metrics(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics['avg_latency'] = metrics['total_latency'] / metrics['refreshes'] if metrics['refreshes'] else None
+        metrics['seconds_to_expiry'] = self.seconds_to_expiry()
+        return metrics
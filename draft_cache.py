@@ -0,0 +1,186 @@
+"""
+Persistent cache for Gemini-generated content (drafts and extracted fields).
+
+Entries are keyed by a hash of the normalized prompt inputs plus the model
+name, expire after a TTL, and are evicted least-recently-used once the
+cache grows past max_entries. When an event's `updated` timestamp changes,
+every entry for that event is dropped.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+
+DEFAULT_PATH = os.environ.get('DRAFT_CACHE_PATH', 'draft_cache.sqlite3')
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 5000
+ENABLED = os.environ.get('DRAFT_CACHE', '1') != '0'
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def make_key(kind, inputs, model_name):
+    """Content hash of the normalized inputs for one generation."""
+    payload = json.dumps({'kind': kind, 'model': model_name, 'inputs': _normalize(inputs)}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class DraftCache:
+    """SQLite-backed TTL + LRU cache."""
+
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS drafts (
+                key TEXT PRIMARY KEY,
+                event_id TEXT,
+                updated TEXT,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_drafts_event ON drafts(event_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_drafts_access ON drafts(last_access)")
+        self._conn.commit()
+
+    def _invalidate_stale(self, event_id, updated):
+        # A newer (or different) `updated` means the event changed
+        if event_id:
+            self._conn.execute("DELETE FROM drafts WHERE event_id = ? AND updated IS NOT ?", (event_id, updated))
+
+    def get(self, key, event_id=None, updated=None):
+        now = time.time()
+        with self._lock:
+            self._invalidate_stale(event_id, updated)
+            row = self._conn.execute("SELECT value, created_at FROM drafts WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM drafts WHERE key = ?", (key,))
+                row = None
+            if row:
+                self._conn.execute("UPDATE drafts SET last_access = ? WHERE key = ?", (now, key))
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._conn.commit()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, value, event_id=None, updated=None):
+        now = time.time()
+        with self._lock:
+            self._invalidate_stale(event_id, updated)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO drafts (key, event_id, updated, value, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, event_id, updated, json.dumps(value), now, now))
+            count = self._conn.execute("SELECT COUNT(*) FROM drafts").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM drafts WHERE key IN (SELECT key FROM drafts ORDER BY last_access LIMIT ?)",
+                    (count - self.max_entries,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM drafts")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM drafts").fetchone()[0]
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'size': size,
+                'hit_rate': self.hits / total if total else 0.0}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Process-wide cache instance."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DraftCache()
+        return _cache
+
+
+def cached(kind, event_details, inputs, model_name, fn):
+    """
+    Returns the cached value for these inputs, or calls fn() and stores it.
+    Values that look like errors are not cached.
+    """
+    if not ENABLED:
+        return fn()
+    cache = get_cache()
+    event_id = event_details.get('id')
+    updated = event_details.get('updated')
+    key = make_key(kind, dict(inputs, updated=updated), model_name)
+    value = cache.get(key, event_id, updated)
+    metrics.inc('cache_requests_total', cache=f'gemini_{kind}', result='miss' if value is None else 'hit')
+    if value is not None:
+        return value
+    value = fn()
+    if not (isinstance(value, str) and value.startswith("Error generating email")):
+        cache.put(key, value, event_id, updated)
+    return value
+
+
+async def cached_async(kind, event_details, inputs, model_name, coro_fn):
+    """cached() for coroutines: awaits coro_fn() on a miss."""
+    if not ENABLED:
+        return await coro_fn()
+    cache = get_cache()
+    event_id = event_details.get('id')
+    updated = event_details.get('updated')
+    key = make_key(kind, dict(inputs, updated=updated), model_name)
+    value = cache.get(key, event_id, updated)
+    metrics.inc('cache_requests_total', cache=f'gemini_{kind}', result='miss' if value is None else 'hit')
+    if value is not None:
+        return value
+    value = await coro_fn()
+    if not (isinstance(value, str) and value.startswith("Error generating email")):
+        cache.put(key, value, event_id, updated)
+    return value
+
+
+def cached_stream(kind, event_details, inputs, model_name, gen_fn):
+    """
+    cached() for generators: yields the cached value on a hit, otherwise
+    everything gen_fn() yields, storing the last value once it finishes.
+    """
+    if not ENABLED:
+        yield from gen_fn()
+        return
+    cache = get_cache()
+    event_id = event_details.get('id')
+    updated = event_details.get('updated')
+    key = make_key(kind, dict(inputs, updated=updated), model_name)
+    value = cache.get(key, event_id, updated)
+    metrics.inc('cache_requests_total', cache=f'gemini_{kind}', result='miss' if value is None else 'hit')
+    if value is not None:
+        yield value
+        return
+    for value in gen_fn():
+        yield value
+    if value is not None:
+        cache.put(key, value, event_id, updated)
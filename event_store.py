@@ -0,0 +1,166 @@
+"""
+Local SQLite store of Calendar events for fast range / attendee / teacher
+queries.
+
+Rows keep the raw event JSON plus the start/end as UTC epoch seconds, so
+range queries hit the start-time index instead of the Calendar API. The
+EventView of each event is built when it is stored, so events read back
+from the store find their parsed times and display strings in the view
+cache.
+"""
+import datetime
+import json
+import sqlite3
+import threading
+
+import calendar_api
+import event_view
+
+
+class EventStore:
+    """SQLite-backed event store, safe to share between threads."""
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS events (
+                id TEXT NOT NULL,
+                calendar_id TEXT NOT NULL,
+                start_ts REAL NOT NULL,
+                end_ts REAL NOT NULL,
+                all_day INTEGER NOT NULL,
+                organizer TEXT,
+                updated TEXT,
+                data TEXT NOT NULL,
+                PRIMARY KEY (calendar_id, id)
+            );
+            CREATE TABLE IF NOT EXISTS attendees (
+                calendar_id TEXT NOT NULL,
+                event_id TEXT NOT NULL,
+                email TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_events_start ON events(start_ts);
+            CREATE INDEX IF NOT EXISTS idx_events_calendar ON events(calendar_id, start_ts);
+            CREATE INDEX IF NOT EXISTS idx_events_organizer ON events(organizer);
+            CREATE INDEX IF NOT EXISTS idx_attendees_email ON attendees(email);
+            CREATE INDEX IF NOT EXISTS idx_attendees_event ON attendees(calendar_id, event_id);
+        """)
+        self._conn.commit()
+
+    def _delete(self, calendar_id, event_id):
+        self._conn.execute("DELETE FROM events WHERE calendar_id = ? AND id = ?", (calendar_id, event_id))
+        self._conn.execute("DELETE FROM attendees WHERE calendar_id = ? AND event_id = ?", (calendar_id, event_id))
+
+    def _insert(self, calendar_id, event):
+        """Stores one event; False (and any older copy removed) if its start/end can't be parsed."""
+        view = event_view.get_view(event)
+        self._delete(calendar_id, event['id'])
+        if view.start is None:
+            return False
+        self._conn.execute(
+            "INSERT INTO events (id, calendar_id, start_ts, end_ts, all_day, organizer, updated, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (event['id'], calendar_id, view.start_ts, view.end.timestamp(), int(view.all_day),
+             ((event.get('organizer') or {}).get('email') or '').lower() or None, event.get('updated'), json.dumps(event)))
+        self._conn.executemany(
+            "INSERT INTO attendees (calendar_id, event_id, email) VALUES (?, ?, ?)",
+            [(calendar_id, event['id'], a['email'].lower()) for a in event.get('attendees', []) if a.get('email')])
+        return True
+
+    @staticmethod
+    def _report_skipped(skipped, calendar_id):
+        if skipped:
+            print(f"Event store: skipped {skipped} event(s) without a parseable start/end in {calendar_id}")
+        return skipped
+
+    def upsert(self, events, calendar_id='primary'):
+        """
+        Inserts or replaces events. Cancelled events are removed. Returns the
+        number of events skipped because their start/end can't be parsed.
+        """
+        skipped = 0
+        # One transaction: committed on success, rolled back if anything raises
+        with self._lock, self._conn:
+            for event in events:
+                if event.get('status') == 'cancelled':
+                    self._delete(calendar_id, event['id'])
+                elif not self._insert(calendar_id, event):
+                    skipped += 1
+        return self._report_skipped(skipped, calendar_id)
+
+    def replace_calendar(self, events, calendar_id='primary'):
+        """
+        Replaces every stored event of a calendar (used after a full sync),
+        atomically: on an error the previous events stay. Returns the number
+        of events skipped because their start/end can't be parsed.
+        """
+        skipped = 0
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM events WHERE calendar_id = ?", (calendar_id,))
+            self._conn.execute("DELETE FROM attendees WHERE calendar_id = ?", (calendar_id,))
+            for event in events:
+                if event.get('status') != 'cancelled' and not self._insert(calendar_id, event):
+                    skipped += 1
+        return self._report_skipped(skipped, calendar_id)
+
+    def remove(self, event_id, calendar_id='primary'):
+        with self._lock:
+            self._delete(calendar_id, event_id)
+            self._conn.commit()
+
+    def get(self, event_id, calendar_id='primary'):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM events WHERE calendar_id = ? AND id = ?", (calendar_id, event_id)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def count(self, calendar_id=None):
+        with self._lock:
+            if calendar_id:
+                return self._conn.execute("SELECT COUNT(*) FROM events WHERE calendar_id = ?", (calendar_id,)).fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    def _query(self, sql, params):
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    @staticmethod
+    def _bounds(start_date, end_date):
+        time_min, time_max = calendar_api.day_bounds(start_date, end_date)
+        return (datetime.datetime.fromisoformat(time_min).timestamp(),
+                datetime.datetime.fromisoformat(time_max).timestamp())
+
+    def events_between(self, start_date, end_date=None, calendar_id=None):
+        """Events starting within start_date..end_date (business timezone days), by start time."""
+        lo, hi = self._bounds(start_date, end_date)
+        if calendar_id:
+            return self._query(
+                "SELECT data FROM events WHERE calendar_id = ? AND start_ts BETWEEN ? AND ? ORDER BY start_ts",
+                (calendar_id, lo, hi))
+        return self._query("SELECT data FROM events WHERE start_ts BETWEEN ? AND ? ORDER BY start_ts", (lo, hi))
+
+    def events_for_attendee(self, email, start_date=None, end_date=None):
+        """Events an attendee is invited to, optionally limited to a date range."""
+        sql = ("SELECT e.data FROM attendees a JOIN events e "
+               "ON e.calendar_id = a.calendar_id AND e.id = a.event_id WHERE a.email = ?")
+        params = [email.lower()]
+        if start_date:
+            lo, hi = self._bounds(start_date, end_date)
+            sql += " AND e.start_ts BETWEEN ? AND ?"
+            params += [lo, hi]
+        return self._query(sql + " ORDER BY e.start_ts", params)
+
+    def events_for_teacher(self, teacher, start_date=None, end_date=None):
+        """
+        Events for a teacher, identified by their calendar id or organizer email.
+        """
+        sql = "SELECT data FROM events WHERE (calendar_id = ? OR organizer = ?)"
+        params = [teacher, teacher.lower()]
+        if start_date:
+            lo, hi = self._bounds(start_date, end_date)
+            sql += " AND start_ts BETWEEN ? AND ?"
+            params += [lo, hi]
+        return self._query(sql + " ORDER BY start_ts", params)
@@ -0,0 +1,107 @@
+"""
+Normalized, read-only view of a Calendar event.
+
+Event dicts from the API carry start/end as strings. EventView parses them
+once into timezone-aware datetimes in the business timezone and keeps the
+strings every screen and template needs (radio label, student / teacher
+dates, time range). Views are cached by the event's id, `updated` stamp and
+start/end, so the same event fetched again (a rerun, a store query) reuses
+its view instead of parsing again.
+"""
+import collections
+import threading
+
+import calendar_api
+import metrics
+
+CACHE_SIZE = 4096
+
+_cache = collections.OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _short_time(dt):
+    """Formats a datetime as e.g. 3:30pm."""
+    value = dt.strftime('%I:%M%p').lower()
+    return value[1:] if value.startswith('0') else value
+
+
+class EventView:
+    """Parsed start/end, all-day flag, attendees and display strings for one event."""
+
+    __slots__ = ('id', 'calendar_id', 'summary', 'start', 'end', 'all_day', 'attendees', 'start_ts',
+                 'display', 'time_range', '_raw_start', '_dates')
+
+    def __init__(self, event, tz=None):
+        tz = tz or calendar_api.business_timezone()
+        self.id = event.get('id')
+        self.calendar_id = event.get('_calendar_id')
+        self.summary = event.get('summary', 'Appointment')
+        self.attendees = tuple(a['email'] for a in event.get('attendees', []) if a.get('email'))
+        self._raw_start = event['start'].get('dateTime', event['start'].get('date'))
+        self._dates = {}
+        try:
+            start, self.all_day = calendar_api.parse_event_time(event['start'])
+            end, _ = calendar_api.parse_event_time(event['end'])
+        except (KeyError, ValueError):
+            # Unparseable times are shown as they came
+            self.start = self.end = None
+            self.all_day = False
+            self.start_ts = 0.0
+            self.display = self.time_range = self._raw_start
+            return
+        self.start = start.astimezone(tz)
+        self.end = end.astimezone(tz)
+        self.start_ts = start.timestamp()
+        if self.all_day:
+            self.display = f"{self._raw_start} (All Day)"
+            self.time_range = "All Day"
+        else:
+            self.display = f"{self.start.strftime('%I:%M%p')} - {self.end.strftime('%I:%M%p')}"
+            self.time_range = f"{_short_time(self.start)} - {_short_time(self.end)}"
+
+    def date(self, date_format):
+        """The start date in date_format (memoized per format); all-day events keep the raw date."""
+        value = self._dates.get(date_format)
+        if value is None:
+            if self.start is None or self.all_day:
+                value = self._raw_start
+            else:
+                value = self.start.strftime(date_format)
+            self._dates[date_format] = value
+        return value
+
+
+def get_view(event):
+    """The cached EventView for an event dict, building it on first use."""
+    tz = calendar_api.business_timezone()
+    updated = event.get('updated')
+    if not updated:
+        # Without an `updated` stamp a changed event could not be told apart
+        return EventView(event, tz)
+    key = (event.get('id'), event.get('_calendar_id'), updated, str(event.get('start')), str(event.get('end')),
+           str(tz))
+    with _cache_lock:
+        view = _cache.get(key)
+        if view is not None:
+            _cache.move_to_end(key)
+    if view is not None:
+        metrics.inc('cache_requests_total', cache='event_view', result='hit')
+        return view
+    metrics.inc('cache_requests_total', cache='event_view', result='miss')
+    view = EventView(event, tz)
+    with _cache_lock:
+        _cache[key] = view
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return view
+
+
+def build_views(events):
+    """Builds (or reuses) the views for a freshly fetched list of events."""
+    return [get_view(event) for event in events]
+
+
+def clear():
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,256 @@
+"""
+Local extraction of who and what an event is about: student, teacher,
+session type and subject.
+
+Sources, strongest first:
+- explicit description lines ("Student: Kevin", "Teacher: Andy",
+  "Type: Online", "Subject: SAT Math"; see templates.extract_fields)
+- the teacher calendar the event came from (calendar_api.tag_event)
+- the roster: a CSV of people (name, email, role, aliases, subject)
+  indexed in memory by email and by name / alias, matched against the
+  attendees and the words of the summary
+- summary conventions such as "SAT Math - Kevin" or "Kevin with Andy"
+- attendee display names
+
+Results are memoized per event id and `updated` stamp (and roster
+version), so a batch run or a rerun extracts each event once. Anything
+still missing is left as None for the caller's default or for Gemini.
+"""
+import collections
+import csv
+import os
+import re
+import threading
+
+import metrics
+import templates
+
+ROSTER_PATH = os.environ.get('ROSTER_PATH', 'roster.csv')
+CACHE_SIZE = 4096
+
+STUDENT = 'student'
+TEACHER = 'teacher'
+
+_STUDENT_LINE = re.compile(r'^\s*(?:student|student name)\s*[:\-]\s*(.+?)\s*$', re.I | re.M)
+_TEACHER_LINE = re.compile(r'^\s*(?:teacher|tutor|instructor)\s*[:\-]\s*(.+?)\s*$', re.I | re.M)
+# Summary separators: "SAT Math - Kevin", "Kevin | Algebra", "Kevin / Andy", "Kevin (SAT Math)"
+_SEPARATORS = re.compile(r'\s+[-–—|/]\s+|\s*:\s+|\s*[()\[\]]\s*')
+_WITH = re.compile(r'^(.+?)\s+(?:with|w/)\s+(?:(?:mr|ms|mrs|dr|teacher)\.?\s+)?(.+)$', re.I)
+_NAME = re.compile(r"^[A-Z][a-zA-Z'\-]+(?:\s+[A-Z][a-zA-Z'\-]+){0,2}$")
+_SUBJECT_WORDS = re.compile(
+    r'\b(?:sat|act|psat|ap|ib|gre|toefl|ielts|math|algebra|geometry|calculus|pre-?calc|statistics|physics|'
+    r'chemistry|biology|science|english|reading|writing|essay|grammar|history|korean|spanish|chinese|french|'
+    r'coding|python|java|computer)\b', re.I)
+_GENERIC = re.compile(r'^(?:tutoring|session|lesson|class|appointment|meeting|online|in[\s-]?person|zoom|'
+                      r'type|subject|student|teacher|tutor)$', re.I)
+
+
+def _normalize(name):
+    return " ".join(re.sub(r"[^\w\s'-]", " ", name.lower()).split())
+
+
+class Roster:
+    """People indexed by email and by (normalized) name, aliases and unique first names."""
+
+    def __init__(self, people=()):
+        self.people = []
+        self.by_email = {}
+        self.by_name = {}
+        self.version = 0
+        self.load(people)
+
+    def load(self, people):
+        """Replaces the roster with people: dicts with name, email, role, aliases, subject."""
+        by_email, by_name, first_names = {}, {}, collections.defaultdict(list)
+        people = [self._clean(p) for p in people if (p.get('name') or '').strip()]
+        for person in people:
+            for email in person['emails']:
+                by_email[email] = person
+            for alias in [person['name']] + person['aliases']:
+                by_name[_normalize(alias)] = person
+            first_names[_normalize(person['name']).split(' ')[0]].append(person)
+        for first, matches in first_names.items():
+            # Only first names that point at one person
+            if len(matches) == 1:
+                by_name.setdefault(first, matches[0])
+        self.people, self.by_email, self.by_name = people, by_email, by_name
+        self.version += 1
+
+    @staticmethod
+    def _clean(row):
+        role = (row.get('role') or STUDENT).strip().lower()
+        return {
+            'name': row['name'].strip(),
+            'emails': [e.strip().lower() for e in re.split(r'[;,]', row.get('email') or '') if e.strip()],
+            'role': TEACHER if role in (TEACHER, 'tutor', 'instructor') else STUDENT,
+            'aliases': [a.strip() for a in re.split(r'[;,]', row.get('aliases') or '') if a.strip()],
+            'subject': (row.get('subject') or '').strip() or None,
+        }
+
+    def by_address(self, email):
+        return self.by_email.get((email or '').strip().lower())
+
+    def find_in_text(self, text):
+        """People named in text (longest match first, each once), by role."""
+        words = _normalize(text).split()
+        found = []
+        i = 0
+        while i < len(words):
+            for size in (3, 2, 1):
+                person = self.by_name.get(" ".join(words[i:i + size])) if i + size <= len(words) else None
+                if person is not None:
+                    if person not in found:
+                        found.append(person)
+                    i += size
+                    break
+            else:
+                i += 1
+        return found
+
+
+class _RosterFile:
+    """The roster at ROSTER_PATH, reloaded when the file changes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.roster = Roster()
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        with self._lock:
+            if mtime != self._mtime:
+                self._mtime = mtime
+                people = []
+                if mtime is not None:
+                    with open(self.path, newline='', encoding='utf-8') as f:
+                        people = list(csv.DictReader(f))
+                self.roster.load(people)
+                _clear_cache()
+            return self.roster
+
+
+_roster_file = _RosterFile(ROSTER_PATH)
+_cache = collections.OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_roster():
+    """The process-wide roster (empty if there is no roster file)."""
+    return _roster_file.get()
+
+
+def save_roster(data):
+    """Replaces the roster file with CSV bytes (e.g. an upload) and reloads it."""
+    tmp_path = f"{_roster_file.path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, _roster_file.path)
+    return get_roster()
+
+
+def _summary_parts(summary):
+    """(people-ish parts, subject-ish parts, teacher from "X with Y") from the summary."""
+    names, subjects, teacher = [], [], None
+    for part in _SEPARATORS.split(summary.strip().split('\n')[0]):
+        part = part.strip(" ()[]")
+        if not part or _GENERIC.match(part):
+            continue
+        match = _WITH.match(part)
+        if match:
+            part, teacher = match.group(1).strip(), match.group(2).strip()
+        if _SUBJECT_WORDS.search(part):
+            subjects.append(part)
+        elif _NAME.match(part):
+            names.append(part)
+    return names, subjects, teacher
+
+
+def _extract(event, roster):
+    summary = event.get('summary', '') or ''
+    description = event.get('description', '') or ''
+    fields = templates.extract_fields(event)
+    info = {'student': None, 'teacher': None, 'student_email': None, 'teacher_email': None,
+            'type': fields['type'], 'subject': fields['subject']}
+
+    match = _STUDENT_LINE.search(description)
+    if match:
+        info['student'] = match.group(1)
+    match = _TEACHER_LINE.search(description)
+    if match:
+        info['teacher'] = match.group(1)
+    info['teacher'] = info['teacher'] or event.get('_teacher_name')
+
+    # Roster: attendees by email, then names in the summary
+    people = [p for p in (roster.by_address(a.get('email')) for a in event.get('attendees', [])) if p]
+    people += [p for p in roster.find_in_text(summary) if p not in people]
+    for person in people:
+        role = person['role']
+        if info[role] is None:
+            info[role] = person['name']
+        if info[f'{role}_email'] is None and person['emails']:
+            info[f'{role}_email'] = person['emails'][0]
+        info['subject'] = info['subject'] or person['subject']
+
+    names, subjects, teacher = _summary_parts(summary)
+    info['teacher'] = info['teacher'] or teacher
+    if info['student'] is None:
+        names = [n for n in names if _normalize(n) != _normalize(info['teacher'] or '')]
+        info['student'] = names[0] if names else None
+    if info['subject'] is None and subjects:
+        info['subject'] = subjects[0]
+
+    if info['student'] is None:
+        # An attendee who is not staff, by display name
+        for attendee in event.get('attendees', []):
+            person = roster.by_address(attendee.get('email'))
+            if not attendee.get('self') and not attendee.get('organizer') and attendee.get('displayName') and \
+                    (person is None or person['role'] == STUDENT):
+                info['student'] = attendee['displayName']
+                break
+    return info
+
+
+def extract(event):
+    """
+    {'student', 'teacher', 'student_email', 'teacher_email', 'type',
+    'subject'} for an event; values that could not be found are None.
+    """
+    roster = get_roster()
+    updated = event.get('updated')
+    if not updated:
+        return _extract(event, roster)
+    key = (event.get('id'), event.get('_calendar_id'), updated, roster.version)
+    with _cache_lock:
+        info = _cache.get(key)
+        if info is not None:
+            _cache.move_to_end(key)
+    metrics.inc('cache_requests_total', cache='extraction', result='miss' if info is None else 'hit')
+    if info is None:
+        info = _extract(event, roster)
+        with _cache_lock:
+            _cache[key] = info
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+    return dict(info)
+
+
+def extract_fields(event):
+    """templates.extract_fields plus the roster and summary rules: {'type', 'subject'}."""
+    info = extract(event)
+    return {'type': info['type'], 'subject': info['subject']}
+
+
+def resolve_names(event, teacher_name="Teacher", student_name="Student"):
+    """(teacher, student) for the drafts, falling back to the given defaults."""
+    info = extract(event)
+    return info['teacher'] or teacher_name, info['student'] or student_name
+
+
+def _clear_cache():
+    with _cache_lock:
+        _cache.clear()
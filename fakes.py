@@ -0,0 +1,471 @@
+"""
+In-process fakes for the Google / Gemini clients, used by the bench_*.py
+scripts to exercise the real code paths without network access.
+"""
+import asyncio
+import base64
+import datetime
+import email
+import json
+import random
+import threading
+import time
+
+
+def _delay(latency, jitter, rng):
+    """latency, spread uniformly by +/- jitter (a fraction of it)."""
+    if jitter and latency:
+        return rng.uniform(latency * (1 - jitter), latency * (1 + jitter))
+    return latency
+
+
+def _inject(rng, error_rate, throttle_rate):
+    """Draws an injected failure: 429, 500 or None."""
+    if throttle_rate and rng.random() < throttle_rate:
+        return 429
+    if error_rate and rng.random() < error_rate:
+        return 500
+    return None
+
+
+class FakeResponse:
+    """Minimal stand-in for a Gemini GenerateContentResponse."""
+
+    def __init__(self, text, prompt=''):
+        self.text = text
+        part = type('Part', (), {'text': text})()
+        content = type('Content', (), {'parts': [part]})()
+        self.candidates = [type('Candidate', (), {'content': content, 'finish_reason': 1})()]
+        self.usage_metadata = type('Usage', (), {'prompt_token_count': len(prompt) // 4,
+                                                 'candidates_token_count': len(text) // 4})()
+
+
+class FakeModel:
+    """
+    Stands in for genai.GenerativeModel.
+
+    latency: seconds slept per call, spread by +/- jitter (a fraction).
+    schedule: optional iterable of booleans/status codes consumed one per call;
+        429 / 503 (or True, meaning 429) raise a throttle error for that call.
+    throttle_rate / error_rate: chance of a random 429 / 500 per call.
+    reply: text returned, or a callable taking the prompt.
+    """
+
+    def __init__(self, model_name='fake-model', latency=0.0, schedule=None, reply="Type: Online\nSubject: Math",
+                 jitter=0.0, throttle_rate=0.0, error_rate=0.0, seed=0, **kwargs):
+        self.model_name = model_name
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.reply = reply
+        self._schedule = iter(schedule) if schedule is not None else None
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self.calls = 0
+        self.throttled = 0
+        self.errors = 0
+
+    def _next_status(self):
+        """(injected status or None, latency) for the next call."""
+        with self._lock:
+            self.calls += 1
+            status = next(self._schedule, None) if self._schedule is not None else None
+            if status is True:
+                status = 429
+            status = status if status in (429, 503) else _inject(self._random, self.error_rate, self.throttle_rate)
+            if status in (429, 503):
+                self.throttled += 1
+            elif status:
+                self.errors += 1
+            return status, _delay(self.latency, self.jitter, self._random)
+
+    def _reply(self, status, prompt):
+        if status in (429, 503):
+            raise Exception(f"{status} Resource has been exhausted (e.g. check quota).")
+        if status:
+            raise Exception(f"{status} An internal error has occurred.")
+        text = self.reply(prompt) if callable(self.reply) else self.reply
+        return FakeResponse(text, prompt)
+
+    def generate_content(self, prompt, **kwargs):
+        status, latency = self._next_status()
+        if latency:
+            time.sleep(latency)
+        return self._reply(status, prompt)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        status, latency = self._next_status()
+        if latency:
+            await asyncio.sleep(latency)
+        return self._reply(status, prompt)
+
+
+class FakeCredentials:
+    """Stands in for google.oauth2.credentials.Credentials: always valid, never expires."""
+
+    def __init__(self, refresh_token='fake-refresh-token', token='fake-token'):
+        self.refresh_token = refresh_token
+        self.token = token
+        self.valid = True
+        self.expired = False
+        self.expiry = None
+
+    def refresh(self, request):
+        pass
+
+    def to_json(self):
+        return json.dumps({'token': self.token, 'refresh_token': self.refresh_token})
+
+
+class FakeHttpError(Exception):
+    """Mimics googleapiclient.errors.HttpError's `resp.status`."""
+
+    def __init__(self, status, message=''):
+        super().__init__(f"<HttpError {status}: {message}>")
+        self.resp = type('Resp', (), {'status': status})()
+        self.status_code = status
+
+
+class _FakeRequest:
+    """Deferred call; execute() is one simulated HTTP round trip."""
+
+    def __init__(self, fn, latency=0.0, service=None):
+        self._fn = fn
+        self._latency = latency
+        self._service = service
+
+    def execute(self, *args, **kwargs):
+        if self._service is not None:
+            self._service._round_trip()
+        elif self._latency:
+            time.sleep(self._latency)
+        return self._fn()
+
+
+class _FakeEventsResource:
+    def __init__(self, service):
+        self._service = service
+
+    def list(self, **params):
+        return _FakeRequest(lambda: self._service._list(params), service=self._service)
+
+
+class _FakeCalendarListResource:
+    def __init__(self, service):
+        self._service = service
+
+    def list(self, **params):
+        return _FakeRequest(lambda: {'items': [dict(c) for c in self._service.calendars]}, service=self._service)
+
+
+class FakeCalendarService:
+    """
+    In-memory Calendar v3 service supporting events().list with paging,
+    timeMin/timeMax filtering and syncToken deltas (including 410 when a
+    token has been expired with expire_sync_tokens()), and calendarList().list.
+
+    calendars: calendarList entries; events are added to one of them with
+    put_event(event, calendar_id). Default is a single primary calendar.
+    Each call sleeps latency (+/- jitter) and fails with a random 429 / 500
+    at throttle_rate / error_rate.
+    """
+
+    def __init__(self, events=(), page_size=50, latency=0.0, calendars=None, jitter=0.0, throttle_rate=0.0,
+                 error_rate=0.0, seed=0):
+        self.page_size = page_size
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self.calendars = calendars or [{'id': 'primary', 'summary': 'me@example.com', 'primary': True,
+                                        'accessRole': 'owner'}]
+        self.list_calls = 0
+        self._lock = threading.Lock()
+        self._version = 0
+        self._min_valid_version = 0
+        self._events = {}
+        for event in events:
+            self.put_event(event)
+
+    def events(self):
+        return _FakeEventsResource(self)
+
+    def _round_trip(self):
+        with self._lock:
+            status = _inject(self._random, self.error_rate, self.throttle_rate)
+            latency = _delay(self.latency, self.jitter, self._random)
+        if latency:
+            time.sleep(latency)
+        if status:
+            raise FakeHttpError(status, 'Rate Limit Exceeded' if status == 429 else 'Backend Error')
+
+    def calendarList(self):
+        return _FakeCalendarListResource(self)
+
+    # Mutations, each bumping the change version
+    def put_event(self, event, calendar_id='primary'):
+        with self._lock:
+            self._version += 1
+            event = dict(event, status=event.get('status', 'confirmed'))
+            event.setdefault('updated', f"2025-01-01T00:00:00.{self._version:06d}Z")
+            self._events[(calendar_id, event['id'])] = (self._version, event)
+
+    def update_event(self, event_id, calendar_id='primary', **changes):
+        _, event = self._events[(calendar_id, event_id)]
+        changes.setdefault('updated', f"2025-01-02T00:00:00.{self._version + 1:06d}Z")
+        self.put_event(dict(event, **changes), calendar_id)
+
+    def cancel_event(self, event_id, calendar_id='primary'):
+        self.update_event(event_id, calendar_id, status='cancelled')
+
+    def expire_sync_tokens(self):
+        self._min_valid_version = self._version + 1
+
+    def _list(self, params):
+        with self._lock:
+            self.list_calls += 1
+            calendar_id = params.get('calendarId', 'primary')
+            if calendar_id not in {c['id'] for c in self.calendars}:
+                raise FakeHttpError(404, 'Not Found')
+            events = [(v, e) for (cal, _), (v, e) in self._events.items() if cal == calendar_id]
+            offset = int(params.get('pageToken') or 0)
+            if params.get('syncToken'):
+                since = int(params['syncToken'].lstrip('v'))
+                if since < self._min_valid_version:
+                    raise FakeHttpError(410, 'Sync token is no longer valid')
+                items = [e for v, e in events if v > since]
+            else:
+                items = [e for _, e in events if e['status'] != 'cancelled']
+                if params.get('timeMin') or params.get('timeMax'):
+                    items = [e for e in items if self._in_range(e, params.get('timeMin'), params.get('timeMax'))]
+            if params.get('orderBy') == 'startTime':
+                items.sort(key=self._start)
+            page_size = min(self.page_size, params.get('maxResults') or self.page_size)
+            page = items[offset:offset + page_size]
+            result = {'items': [dict(e) for e in page]}
+            if offset + page_size < len(items):
+                result['nextPageToken'] = str(offset + page_size)
+            else:
+                result['nextSyncToken'] = f"v{self._version}"
+            return result
+
+    @staticmethod
+    def _start(event):
+        start = event['start'].get('dateTime') or event['start'].get('date') + 'T00:00:00+00:00'
+        return datetime.datetime.fromisoformat(start.replace('Z', '+00:00'))
+
+    def _in_range(self, event, time_min, time_max):
+        start = self._start(event)
+        if time_min and start < datetime.datetime.fromisoformat(time_min.replace('Z', '+00:00')):
+            return False
+        if time_max and start > datetime.datetime.fromisoformat(time_max.replace('Z', '+00:00')):
+            return False
+        return True
+
+
+class _FakeBatch:
+    """Mimics BatchHttpRequest: one round trip for all added requests."""
+
+    def __init__(self, service, callback):
+        self._service = service
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, request_id=None, callback=None):
+        self._requests.append((request, request_id or str(len(self._requests))))
+
+    def execute(self):
+        self._service._round_trip()
+        for request, request_id in self._requests:
+            try:
+                response = request._fn()
+            except Exception as error:
+                self._callback(request_id, None, error)
+            else:
+                self._callback(request_id, response, None)
+
+
+class _FakeMessages:
+    def __init__(self, service):
+        self._service = service
+
+    def send(self, userId, body):
+        return _FakeRequest(lambda: self._service._send(userId, body), service=self._service)
+
+    def list(self, userId, q='', **kwargs):
+        return _FakeRequest(lambda: self._service._search(q), service=self._service)
+
+    def get(self, userId, id, format='full'):
+        return _FakeRequest(lambda: self._service._message(id, format), service=self._service)
+
+
+class _FakeThreads:
+    def __init__(self, service):
+        self._service = service
+
+    def get(self, userId, id, format='full'):
+        return _FakeRequest(lambda: self._service._thread(id, format), service=self._service)
+
+
+class _FakeHistory:
+    def __init__(self, service):
+        self._service = service
+
+    def list(self, userId, startHistoryId, historyTypes=None, pageToken=None, **kwargs):
+        return _FakeRequest(lambda: self._service._history_page(int(startHistoryId), pageToken), service=self._service)
+
+
+class _FakeUsers:
+    def __init__(self, service):
+        self._service = service
+
+    def messages(self):
+        return _FakeMessages(self._service)
+
+    def threads(self):
+        return _FakeThreads(self._service)
+
+    def history(self):
+        return _FakeHistory(self._service)
+
+    def getProfile(self, userId):
+        return _FakeRequest(self._service._profile, service=self._service)
+
+
+class FakeGmailService:
+    """
+    In-memory Gmail v1 service: users().getProfile, messages().send / get,
+    threads().get, history().list (messageAdded records, 404 for ids older
+    than expire_history()) and new_batch_http_request. receive_reply() adds
+    an incoming message to a sent thread. Every `fail_every`-th send fails with
+    `fail_status` (429 by default); `error_rate` adds random failures with
+    that status and `throttle_rate` random 429s. Round trips sleep latency
+    (+/- jitter).
+    """
+
+    def __init__(self, address='me@example.com', latency=0.0, fail_every=0, fail_status=429, error_rate=0.0, seed=0,
+                 jitter=0.0, throttle_rate=0.0):
+        self.address = address
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.fail_every = fail_every
+        self.fail_status = fail_status
+        self.error_rate = error_rate
+        self.sent = []
+        self.round_trips = 0
+        self.profile_calls = 0
+        self.history_page_size = 100
+        self._messages = {}
+        self._history = []      # (history id, message id)
+        self._history_id = 1000
+        self._min_history_id = 0
+        self._attempts = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def users(self):
+        return _FakeUsers(self)
+
+    def new_batch_http_request(self, callback=None):
+        return _FakeBatch(self, callback)
+
+    def _round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+            latency = _delay(self.latency, self.jitter, self._random)
+        if latency:
+            time.sleep(latency)
+
+    def _profile(self):
+        with self._lock:
+            self.profile_calls += 1
+            return {'emailAddress': self.address, 'historyId': str(self._history_id)}
+
+    def _add_message(self, message_id, thread_id, sender, to, subject, text, labels):
+        """Stores a message and its history record; call with the lock held."""
+        self._history_id += 1
+        data = base64.urlsafe_b64encode(text.encode('utf-8')).decode().rstrip('=')
+        self._messages[message_id] = {
+            'id': message_id, 'threadId': thread_id, 'labelIds': labels, 'historyId': str(self._history_id),
+            'internalDate': str(int(time.time() * 1000) + self._history_id), 'snippet': text[:100],
+            'payload': {'mimeType': 'text/plain', 'body': {'data': data},
+                        'headers': [{'name': 'From', 'value': sender}, {'name': 'To', 'value': to},
+                                    {'name': 'Subject', 'value': subject}]},
+        }
+        self._history.append((self._history_id, message_id))
+
+    def receive_reply(self, thread_id, sender, text, subject='Re: Confirmation'):
+        """Simulates an incoming reply in a thread. Returns the new message id."""
+        with self._lock:
+            message_id = f"in{len(self._messages) + 1}"
+            self._add_message(message_id, thread_id, sender, self.address, subject, text, ['INBOX', 'UNREAD'])
+        return message_id
+
+    def expire_history(self):
+        """Makes every history id handed out so far too old for history().list."""
+        with self._lock:
+            self._min_history_id = self._history_id + 1
+
+    def _format(self, message, format):
+        if format == 'minimal':
+            return {k: message[k] for k in ('id', 'threadId', 'labelIds', 'historyId', 'internalDate')}
+        return dict(message)
+
+    def _message(self, message_id, format):
+        with self._lock:
+            if message_id not in self._messages:
+                raise FakeHttpError(404, 'Not Found')
+            return self._format(self._messages[message_id], format)
+
+    def _thread(self, thread_id, format):
+        with self._lock:
+            messages = [self._format(m, format) for m in self._messages.values() if m['threadId'] == thread_id]
+        if not messages:
+            raise FakeHttpError(404, 'Not Found')
+        return {'id': thread_id, 'messages': messages}
+
+    def _history_page(self, start, page_token):
+        with self._lock:
+            if start < self._min_history_id:
+                raise FakeHttpError(404, 'Requested entity was not found.')
+            records = [(h, m) for h, m in self._history if h > start]
+            offset = int(page_token or 0)
+            page = records[offset:offset + self.history_page_size]
+            result = {'historyId': str(self._history_id),
+                      'history': [{'id': str(h), 'messagesAdded': [{'message': self._format(self._messages[m],
+                                                                                               'minimal')}]}
+                                  for h, m in page]}
+            if offset + self.history_page_size < len(records):
+                result['nextPageToken'] = str(offset + self.history_page_size)
+            return result
+
+    def _send(self, user_id, body):
+        with self._lock:
+            self._attempts += 1
+            fail = (self.fail_every and self._attempts % self.fail_every == 0) or \
+                (self.error_rate and self._random.random() < self.error_rate)
+            if fail:
+                raise FakeHttpError(self.fail_status, 'Rate limit exceeded')
+            if self.throttle_rate and self._random.random() < self.throttle_rate:
+                raise FakeHttpError(429, 'Rate limit exceeded')
+            message_id = f"msg{len(self.sent) + 1}"
+            self.sent.append(dict(body, id=message_id))
+            parsed = email.message_from_bytes(base64.urlsafe_b64decode(body['raw']))
+            self._add_message(message_id, f"thread{message_id[3:]}", parsed['From'], parsed['To'], parsed['Subject'],
+                              parsed.get_payload(decode=True).decode('utf-8', errors='replace'), ['SENT'])
+        return {'id': message_id, 'threadId': f"thread{message_id[3:]}", 'labelIds': ['SENT']}
+
+    def _search(self, q):
+        """Supports the rfc822msgid: query used to find a sent message by Message-ID."""
+        wanted = q.split('rfc822msgid:', 1)[1].strip() if 'rfc822msgid:' in q else None
+        with self._lock:
+            sent = list(self.sent)
+        matches = []
+        for message in sent:
+            parsed = email.message_from_bytes(base64.urlsafe_b64decode(message['raw']))
+            if wanted is None or parsed['Message-ID'] == wanted:
+                matches.append({'id': message['id'], 'threadId': f"thread{message['id'][3:]}"})
+        return {'messages': matches} if matches else {}
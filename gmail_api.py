@@ -1,17 +1,30 @@
-from googleapiclient.discovery import build
 from email.mime.text import MIMEText
 import base64
+import random
+import threading
+import time
+import metrics
+import services
+
+# Gmail accepts up to 100 calls per batch but recommends no more than 50
+BATCH_SIZE = 50
+# Daily send limit for consumer Gmail accounts (Workspace allows 2000)
+DAILY_SEND_LIMIT = 500
+
+_TRANSIENT_STATUSES = (429, 500, 502, 503, 504)
 
 def get_gmail_service(creds):
-    """Builds and returns the Gmail service."""
-    return build('gmail', 'v1', credentials=creds)
+    """Returns the shared Gmail service for these credentials."""
+    return services.get_service('gmail', 'v1', creds)
 
-def create_message(sender, to, subject, message_text):
+def create_message(sender, to, subject, message_text, message_id=None):
     """Create a message for an email."""
     message = MIMEText(message_text)
     message['to'] = to
     message['from'] = sender
     message['subject'] = subject
+    if message_id:
+        message['Message-ID'] = message_id
     return {'raw': base64.urlsafe_b64encode(message.as_bytes()).decode()}
 
 def send_message(service, user_id, message):
@@ -24,3 +37,227 @@ def send_message(service, user_id, message):
     except Exception as error:
         print(f'An error occurred: {error}')
         return None
+
+
+_sender_cache = {}
+_sender_lock = threading.Lock()
+
+def _credential_key(service):
+    """Identifies the credential behind a service so the cache survives service rebuilds."""
+    creds = getattr(getattr(service, '_http', None), 'credentials', None)
+    return services.credential_key(creds) if creds is not None else id(service)
+
+def get_sender_address(service):
+    """Returns the authenticated user's address, calling getProfile once per credential."""
+    key = _credential_key(service)
+    with _sender_lock:
+        if key in _sender_cache:
+            metrics.inc('cache_requests_total', cache='sender_profile', result='hit')
+            return _sender_cache[key]
+    metrics.inc('cache_requests_total', cache='sender_profile', result='miss')
+    with metrics.span('gmail.getProfile'):
+        address = service.users().getProfile(userId='me').execute()['emailAddress']
+    with _sender_lock:
+        _sender_cache[key] = address
+    return address
+
+
+class SendQuota:
+    """Rolling 24 hour send counter per user, to stay under Gmail's daily limit."""
+
+    def __init__(self, limit=DAILY_SEND_LIMIT, window=24 * 3600, clock=time.time):
+        self.limit = limit
+        self.window = window
+        self.clock = clock
+        self._sent = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, user, count):
+        """Reserves up to `count` sends for user and returns how many were granted."""
+        with self._lock:
+            now = self.clock()
+            sent = [t for t in self._sent.get(user, []) if now - t < self.window]
+            granted = max(0, min(count, self.limit - len(sent)))
+            self._sent[user] = sent + [now] * granted
+            return granted
+
+    def remaining(self, user):
+        with self._lock:
+            now = self.clock()
+            return self.limit - sum(1 for t in self._sent.get(user, []) if now - t < self.window)
+
+
+_quota = SendQuota()
+
+def _error_status(error):
+    resp = getattr(error, 'resp', None)
+    status = getattr(resp, 'status', None)
+    return int(status) if status is not None else None
+
+def _is_transient(error):
+    status = _error_status(error)
+    if status is not None:
+        return status in _TRANSIENT_STATUSES or (status == 403 and 'rateLimitExceeded' in str(error))
+    return any(str(code) in str(error) for code in _TRANSIENT_STATUSES)
+
+def _send_round(service, user_id, pending, results):
+    """Sends one round of pending indices through batch HTTP requests. Returns indices to retry."""
+    retry = []
+
+    def _callback(request_id, response, exception):
+        i = int(request_id)
+        if exception is None:
+            results[i].update(status='sent', id=response.get('id'), thread_id=response.get('threadId'), error=None,
+                              transient=False)
+        elif _is_transient(exception):
+            results[i].update(status='failed', error=str(exception), transient=True)
+            retry.append(i)
+        else:
+            results[i].update(status='failed', error=str(exception), transient=False)
+
+    for start in range(0, len(pending), BATCH_SIZE):
+        chunk = pending[start:start + BATCH_SIZE]
+        if hasattr(service, 'new_batch_http_request'):
+            batch = service.new_batch_http_request(callback=_callback)
+            for i in chunk:
+                batch.add(service.users().messages().send(userId=user_id, body=results[i]['message']),
+                          request_id=str(i))
+            try:
+                with metrics.span('gmail.batch_send', messages=len(chunk)):
+                    batch.execute()
+            except Exception as error:
+                # The whole batch request failed; every message in it is retryable if transient
+                for i in chunk:
+                    if results[i]['status'] != 'sent':
+                        results[i].update(status='failed', error=str(error), transient=_is_transient(error))
+                        if _is_transient(error):
+                            retry.append(i)
+        else:
+            for i in chunk:
+                try:
+                    with metrics.span('gmail.send'):
+                        response = service.users().messages().send(userId=user_id, body=results[i]['message']).execute()
+                    _callback(str(i), response, None)
+                except Exception as error:
+                    _callback(str(i), None, error)
+    return retry
+
+def send_messages_batch(service, messages, user_id='me', retries=3, base_delay=1, quota=None):
+    """
+    Sends many messages using Gmail batch HTTP requests.
+
+    Transient failures (429/5xx) are retried with jittered backoff, and a
+    per-user daily quota guard stops sending before Gmail's limit is hit.
+    Returns one dict per message, in order, with 'status' ('sent', 'failed'
+    or 'quota_exceeded'), 'id', 'thread_id', 'error' and 'transient'.
+    """
+    quota = quota or _quota
+    results = [{'message': m, 'status': 'pending', 'id': None, 'thread_id': None, 'error': None, 'transient': False}
+               for m in messages]
+    granted = quota.reserve(_credential_key(service), len(messages))
+    for result in results[granted:]:
+        result.update(status='quota_exceeded', error='Daily send quota reached')
+
+    pending = list(range(granted))
+    for attempt in range(retries + 1):
+        if not pending:
+            break
+        if attempt:
+            metrics.inc('gmail_retries_total', len(pending))
+            time.sleep(random.uniform(base_delay / 2, base_delay * (2 ** attempt)))
+        pending = _send_round(service, user_id, pending, results)
+
+    sent = sum(1 for r in results if r['status'] == 'sent')
+    print(f'Batch send: {sent}/{len(messages)} sent')
+    for result in results:
+        del result['message']
+    return results
+
+def find_message_by_header_id(service, header_id, user_id='me'):
+    """Returns the Gmail id of the message with this Message-ID header, or None."""
+    with metrics.span('gmail.messages.list'):
+        result = service.users().messages().list(userId=user_id, q=f'rfc822msgid:{header_id}').execute()
+    messages = result.get('messages', [])
+    return messages[0]['id'] if messages else None
+
+def get_profile(service, user_id='me'):
+    """The mailbox profile: emailAddress and the current historyId."""
+    with metrics.span('gmail.getProfile'):
+        return service.users().getProfile(userId=user_id).execute()
+
+def list_history(service, start_history_id, user_id='me'):
+    """
+    Messages added to the mailbox since start_history_id, following every
+    page. Returns (messages, latest history id); each message has 'id',
+    'threadId' and 'labelIds'. Raises Gmail's 404 when start_history_id is
+    too old, in which case the caller has to rescan.
+    """
+    messages = []
+    params = {'userId': user_id, 'startHistoryId': start_history_id, 'historyTypes': ['messageAdded']}
+    while True:
+        with metrics.span('gmail.history.list'):
+            result = service.users().history().list(**params).execute()
+        for record in result.get('history', []):
+            messages.extend(added['message'] for added in record.get('messagesAdded', []))
+        if not result.get('nextPageToken'):
+            return messages, result.get('historyId', start_history_id)
+        params['pageToken'] = result['nextPageToken']
+
+def is_not_found(error):
+    return _error_status(error) == 404 or (_error_status(error) is None and '404' in str(error))
+
+def _get_batch(service, requests, stage):
+    """Executes {key: request} in batch HTTP requests. Returns {key: response}; failed keys are left out."""
+    responses = {}
+
+    def _callback(request_id, response, exception):
+        if exception is None:
+            responses[request_id] = response
+        else:
+            print(f"Gmail {stage} failed for {request_id}: {exception}")
+
+    items = list(requests.items())
+    for start in range(0, len(items), BATCH_SIZE):
+        chunk = items[start:start + BATCH_SIZE]
+        if hasattr(service, 'new_batch_http_request'):
+            batch = service.new_batch_http_request(callback=_callback)
+            for key, request in chunk:
+                batch.add(request, request_id=key)
+            with metrics.span(f'gmail.batch_{stage}', requests=len(chunk)):
+                batch.execute()
+        else:
+            for key, request in chunk:
+                try:
+                    _callback(key, request.execute(), None)
+                except Exception as error:
+                    _callback(key, None, error)
+    return responses
+
+def get_messages(service, message_ids, user_id='me', format='full'):
+    """{id: message} for many messages, fetched in batches."""
+    return _get_batch(service, {message_id: service.users().messages().get(userId=user_id, id=message_id, format=format)
+                                for message_id in message_ids}, 'get')
+
+def get_threads(service, thread_ids, user_id='me', format='full'):
+    """{id: thread} for many threads, fetched in batches."""
+    return _get_batch(service, {thread_id: service.users().threads().get(userId=user_id, id=thread_id, format=format)
+                                for thread_id in thread_ids}, 'threads')
+
+def message_header(message, name):
+    """The value of a header in a format='full' or 'metadata' message, or None."""
+    for header in message.get('payload', {}).get('headers', []):
+        if header['name'].lower() == name.lower():
+            return header['value']
+    return None
+
+def message_text(message):
+    """The text/plain body of a format='full' message ('' if there is none)."""
+    parts = [message.get('payload', {})]
+    while parts:
+        part = parts.pop(0)
+        if part.get('mimeType', '').startswith('multipart/'):
+            parts[:0] = part.get('parts', [])
+        elif part.get('mimeType') == 'text/plain' and part.get('body', {}).get('data'):
+            data = part['body']['data']
+            return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4)).decode('utf-8', errors='replace')
+    return message.get('snippet', '')
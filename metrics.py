@@ -0,0 +1,261 @@
+"""
+In-process metrics and tracing.
+
+- span(name, **labels): times a block (an external call, a pipeline stage)
+  into the `stage_seconds` histogram and counts failures. Spans nest via
+  contextvars, so a Gemini call made inside a pipeline run carries the same
+  trace id, across threads started with asyncio.to_thread as well.
+- inc() / observe(): plain counters and histograms (retries, backoff
+  seconds, tokens, cache hits).
+- Export: Prometheus text format (render_prometheus, write_prometheus,
+  start_http_server) and, when METRICS_LOG is set, one JSON line per
+  finished span ('-' for stderr, otherwise a file path).
+
+Everything is stdlib and cheap enough to leave on.
+"""
+import collections
+import contextlib
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+
+PREFIX = 'calconf_'
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192)
+# Histograms that don't measure seconds
+_BUCKETS = {
+    'gemini_prompt_tokens': TOKEN_BUCKETS,
+}
+RECENT = 500
+LOG_PATH = os.environ.get('METRICS_LOG', '')
+
+_HELP = {
+    'stage_seconds': 'Duration of instrumented stages and external calls',
+    'stage_errors_total': 'Instrumented stages that raised',
+    'gemini_retries_total': 'Gemini calls retried after a 429/503',
+    'gemini_backoff_seconds_total': 'Time spent sleeping before Gemini retries',
+    'gemini_queue_wait_seconds': 'Time spent waiting for a rate limiter slot',
+    'gemini_tokens_total': 'Gemini tokens reported in usage metadata',
+    'gemini_fallbacks_total': 'Gemini calls handed to a fallback model after a 429/503',
+    'planner_series_total': 'Recurring series (or one-off sessions) drafted by the week planner',
+    'planner_instances_total': 'Sessions covered by the week planner',
+    'tenant_opens_total': 'Tenants opened (logged in or reloaded from disk) in multi-user mode',
+    'tenant_evictions_total': 'Idle tenants closed to stay within MAX_TENANTS',
+    'gemini_prompt_tokens': 'Input tokens per Gemini request (system instruction + prompt) before sending',
+    'gmail_retries_total': 'Gmail sends retried after a transient error',
+    'cache_requests_total': 'Cache lookups by cache and result',
+}
+
+_lock = threading.Lock()
+_counters = {}      # (name, labels) -> value
+_histograms = {}    # (name, labels) -> [bucket counts..., sum, count]
+_recent = collections.defaultdict(lambda: collections.deque(maxlen=RECENT))   # stage -> durations
+_spans = collections.deque(maxlen=RECENT)
+_current = contextvars.ContextVar('metrics_span', default=None)
+_log_lock = threading.Lock()
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def buckets(name):
+    """Histogram bucket bounds for a metric: BUCKETS (seconds) unless listed in _BUCKETS."""
+    return _BUCKETS.get(name, BUCKETS)
+
+
+def observe(name, value, **labels):
+    key = _key(name, labels)
+    bounds = buckets(name)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0] * len(bounds) + [0.0, 0]
+        for i, bound in enumerate(bounds):
+            if value <= bound:
+                hist[i] += 1
+        hist[-2] += value
+        hist[-1] += 1
+
+
+@contextlib.contextmanager
+def span(name, **labels):
+    """Times the block as stage `name`; yields a dict the block can add attributes to."""
+    parent = _current.get()
+    record = {'trace_id': parent['trace_id'] if parent else uuid.uuid4().hex[:16],
+              'span_id': uuid.uuid4().hex[:8], 'parent_id': parent['span_id'] if parent else None,
+              'name': name, 'attributes': dict(labels)}
+    token = _current.set(record)
+    start = time.perf_counter()
+    record['start'] = time.time()
+    try:
+        yield record['attributes']
+        record['status'] = 'ok'
+    except BaseException as e:
+        record['status'] = 'error'
+        record['error'] = str(e)[:200]
+        inc('stage_errors_total', stage=name)
+        raise
+    finally:
+        _current.reset(token)
+        duration = time.perf_counter() - start
+        record['duration'] = duration
+        observe('stage_seconds', duration, stage=name)
+        with _lock:
+            _recent[name].append(duration)
+            _spans.append(record)
+        if LOG_PATH:
+            _log(record)
+
+
+def _log(record):
+    line = json.dumps(record, default=str)
+    with _log_lock:
+        if LOG_PATH == '-':
+            print(line, file=sys.stderr)
+        else:
+            with open(LOG_PATH, 'a') as f:
+                f.write(line + '\n')
+
+
+def current_trace_id():
+    record = _current.get()
+    return record['trace_id'] if record else None
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def summary():
+    """Per-stage count, errors and p50 / p95 / p99 / max latency over the recent calls, slowest p95 first."""
+    with _lock:
+        recent = {stage: list(values) for stage, values in _recent.items()}
+        errors = {dict(labels)['stage']: value for (name, labels), value in _counters.items()
+                  if name == 'stage_errors_total'}
+        totals = {dict(labels)['stage']: hist[-1] for (name, labels), hist in _histograms.items()
+                  if name == 'stage_seconds'}
+    rows = [{'stage': stage, 'count': totals.get(stage, len(values)), 'errors': errors.get(stage, 0),
+             'p50': _percentile(values, 0.5), 'p95': _percentile(values, 0.95), 'p99': _percentile(values, 0.99),
+             'max': max(values)}
+            for stage, values in recent.items() if values]
+    return sorted(rows, key=lambda row: -row['p95'])
+
+
+def counter(name, **labels):
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+def counters(name):
+    """{labels dict as tuple: value} for every series of a counter."""
+    with _lock:
+        return {labels: value for (n, labels), value in _counters.items() if n == name}
+
+
+def cache_hit_rates():
+    """{cache: hit ratio} from cache_requests_total."""
+    totals = collections.defaultdict(lambda: [0, 0])
+    for labels, value in counters('cache_requests_total').items():
+        labels = dict(labels)
+        totals[labels['cache']][0 if labels['result'] == 'hit' else 1] += value
+    return {cache: hits / (hits + misses) for cache, (hits, misses) in totals.items() if hits + misses}
+
+
+def recent_spans(limit=50, trace_id=None):
+    with _lock:
+        spans = [s for s in _spans if trace_id is None or s['trace_id'] == trace_id]
+    return spans[-limit:]
+
+
+def _labels_text(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in items) + '}'
+
+
+def render_prometheus():
+    """All counters and histograms in the Prometheus text exposition format."""
+    with _lock:
+        counters_ = sorted(_counters.items())
+        histograms = sorted((key, list(hist)) for key, hist in _histograms.items())
+    lines = []
+    seen = set()
+    for (name, labels), value in counters_:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {PREFIX}{name} {_HELP.get(name, name)}")
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+        lines.append(f"{PREFIX}{name}{_labels_text(labels)} {value}")
+    for (name, labels), hist in histograms:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {PREFIX}{name} {_HELP.get(name, name)}")
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+        for bound, count in zip(buckets(name), hist):
+            lines.append(f"{PREFIX}{name}_bucket{_labels_text(labels, [('le', bound)])} {count}")
+        lines.append(f"{PREFIX}{name}_bucket{_labels_text(labels, [('le', '+Inf')])} {hist[-1]}")
+        lines.append(f"{PREFIX}{name}_sum{_labels_text(labels)} {hist[-2]}")
+        lines.append(f"{PREFIX}{name}_count{_labels_text(labels)} {hist[-1]}")
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path):
+    """Writes the metrics file atomically (e.g. for node_exporter's textfile collector)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+
+_server = None
+
+
+def start_http_server(port, host='127.0.0.1'):
+    """Serves /metrics from a daemon thread (once per process). Returns the server."""
+    global _server
+    with _lock:
+        if _server is not None:
+            return _server
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        _server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=_server.serve_forever, name='metrics-http', daemon=True).start()
+        return _server
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _recent.clear()
+        _spans.clear()
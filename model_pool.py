@@ -0,0 +1,113 @@
+"""
+Process-wide pool of Gemini model clients, with a fallback chain.
+
+A model is created once per (model name, system instruction) and shared
+by every thread and Streamlit session in the process; building a
+GenerativeModel per call is not free, and a shared client keeps its HTTP
+connections warm.
+
+google.generativeai holds one API key per process (genai.configure), so
+the pool serves one key: clients and cooldowns are both for the current
+key, and agent.configure_genai clears the pool when the key changes.
+
+When a model answers 429 / 503 it is put on a cooldown for
+FALLBACK_COOLDOWN seconds and calls go to the next model in the chain
+(GEMINI_FALLBACK_MODELS, comma separated, lighter models last) with the
+same system instruction. Each model keeps its own rate limiter. The last
+model in the chain is always tried, with the usual backoff.
+
+At most MAX_MODELS clients are kept (models x instructions);
+the least recently used one is dropped first.
+"""
+import collections
+import os
+import threading
+import time
+
+DEFAULT_FALLBACK_MODELS = [m.strip() for m in os.environ.get('GEMINI_FALLBACK_MODELS', 'gemini-2.5-flash-lite').split(',')
+                           if m.strip()]
+FALLBACK_COOLDOWN = float(os.environ.get('GEMINI_FALLBACK_COOLDOWN', 60))
+MAX_MODELS = int(os.environ.get('GEMINI_MAX_MODELS', 64))
+
+
+class ModelPool:
+    """
+    factory(model_name, system_instruction) creates a model client; the
+    pool calls it once per key and hands out the same object afterwards.
+    """
+
+    def __init__(self, factory, fallbacks=None, cooldown=FALLBACK_COOLDOWN, clock=time.monotonic,
+                 max_models=MAX_MODELS):
+        self.factory = factory
+        self.fallbacks = DEFAULT_FALLBACK_MODELS if fallbacks is None else list(fallbacks)
+        self.cooldown = cooldown
+        self.clock = clock
+        self.max_models = max_models
+        self._models = collections.OrderedDict()
+        self._keys = {}
+        self._cooling = {}
+        self._lock = threading.Lock()
+        self._create_lock = threading.Lock()
+
+    def get(self, model_name, system_instruction=None):
+        """The shared model for this name and instruction, created on first use."""
+        key = (model_name, system_instruction)
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._models.move_to_end(key)
+        if model is not None:
+            return model
+        # One creation at a time, so two sessions asking at once share one client
+        with self._create_lock:
+            model = self._models.get(key)
+            if model is None:
+                model = self.factory(model_name, system_instruction)
+                with self._lock:
+                    self._models[key] = model
+                    self._keys[id(model)] = key
+                    while len(self._models) > self.max_models:
+                        _, evicted = self._models.popitem(last=False)
+                        self._keys.pop(id(evicted), None)
+        return model
+
+    def chain(self, model):
+        """
+        model followed by its fallbacks (same key and instruction), models on
+        cooldown moved to the end. A model the pool did not create has no
+        fallbacks.
+        """
+        with self._lock:
+            key = self._keys.get(id(model))
+            now = self.clock()
+            cooling = {name for name, until in self._cooling.items() if until > now}
+        if key is None:
+            return [model]
+        model_name, system_instruction = key
+        names = [model_name] + [name for name in self.fallbacks if name != model_name]
+        names = [name for name in names if name not in cooling] + [name for name in names if name in cooling]
+        return [self.get(name, system_instruction) for name in names]
+
+    def mark_throttled(self, model):
+        """Sends calls for this model's name to the fallbacks for the next `cooldown` seconds."""
+        with self._lock:
+            key = self._keys.get(id(model))
+            if key is not None:
+                # Quotas are per key and model, whatever the instruction
+                self._cooling[key[0]] = self.clock() + self.cooldown
+
+    def cooling(self):
+        """{model name: seconds of cooldown left} for models currently skipped."""
+        now = self.clock()
+        with self._lock:
+            return {name: until - now for name, until in self._cooling.items() if until > now}
+
+    def clear(self):
+        """Drops every model and cooldown (e.g. after the API key changed)."""
+        with self._lock:
+            self._models.clear()
+            self._keys.clear()
+            self._cooling.clear()
+
+    def __len__(self):
+        return len(self._models)
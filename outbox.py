@@ -0,0 +1,381 @@
+"""
+Durable outbound email queue.
+
+Every confirmation is written to SQLite before it is sent, keyed by an
+idempotency key derived from event id + recipient + template kind, and moves
+through queued -> sending -> sent / failed. Enqueueing the same key twice
+is a no-op, so re-running a batch never double-sends.
+
+Messages carry the key in their Message-ID header. If the process dies
+while a message is 'sending', resume() looks that Message-ID up in the
+mailbox to decide whether it went out before queueing it again. The
+lookup needs a read scope (can_verify); without one, or if the lookup
+fails, the message is marked 'unknown' for the user to check, and it is
+never requeued automatically (requeue_failed leaves it alone).
+
+OutboxWorker does this unattended: the app runs one per outbox, which
+sends due retries and recovers sends left 'sending' for STALE_SENDING
+seconds (younger ones may still be in flight in another process).
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import auth
+import gmail_api
+
+DEFAULT_PATH = os.environ.get('OUTBOX_PATH', 'outbox.sqlite3')
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 60
+QUOTA_RETRY_DELAY = 3600
+STALE_SENDING = 300
+# How long a foreground send waits for messages the worker claimed first
+SETTLE_TIMEOUT = 30
+
+QUEUED = 'queued'
+SENDING = 'sending'
+SENT = 'sent'
+FAILED = 'failed'
+# Interrupted while sending and delivery could not be verified
+UNKNOWN = 'unknown'
+
+# Any of these lets resume() look a Message-ID up (users.messages.list)
+VERIFY_SCOPES = [
+    'https://mail.google.com/',
+    'https://www.googleapis.com/auth/gmail.modify',
+    auth.GMAIL_READONLY_SCOPE,
+]
+
+
+def can_verify(creds):
+    """True if creds were granted a scope that lets resume() check whether an interrupted send went out."""
+    return any(auth.has_granted(creds, scope) for scope in VERIFY_SCOPES)
+
+
+def idempotency_key(event_id, recipient, kind):
+    """Stable key for one (event, recipient, template) confirmation."""
+    recipient = ",".join(sorted(r.strip().lower() for r in recipient.split(',') if r.strip()))
+    return hashlib.sha256(f"{event_id}|{recipient}|{kind}".encode('utf-8')).hexdigest()[:32]
+
+
+def message_id_header(key):
+    return f"<{key}@calendar-confirmation>"
+
+
+class Outbox:
+    """SQLite-backed outbox, safe to share between threads."""
+
+    def __init__(self, path=DEFAULT_PATH, max_attempts=MAX_ATTEMPTS, clock=time.time):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                key TEXT PRIMARY KEY,
+                event_id TEXT,
+                recipient TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                body TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                last_error TEXT,
+                message_id TEXT,
+                thread_id TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_outbox_state ON outbox(state, next_attempt_at);
+            CREATE INDEX IF NOT EXISTS idx_outbox_event ON outbox(event_id);
+        """)
+        columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+        if 'thread_id' not in columns:
+            # Outboxes created before replies were tracked
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN thread_id TEXT")
+        self._conn.commit()
+
+    def enqueue(self, event_id, recipient, kind, subject, body):
+        """
+        Queues a message and returns its key. An existing entry with the same
+        key keeps its state if it is sending or sent; a queued or failed one
+        takes the new content and is queued again.
+        """
+        key = idempotency_key(event_id, recipient, kind)
+        now = self.clock()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO outbox (key, event_id, recipient, kind, subject, body, state, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET subject = excluded.subject, body = excluded.body, "
+                "state = excluded.state, attempts = 0, next_attempt_at = 0, updated_at = excluded.updated_at "
+                "WHERE outbox.state IN (?, ?)",
+                (key, event_id, recipient, kind, subject, body, QUEUED, now, now, QUEUED, FAILED))
+            self._conn.commit()
+        return key
+
+    def claim(self, limit=50):
+        """
+        Moves up to `limit` due messages from queued to sending and returns
+        them. Each row is claimed with a conditional UPDATE, so when several
+        processes share the file (the app and the cron job) a message is
+        claimed by exactly one of them.
+        """
+        now = self.clock()
+        claimed = []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM outbox WHERE state = ? AND next_attempt_at <= ? ORDER BY created_at LIMIT ?",
+                (QUEUED, now, limit)).fetchall()
+            for row in rows:
+                cursor = self._conn.execute(
+                    "UPDATE outbox SET state = ?, attempts = attempts + 1, updated_at = ? WHERE key = ? AND state = ?",
+                    (SENDING, now, row['key'], QUEUED))
+                if cursor.rowcount == 1:
+                    claimed.append(dict(row, state=SENDING, attempts=row['attempts'] + 1))
+            self._conn.commit()
+        return claimed
+
+    def mark_sent(self, key, message_id, thread_id=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET state = ?, message_id = ?, thread_id = COALESCE(?, thread_id), last_error = NULL, "
+                "updated_at = ? WHERE key = ?",
+                (SENT, message_id, thread_id, self.clock(), key))
+            self._conn.commit()
+
+    def set_thread_ids(self, thread_ids):
+        """Records the Gmail thread of sent messages, {key: thread_id}."""
+        with self._lock:
+            self._conn.executemany("UPDATE outbox SET thread_id = ? WHERE key = ?",
+                                   [(thread_id, key) for key, thread_id in thread_ids.items()])
+            self._conn.commit()
+
+    def sent(self, kind=None):
+        """Sent messages, optionally only one template kind, oldest first."""
+        query = "SELECT * FROM outbox WHERE state = ?"
+        params = [SENT]
+        if kind:
+            query += " AND kind = ?"
+            params.append(kind)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY updated_at", params).fetchall()
+        return [dict(row) for row in rows]
+
+    def mark_failed(self, key, error, retryable=True, delay=RETRY_DELAY):
+        """Requeues with a delay while attempts remain, otherwise marks failed."""
+        now = self.clock()
+        with self._lock:
+            row = self._conn.execute("SELECT attempts FROM outbox WHERE key = ?", (key,)).fetchone()
+            if retryable and row and row['attempts'] < self.max_attempts:
+                self._conn.execute(
+                    "UPDATE outbox SET state = ?, last_error = ?, next_attempt_at = ?, updated_at = ? WHERE key = ?",
+                    (QUEUED, error, now + delay, now, key))
+            else:
+                self._conn.execute(
+                    "UPDATE outbox SET state = ?, last_error = ?, updated_at = ? WHERE key = ?",
+                    (FAILED, error, now, key))
+            self._conn.commit()
+
+    def mark_unknown(self, key, error):
+        with self._lock:
+            self._conn.execute("UPDATE outbox SET state = ?, last_error = ?, updated_at = ? WHERE key = ? AND state = ?",
+                               (UNKNOWN, error, self.clock(), key, SENDING))
+            self._conn.commit()
+
+    def resolve_unknown(self, delivered):
+        """
+        The user's call on messages with unknown delivery, after checking
+        their Sent mail: delivered=True marks them sent, False queues them
+        again. Returns how many were updated.
+        """
+        with self._lock:
+            if delivered:
+                count = self._conn.execute("UPDATE outbox SET state = ?, updated_at = ? WHERE state = ?",
+                                           (SENT, self.clock(), UNKNOWN)).rowcount
+            else:
+                count = self._conn.execute(
+                    "UPDATE outbox SET state = ?, attempts = 0, next_attempt_at = 0, updated_at = ? WHERE state = ?",
+                    (QUEUED, self.clock(), UNKNOWN)).rowcount
+            self._conn.commit()
+        return count
+
+    def requeue_failed(self):
+        """
+        Puts failed messages back in the queue with a fresh attempt budget.
+        Only sends Gmail rejected; messages with unknown delivery are left
+        for resolve_unknown.
+        """
+        with self._lock:
+            count = self._conn.execute(
+                "UPDATE outbox SET state = ?, attempts = 0, next_attempt_at = 0, updated_at = ? WHERE state = ?",
+                (QUEUED, self.clock(), FAILED)).rowcount
+            self._conn.commit()
+        return count
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM outbox WHERE key = ?", (key,)).fetchone()
+        return dict(row) if row else None
+
+    def settle(self, keys, timeout=SETTLE_TIMEOUT, poll=0.2):
+        """
+        {key: entry} once none of keys is 'sending' or timeout passes. After
+        a drain, a message still 'sending' was claimed by another drainer
+        (the background worker, another process) and is in flight there.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            entries = {key: self.get(key) for key in keys}
+            if time.monotonic() >= deadline or all(entry['state'] != SENDING for entry in entries.values()):
+                return entries
+            time.sleep(poll)
+
+    def counts(self):
+        """Number of messages in each state."""
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM outbox GROUP BY state").fetchall()
+        counts = {QUEUED: 0, SENDING: 0, SENT: 0, FAILED: 0, UNKNOWN: 0}
+        counts.update({state: n for state, n in rows})
+        return counts
+
+    def pending(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM outbox WHERE state IN (?, ?)", (QUEUED, SENDING)).fetchall()
+        return [dict(row) for row in rows]
+
+    def resume(self, service=None, min_age=0):
+        """
+        Recovers messages left in 'sending' by a crash, skipping any claimed
+        less than min_age seconds ago.
+        With a Gmail service, each one is looked up by Message-ID: found means
+        it was delivered, not found means it is queued again. Pass no service
+        when the credentials can't verify (see can_verify). If the lookup is
+        not possible the message is marked unknown for manual review rather
+        than risking a duplicate.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT key FROM outbox WHERE state = ? AND updated_at <= ?",
+                                      (SENDING, self.clock() - min_age)).fetchall()
+        recovered = {SENT: 0, QUEUED: 0, UNKNOWN: 0}
+        for row in rows:
+            key = row['key']
+            try:
+                if service is None:
+                    raise RuntimeError("no Gmail read scope to verify delivery")
+                message_id = gmail_api.find_message_by_header_id(service, message_id_header(key))
+            except Exception as e:
+                self.mark_unknown(key, f"Interrupted while sending; delivery unknown ({e})")
+                recovered[UNKNOWN] += 1
+                continue
+            if message_id:
+                self.mark_sent(key, message_id)
+                recovered[SENT] += 1
+            else:
+                with self._lock:
+                    self._conn.execute(
+                        "UPDATE outbox SET state = ?, next_attempt_at = 0, updated_at = ? WHERE key = ? AND state = ?",
+                        (QUEUED, self.clock(), key, SENDING))
+                    self._conn.commit()
+                recovered[QUEUED] += 1
+        if rows:
+            print(f"Outbox resume: {recovered}")
+        return recovered
+
+    def drain(self, service, batch_size=gmail_api.BATCH_SIZE):
+        """Sends every due queued message. Returns the number sent."""
+        sender = None
+        sent = 0
+        while True:
+            rows = self.claim(batch_size)
+            if not rows:
+                return sent
+            # Looked up only when there is something to send (the worker drains an idle outbox often)
+            sender = sender or gmail_api.get_sender_address(service)
+            messages = [gmail_api.create_message(sender, row['recipient'], row['subject'], row['body'],
+                                                 message_id=message_id_header(row['key'])) for row in rows]
+            statuses = gmail_api.send_messages_batch(service, messages, retries=1)
+            for row, status in zip(rows, statuses):
+                if status['status'] == 'sent':
+                    self.mark_sent(row['key'], status['id'], status.get('thread_id'))
+                    sent += 1
+                elif status['status'] == 'quota_exceeded':
+                    self.mark_failed(row['key'], status['error'], delay=QUOTA_RETRY_DELAY)
+                else:
+                    self.mark_failed(row['key'], status['error'], retryable=status.get('transient', False))
+
+
+def send_now(box, service, event_id, recipient, kind, subject, body):
+    """
+    Queues one message and drains the outbox right away.
+    Returns (entry, already_sent); already_sent is True when this
+    confirmation had been delivered before and nothing new was sent.
+    """
+    previous = box.get(idempotency_key(event_id, recipient, kind))
+    if previous and previous['state'] == SENT:
+        return previous, True
+    key = box.enqueue(event_id, recipient, kind, subject, body)
+    box.drain(service)
+    return box.settle([key])[key], False
+
+
+class OutboxWorker:
+    """
+    Background thread that drains the outbox every `interval` seconds, so
+    transient failures are retried once due, and resumes stale sends.
+    """
+
+    def __init__(self, outbox, service, interval=5.0, verify=True):
+        self.outbox = outbox
+        self.service = service
+        self.interval = interval
+        # False when the credentials can't look sent messages up (can_verify)
+        self.verify = verify
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='outbox-worker', daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """Drain now instead of waiting for the next interval."""
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.outbox.resume(self.service if self.verify else None, min_age=STALE_SENDING)
+                self.outbox.drain(self.service)
+            except Exception as e:
+                print(f"Outbox worker error: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox():
+    """Process-wide outbox instance."""
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = Outbox()
+        return _outbox
@@ -0,0 +1,222 @@
+"""
+Week-ahead planner: confirmations for a multi-week window, one draft per
+recurring series instead of one per session.
+
+Calendar returns a weekly slot as one event per week (singleEvents=True).
+The planner groups those instances by recurringEventId, calendar,
+attendees and text (one-off events are a series of one), resolves the names and
+Type/Subject once per series and, when Gemini writes the emails, asks it
+for one draft per series. The other instances are rendered locally from
+that draft: its date and time become placeholders that are filled in per
+instance. Results have the same shape as batch.generate_drafts, so they
+can be reviewed and sent the same way.
+
+With digest=True, send_plan sends each student one "your sessions this
+week" email per week (outbox kind 'digest', keyed by recipient and week,
+so a rerun does not send it again) instead of one per session. Teacher
+emails stay per session. Digest replies are not tracked by replies.py.
+"""
+import asyncio
+import datetime
+
+import agent
+import async_core
+import batch
+import calendar_api
+import event_view
+import extraction
+import metrics
+import outbox
+import templates
+
+DEFAULT_WEEKS = 1
+
+
+def window(start_date, weeks=DEFAULT_WEEKS):
+    """(first day, last day) of a window of `weeks` weeks starting on start_date."""
+    return start_date, start_date + datetime.timedelta(days=7 * weeks - 1)
+
+
+def fetch_events(calendar_service, start_date, weeks=DEFAULT_WEEKS, calendars=None):
+    """Every session in the window, from the given calendars (default: the primary calendar)."""
+    start_date, end_date = window(start_date, weeks)
+    if calendars:
+        return calendar_api.get_events_for_calendars(calendar_service, calendars, start_date, end_date)
+    return calendar_api.get_upcoming_events(calendar_service, start_date=start_date, end_date=end_date)
+
+
+def series_key(event):
+    """
+    Instances with the same key share one draft. An instance edited on its
+    own (other attendees, summary or description) gets a series of its own.
+    """
+    attendees = tuple(sorted(email.lower() for email in event_view.get_view(event).attendees))
+    return (event.get('recurringEventId') or event.get('id'), event.get('_calendar_id'), attendees,
+            event.get('summary', ''), event.get('description', ''))
+
+
+def group_series(events):
+    """[{'key', 'events'}] with each series' instances in time order, series ordered by first start."""
+    groups = {}
+    for event in sorted(events, key=lambda e: event_view.get_view(e).start_ts):
+        groups.setdefault(series_key(event), []).append(event)
+    return [{'key': key, 'events': instances} for key, instances in groups.items()]
+
+
+def _parameterize(draft, event, date_format):
+    """
+    The draft with this event's date and time as {date} / {time}, or None
+    unless both are in it (a reworded time would otherwise be copied to
+    every instance, including ones moved to another slot).
+    """
+    date_str, time_str = templates.format_date_time(event, date_format)
+    parameterized = {}
+    for field, text in draft.items():
+        text = text.replace('{', '{{').replace('}', '}}')
+        parameterized[field] = text.replace(date_str, '{date}').replace(time_str, '{time}')
+    text = parameterized['subject'] + parameterized['body']
+    if '{date}' not in text or '{time}' not in text:
+        return None
+    return parameterized
+
+
+def _fill(parameterized, event, date_format):
+    date_str, time_str = templates.format_date_time(event, date_format)
+    return {field: text.format(date=date_str, time=time_str) for field, text in parameterized.items()}
+
+
+async def plan_series(series, teacher_name="Teacher", student_name="Student", use_template=True):
+    """
+    Drafts for every instance of one series, as batch result dicts (plus
+    'series', 'teacher_name', 'student_name' and 'fields'). At most one
+    Gemini call for the fields or the draft, made for the first instance.
+    """
+    instances = series['events']
+    first = instances[0]
+    teacher, student = extraction.resolve_names(first, teacher_name, student_name)
+    results = [{'event': event, 'student_draft': None, 'teacher_draft': None, 'error': None,
+                'series': series['key'][0], 'teacher_name': teacher, 'student_name': student, 'fields': None}
+               for event in instances]
+    try:
+        with metrics.span('planner.series', instances=len(instances)):
+            if use_template:
+                fields = await agent.resolve_fields_async(first)
+                drafts = [templates.render_drafts(event, teacher, student, fields) for event in instances]
+            else:
+                fields = extraction.extract_fields(first)
+                base = await agent.generate_drafts_async(first, teacher, student, use_template=False)
+                student_draft = _parameterize(base['student'], first, templates.STUDENT_DATE_FORMAT)
+                teacher_draft = _parameterize(base['teacher'], first, templates.TEACHER_DATE_FORMAT)
+                if student_draft and teacher_draft:
+                    drafts = [base] + [{'student': _fill(student_draft, event, templates.STUDENT_DATE_FORMAT),
+                                        'teacher': _fill(teacher_draft, event, templates.TEACHER_DATE_FORMAT)}
+                                       for event in instances[1:]]
+                else:
+                    # The model reworded the date or time; fall back to the templates for the rest
+                    fields = await agent.resolve_fields_async(first)
+                    drafts = [base] + [templates.render_drafts(event, teacher, student, fields)
+                                       for event in instances[1:]]
+    except Exception as e:
+        for result in results:
+            result['error'] = str(e)
+        return results
+    for result, draft in zip(results, drafts):
+        result['student_draft'] = draft['student']
+        result['teacher_draft'] = draft['teacher']
+        result['fields'] = fields
+    return results
+
+
+async def plan_all(events, teacher_name="Teacher", student_name="Student", use_template=True, max_concurrency=4,
+                   on_progress=None):
+    """
+    plan_series for every series, at most max_concurrency at a time.
+    on_progress(done, total, result) is called per instance. Results are
+    in time order.
+    """
+    all_series = group_series(events)
+    limit = asyncio.Semaphore(max(1, max_concurrency))
+    done = 0
+
+    async def _one(series):
+        nonlocal done
+        async with limit:
+            results = await plan_series(series, teacher_name, student_name, use_template)
+        for result in results:
+            done += 1
+            if on_progress:
+                on_progress(done, len(events), result)
+        return results
+
+    planned = await asyncio.gather(*(_one(series) for series in all_series))
+    results = [result for results in planned for result in results]
+    results.sort(key=lambda r: event_view.get_view(r['event']).start_ts)
+    metrics.inc('planner_series_total', len(all_series))
+    metrics.inc('planner_instances_total', len(results))
+    return results
+
+
+def plan(events, teacher_name="Teacher", student_name="Student", use_template=True, max_workers=4, rpm=None,
+         on_progress=None):
+    """Sync wrapper around plan_all, like batch.generate_drafts."""
+    batch._configure_rpm(rpm)
+    return async_core.run_sync(plan_all, events, teacher_name, student_name, use_template,
+                               max_concurrency=max_workers, on_progress=on_progress)
+
+
+def week_start(event):
+    """The Monday of the week the event starts in."""
+    start = event_view.get_view(event).start
+    day = start.date() if start is not None else datetime.date.today()
+    return day - datetime.timedelta(days=day.weekday())
+
+
+def digests(results):
+    """
+    [{'recipient', 'week', 'results', 'draft'}]: one digest per student
+    recipient and week, over the results that generated without error.
+    """
+    groups = {}
+    for result in results:
+        recipient = batch.student_recipients(result['event'])
+        if result.get('error') or not recipient:
+            continue
+        groups.setdefault((recipient, week_start(result['event'])), []).append(result)
+    out = []
+    for (recipient, week), members in groups.items():
+        sessions = []
+        for r in members:
+            # Results read back from a dry-run file may not carry the resolved names and fields
+            teacher, student = extraction.resolve_names(r['event'], r.get('teacher_name') or "Teacher",
+                                                        r.get('student_name') or "Student")
+            sessions.append((r['event'], teacher, r.get('fields') or extraction.extract_fields(r['event'])))
+        out.append({'recipient': recipient, 'week': week, 'results': members,
+                    'draft': templates.render_digest(student, week, sessions)})
+    return out
+
+
+def send_plan(gmail_service, results, teacher_email="", digest=False, box=None):
+    """
+    Sends planned drafts. Without digest this is batch.send_drafts; with
+    digest, students get one email per week and 'student_sent' is the
+    digest's message id for each of its sessions.
+    """
+    if not digest:
+        return batch.send_drafts(gmail_service, results, teacher_email, box=box)
+    box = box or outbox.get_outbox()
+    targets = []
+    for item in digests(results):
+        key = box.enqueue(f"week:{item['week'].isoformat()}", item['recipient'], 'digest', item['draft']['subject'],
+                          item['draft']['body'])
+        targets.extend((result, 'student_sent', key) for result in item['results'])
+    for result in results:
+        if teacher_email and not result.get('error') and result.get('teacher_draft'):
+            draft = result['teacher_draft']
+            key = box.enqueue(result['event'].get('id'), teacher_email, 'teacher', draft['subject'], draft['body'])
+            targets.append((result, 'teacher_sent', key))
+
+    box.drain(gmail_service)
+    entries = box.settle([key for _, _, key in targets])
+    for result, field, key in targets:
+        batch.record_send(result, field, entries[key])
+    return results
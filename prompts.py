@@ -0,0 +1,167 @@
+"""
+Prompt building for the Gemini calls in agent.py.
+
+Everything that is the same on every call (role, rules, the email
+formats) lives in a per-task system instruction set on the model, so the
+per-call prompt carries only the event's values as compact "Key: value"
+lines and the instruction prefix stays byte-identical between requests
+(what Gemini's implicit prompt caching matches on). The instructions
+still count as input tokens on every request; they are compacted too.
+
+Event descriptions are bounded to DESCRIPTION_TOKEN_BUDGET: whitespace is
+collapsed, links are shortened, and if that is not enough the labelled
+lines (Type:, Subject:, ...) are kept and the rest is cut.
+
+count_tokens asks the model (model.count_tokens) when GEMINI_COUNT_TOKENS
+is set and estimates otherwise; results are memoized per text.
+"""
+import collections
+import hashlib
+import os
+import re
+import textwrap
+import threading
+
+import rate_limiter
+import templates
+
+DESCRIPTION_TOKEN_BUDGET = int(os.environ.get('GEMINI_DESCRIPTION_TOKENS', 256))
+COUNT_TOKENS = os.environ.get('GEMINI_COUNT_TOKENS', '0') == '1'
+COUNT_CACHE_SIZE = 1024
+
+_URL = re.compile(r'https?://\S+')
+_LABELLED = re.compile(r'^\s*[A-Za-z][\w /]{1,20}\s*[:\-]\s*\S')
+_counts = collections.OrderedDict()
+_counts_lock = threading.Lock()
+
+
+def compact(text):
+    """Dedents, strips trailing spaces and collapses runs of blank lines."""
+    lines = [line.rstrip() for line in textwrap.dedent(text).strip().splitlines()]
+    out = []
+    for line in lines:
+        if line or (out and out[-1]):
+            out.append(line)
+    return "\n".join(out)
+
+
+def _placeholders(template):
+    """A templates.* email with its {fields} as [Field] placeholders."""
+    return template.format(student='[Student]', teacher='[Teacher]', date='[Date]', time='[Time]',
+                           type='[Type]', subject='[Subject]')
+
+
+_ROLE = "You are an automated email assistant for Elite Prep Suwanee."
+
+FIELDS_INSTRUCTION = compact("""
+    {role}
+    Extract the tutoring session Type (e.g. Online, In-Person) and Subject from a calendar event.
+    Answer as JSON.
+""").format(role=_ROLE)
+
+REPLY_INSTRUCTION = compact("""
+    A tutoring student was asked to reply [Y] if they can attend the session or [N] if they cannot.
+    Answer yes, no or unclear for the reply you are given, as JSON.
+""")
+
+DRAFTS_INSTRUCTION = compact("""
+    {role}
+    Write the student and teacher confirmation emails for a tutoring appointment as JSON
+    {{"student": {{"subject", "body"}}, "teacher": {{"subject", "body"}}}}.
+    Follow these formats exactly: fill in the [placeholders] from the event, take [Type] and
+    [Subject] from the event details, and add nothing else.
+
+    Student email:
+    {student}
+
+    Teacher email:
+    {teacher}
+""").format(role=_ROLE, student=_placeholders(templates.STUDENT_TEMPLATE),
+            teacher=_placeholders(templates.TEACHER_TEMPLATE))
+
+EMAIL_INSTRUCTIONS = {
+    kind: compact("""
+        {role}
+        Write a confirmation email for a tutoring appointment in the EXACT format below.
+        Fill in the [placeholders] from the event; take [Type] and [Subject] from the event details.
+        Do not add any extra text or conversational filler.
+
+        {template}
+    """).format(role=_ROLE, template=_placeholders(template))
+    for kind, template in (('student', templates.STUDENT_TEMPLATE), ('teacher', templates.TEACHER_TEMPLATE))
+}
+
+# System instruction per task; the task also labels the token metrics
+INSTRUCTIONS = dict(EMAIL_INSTRUCTIONS, fields=FIELDS_INSTRUCTION, reply=REPLY_INSTRUCTION,
+                    drafts=DRAFTS_INSTRUCTION)
+
+
+def estimate_tokens(text):
+    return rate_limiter.estimate_tokens(text)
+
+
+def shrink(text, budget=DESCRIPTION_TOKEN_BUDGET):
+    """text cut down to about `budget` tokens, keeping labelled lines first."""
+    text = _URL.sub('[link]', compact(text or ''))
+    text = "\n".join(" ".join(line.split()) for line in text.splitlines())
+    if estimate_tokens(text) <= budget:
+        return text
+    lines = text.splitlines()
+    keep = [line for line in lines if _LABELLED.match(line)]
+    rest = " ".join(line for line in lines if line and not _LABELLED.match(line))
+    out = "\n".join(keep)
+    room = budget * 4 - len(out) - 1
+    if room > 0 and rest:
+        out = f"{out}\n{rest[:room].rstrip()}…" if out else f"{rest[:room].rstrip()}…"
+    return out[:budget * 4]
+
+
+def _lines(**values):
+    return "\n".join(f"{key.replace('_', ' ').capitalize()}: {value}" for key, value in values.items()
+                     if value not in (None, ''))
+
+
+def fields_prompt(event_details):
+    return _lines(title=event_details.get('summary', ''), description=shrink(event_details.get('description', '')))
+
+
+def reply_prompt(text):
+    return shrink(text)
+
+
+def drafts_prompt(event_details, teacher_name, student_name):
+    student_date, time_str = templates.format_date_time(event_details, templates.STUDENT_DATE_FORMAT)
+    teacher_date, _ = templates.format_date_time(event_details, templates.TEACHER_DATE_FORMAT)
+    return _lines(event=event_details.get('summary', 'Appointment'),
+                  description=shrink(event_details.get('description', '')),
+                  student=student_name, teacher=teacher_name,
+                  student_date=student_date, teacher_date=teacher_date, time=time_str)
+
+
+def email_prompt(event_details, teacher_name, student_name, kind):
+    date_format = templates.STUDENT_DATE_FORMAT if kind == 'student' else templates.TEACHER_DATE_FORMAT
+    date_str, time_str = templates.format_date_time(event_details, date_format)
+    return _lines(event=event_details.get('summary', 'Appointment'),
+                  description=shrink(event_details.get('description', '')),
+                  student=student_name, teacher=teacher_name, date=date_str, time=time_str)
+
+
+def count_tokens(model, text):
+    """Tokens in text for this model: model.count_tokens if enabled, else an estimate. Memoized."""
+    if not COUNT_TOKENS or not hasattr(model, 'count_tokens'):
+        return estimate_tokens(text)
+    key = (getattr(model, 'model_name', ''), hashlib.sha256(text.encode('utf-8')).hexdigest())
+    with _counts_lock:
+        if key in _counts:
+            _counts.move_to_end(key)
+            return _counts[key]
+    try:
+        count = model.count_tokens(text).total_tokens
+    except Exception as e:
+        print(f"count_tokens failed, estimating instead: {e}")
+        return estimate_tokens(text)
+    with _counts_lock:
+        _counts[key] = count
+        while len(_counts) > COUNT_CACHE_SIZE:
+            _counts.popitem(last=False)
+    return count
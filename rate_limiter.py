@@ -0,0 +1,266 @@
+"""
+Client-side rate limiting for Gemini calls.
+
+Each model gets a RateLimiter combining:
+- token buckets for requests-per-minute and tokens-per-minute quotas
+- AIMD adaptive concurrency: halve the in-flight limit on 429/503,
+  add one slot after a full window of successes
+- jittered exponential backoff for retries
+
+Limits default to the free-tier values and can be overridden with the
+GEMINI_RPM, GEMINI_TPM and GEMINI_MAX_CONCURRENCY environment variables or
+with configure().
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+
+import metrics
+
+DEFAULT_RPM = int(os.environ.get('GEMINI_RPM', 10))
+DEFAULT_TPM = int(os.environ.get('GEMINI_TPM', 250000))
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get('GEMINI_MAX_CONCURRENCY', 4))
+
+
+def is_throttle_error(error):
+    """True for quota / overload errors that should be retried."""
+    error_str = str(error)
+    return "429" in error_str or "503" in error_str
+
+
+def estimate_tokens(prompt):
+    """Rough token estimate (~4 characters per token)."""
+    return max(1, len(str(prompt)) // 4)
+
+
+class TokenBucket:
+    """Refills `rate_per_minute` units per minute up to `capacity`."""
+
+    def __init__(self, rate_per_minute, capacity=None, clock=time.monotonic):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount=1):
+        """
+        Takes `amount` units, going into debt if needed.
+        Returns how long the caller must wait before using them.
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on the number of in-flight calls."""
+
+    def __init__(self, max_limit, initial=None, min_limit=1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = initial or max_limit
+        self.in_flight = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False, failed=False):
+        with self._cond:
+            self.in_flight -= 1
+            if failed:
+                # Non-quota errors say nothing about capacity
+                pass
+            elif throttled:
+                # Multiplicative decrease
+                self.limit = max(self.min_limit, self.limit // 2)
+                self._successes = 0
+            else:
+                # Additive increase after a full window of successes
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_limit:
+                    self.limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+
+class RateLimiter:
+    """Shared limiter for one model."""
+
+    def __init__(self, model_name, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.model_name = model_name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self.requests = TokenBucket(rpm, clock=clock) if rpm else None
+        self.tokens = TokenBucket(tpm, clock=clock) if tpm else None
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+        self._stats = {'calls': 0, 'successes': 0, 'throttled': 0, 'errors': 0, 'queue_wait': 0.0, 'backoff_wait': 0.0}
+        self._started = None
+
+    def acquire(self, estimated_tokens=1):
+        """Blocks until a request slot is available. Returns the time spent waiting."""
+        start = self.clock()
+        self.concurrency.acquire()
+        with self._lock:
+            if self._started is None:
+                self._started = start
+            wait = 0.0
+            if self.requests:
+                wait = max(wait, self.requests.reserve(1))
+            if self.tokens:
+                wait = max(wait, self.tokens.reserve(estimated_tokens))
+        if wait > 0:
+            self.sleep(wait)
+        waited = self.clock() - start
+        with self._lock:
+            self._stats['calls'] += 1
+            self._stats['queue_wait'] += waited
+        return waited
+
+    def release(self, throttled=False, failed=False):
+        self.concurrency.release(throttled, failed)
+        with self._lock:
+            if failed:
+                self._stats['errors'] += 1
+            else:
+                self._stats['throttled' if throttled else 'successes'] += 1
+
+    def backoff_delay(self, attempt, base_delay):
+        """Picks (and records) a jittered exponential backoff without sleeping."""
+        delay = random.uniform(base_delay / 2, base_delay * (2 ** attempt))
+        with self._lock:
+            self._stats['backoff_wait'] += delay
+        return delay
+
+    def backoff(self, attempt, base_delay):
+        """Sleeps for a jittered exponential backoff and returns the delay."""
+        delay = self.backoff_delay(attempt, base_delay)
+        self.sleep(delay)
+        return delay
+
+    def stats(self):
+        """Counters plus average queue wait and effective throughput (successes/min)."""
+        with self._lock:
+            stats = dict(self._stats)
+            elapsed = self.clock() - self._started if self._started is not None else 0.0
+        stats['concurrency_limit'] = self.concurrency.limit
+        stats['avg_queue_wait'] = stats['queue_wait'] / stats['calls'] if stats['calls'] else 0.0
+        stats['throughput_per_min'] = stats['successes'] / elapsed * 60 if elapsed > 0 else 0.0
+        return stats
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _normalize(model_name):
+    return model_name[len('models/'):] if model_name.startswith('models/') else model_name
+
+
+def get_limiter(model_name):
+    """Returns the process-wide limiter for a model, creating it on first use."""
+    model_name = _normalize(model_name)
+    with _limiters_lock:
+        if model_name not in _limiters:
+            _limiters[model_name] = RateLimiter(model_name)
+        return _limiters[model_name]
+
+
+def configure(model_name, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM, max_concurrency=DEFAULT_MAX_CONCURRENCY, **kwargs):
+    """Replaces the limiter for a model with new limits."""
+    model_name = _normalize(model_name)
+    with _limiters_lock:
+        _limiters[model_name] = RateLimiter(model_name, rpm=rpm, tpm=tpm, max_concurrency=max_concurrency, **kwargs)
+        return _limiters[model_name]
+
+
+def _record_retry(limiter, delay):
+    metrics.inc('gemini_retries_total', model=limiter.model_name)
+    metrics.inc('gemini_backoff_seconds_total', delay, model=limiter.model_name)
+
+
+def call_with_limits(limiter, fn, prompt, retries=4, base_delay=10, tokens=None):
+    """
+    Runs fn() under the limiter, retrying 429/503 with jittered backoff.
+    Other errors are raised immediately. tokens overrides the estimate
+    from the prompt for the TPM reservation.
+    """
+    tokens = tokens or estimate_tokens(prompt)
+    for attempt in range(retries):
+        metrics.observe('gemini_queue_wait_seconds', limiter.acquire(tokens), model=limiter.model_name)
+        try:
+            with metrics.span('gemini.generate', model=limiter.model_name, attempt=attempt):
+                result = fn()
+        except Exception as e:
+            throttled = is_throttle_error(e)
+            limiter.release(throttled=throttled, failed=not throttled)
+            if throttled and attempt < retries - 1:
+                _record_retry(limiter, limiter.backoff(attempt, base_delay))
+                continue
+            raise
+        limiter.release()
+        return result
+
+
+async def _acquire_async(limiter, tokens):
+    """
+    limiter.acquire in a worker thread. The thread can't be cancelled, so
+    if the caller is, the slot it ends up taking is released once it has.
+    """
+    acquiring = asyncio.ensure_future(asyncio.to_thread(limiter.acquire, tokens))
+    try:
+        return await asyncio.shield(acquiring)
+    except asyncio.CancelledError:
+        def _release(future):
+            if not future.cancelled() and future.exception() is None:
+                limiter.release(failed=True)
+        acquiring.add_done_callback(_release)
+        raise
+
+
+async def call_with_limits_async(limiter, coro_fn, prompt, retries=4, base_delay=10, tokens=None):
+    """
+    call_with_limits for coroutines: awaits coro_fn() under the limiter.
+    Waiting for a slot happens in a worker thread so the event loop keeps
+    running other tasks meanwhile.
+    """
+    tokens = tokens or estimate_tokens(prompt)
+    for attempt in range(retries):
+        waited = await _acquire_async(limiter, tokens)
+        metrics.observe('gemini_queue_wait_seconds', waited, model=limiter.model_name)
+        try:
+            with metrics.span('gemini.generate', model=limiter.model_name, attempt=attempt):
+                result = await coro_fn()
+        except asyncio.CancelledError:
+            limiter.release(failed=True)
+            raise
+        except Exception as e:
+            throttled = is_throttle_error(e)
+            limiter.release(throttled=throttled, failed=not throttled)
+            if throttled and attempt < retries - 1:
+                delay = limiter.backoff_delay(attempt, base_delay)
+                _record_retry(limiter, delay)
+                await asyncio.sleep(delay)
+                continue
+            raise
+        limiter.release()
+        return result
@@ -0,0 +1,242 @@
+"""
+Tracks the [Y] / [N] replies to sent student confirmations.
+
+ReplyTracker follows the mailbox's Gmail history (historyId deltas since
+the last sync, not mailbox scans) for new messages in the threads of the
+student emails in the outbox. Each reply is classified by parse_reply, a
+local parser; Gemini is only asked when the parser can't tell. The latest
+answer per event is kept in SQLite, so the event list can show it without
+asking Gmail.
+
+If the stored historyId has expired (Gmail keeps about a week of history),
+the tracked threads are read again in full. Needs the gmail.readonly
+scope, which is only requested with REPLY_TRACKING=1; see available().
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import agent
+import auth
+import gmail_api
+import outbox
+
+DEFAULT_PATH = os.environ.get('REPLIES_PATH', 'replies.sqlite3')
+# Threads older than this are no longer watched
+TRACK_DAYS = 30
+# How often the app checks for new replies on its own (seconds)
+SYNC_INTERVAL = 60
+
+CONFIRMED = 'confirmed'
+DECLINED = 'declined'
+UNCLEAR = 'unclear'
+
+_QUOTE_START = re.compile(r"^(>|on .+ wrote:?$|-+ ?original message ?-+|from: )", re.IGNORECASE)
+_NOT_NO = re.compile(r"\bno (problem|worries|issue)s?\b")
+_YES = re.compile(r"\b(y|yes|yep|yeah|yup|sure|confirm(ed)?|ok(ay)?|will (be there|attend|come)|"
+                  r"i'?ll (be there|attend|come)|see you|can attend|can make it|works for me)\b")
+_NO = re.compile(r"\b(n|no|nope|cancel(led)?|can'?t|cannot|won'?t|unable|not able|"
+                 r"(can|will) not|reschedule|not (be )?(coming|attending))\b")
+
+
+def available(creds):
+    """True if reply tracking is on and creds were granted gmail.readonly."""
+    return auth.REPLY_TRACKING and auth.has_granted(creds, auth.GMAIL_READONLY_SCOPE)
+
+
+def _new_text(text):
+    """The reply's own lines, without the quoted original."""
+    lines = []
+    for line in text.splitlines():
+        if _QUOTE_START.match(line.strip()):
+            break
+        if line.strip():
+            lines.append(line.strip())
+    return " ".join(lines)
+
+
+def parse_reply(text):
+    """'yes', 'no' or None (no clear answer) for the text of a reply."""
+    text = _new_text(text).lower().replace('*', '')
+    if not text:
+        return None
+    first = re.match(r"\W*\[?\s*([yn])\s*\]?\W*(\s|$)", text)
+    if first:
+        return 'yes' if first.group(1) == 'y' else 'no'
+    text = _NOT_NO.sub(' ', text)
+    yes, no = bool(_YES.search(text)), bool(_NO.search(text))
+    if yes != no:
+        return 'yes' if yes else 'no'
+    return None
+
+
+class ReplyTracker:
+    """SQLite store of reply statuses per event, fed by sync()."""
+
+    def __init__(self, path=DEFAULT_PATH, box=None, use_llm=True, clock=time.time):
+        self.path = path
+        self.box = box
+        self.use_llm = use_llm
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS replies (
+                event_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                message_id TEXT NOT NULL,
+                sender TEXT,
+                snippet TEXT,
+                method TEXT NOT NULL,
+                received_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS seen (message_id TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, value TEXT);
+        """)
+        self._conn.commit()
+
+    def _box(self):
+        return self.box or outbox.get_outbox()
+
+    def _get_state(self, name):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM state WHERE name = ?", (name,)).fetchone()
+        return row['value'] if row else None
+
+    def _set_state(self, name, value):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO state (name, value) VALUES (?, ?)", (name, value))
+            self._conn.commit()
+
+    def _tracked_threads(self, service):
+        """{thread id: event id} for the student emails sent in the last TRACK_DAYS."""
+        box = self._box()
+        since = self.clock() - TRACK_DAYS * 24 * 3600
+        sent = [row for row in box.sent('student') if row['updated_at'] >= since and row['message_id']]
+        missing = {row['message_id']: row['key'] for row in sent if not row['thread_id']}
+        if missing:
+            # Sent before thread ids were recorded, or recovered by Outbox.resume
+            found = gmail_api.get_messages(service, list(missing), format='minimal')
+            box.set_thread_ids({missing[message_id]: message['threadId'] for message_id, message in found.items()})
+            for row in sent:
+                if row['message_id'] in found:
+                    row['thread_id'] = found[row['message_id']]['threadId']
+        return {row['thread_id']: row['event_id'] for row in sent if row['thread_id']}
+
+    def sync(self, service):
+        """
+        Picks up replies since the last sync. Returns the number of new
+        replies, by status.
+        """
+        with self._sync_lock:
+            threads = self._tracked_threads(service)
+            history_id = self._get_state('history_id')
+            if history_id is None:
+                candidates, history_id = self._rescan(service, threads)
+            else:
+                try:
+                    added, history_id = gmail_api.list_history(service, history_id)
+                    candidates = [m for m in added if m.get('threadId') in threads]
+                except Exception as e:
+                    if not gmail_api.is_not_found(e):
+                        raise
+                    print("Gmail history expired, reading the tracked threads again")
+                    candidates, history_id = self._rescan(service, threads)
+            new = self._ingest(service, candidates, threads)
+            self._set_state('history_id', str(history_id))
+            return new
+
+    def _rescan(self, service, threads):
+        """Every message in the tracked threads, plus the history id to continue from."""
+        history_id = gmail_api.get_profile(service)['historyId']
+        messages = []
+        for thread in gmail_api.get_threads(service, list(threads)).values():
+            messages.extend(thread.get('messages', []))
+        return messages, history_id
+
+    def _ingest(self, service, candidates, threads):
+        sent_ids = {row['message_id'] for row in self._box().sent()}
+        with self._lock:
+            seen = {row['message_id'] for row in self._conn.execute("SELECT message_id FROM seen")}
+        candidates = {m['id']: m for m in candidates
+                      if m['id'] not in seen and m['id'] not in sent_ids and 'SENT' not in m.get('labelIds', [])}
+        if not candidates:
+            return {}
+        needs_body = [message_id for message_id, m in candidates.items() if 'payload' not in m]
+        candidates.update(gmail_api.get_messages(service, needs_body))
+        new = {}
+        for message in sorted(candidates.values(), key=lambda m: int(m.get('internalDate', 0))):
+            if 'payload' not in message:
+                continue
+            event_id = threads.get(message.get('threadId'))
+            if event_id is not None:
+                status = self._record(event_id, message)
+                new[status] = new.get(status, 0) + 1
+            with self._lock:
+                self._conn.execute("INSERT OR IGNORE INTO seen (message_id) VALUES (?)", (message['id'],))
+                self._conn.commit()
+        return new
+
+    def _record(self, event_id, message):
+        text = gmail_api.message_text(message)
+        answer, method = parse_reply(text), 'parser'
+        if answer is None and self.use_llm and _new_text(text):
+            try:
+                answer, method = agent.classify_reply_with_llm(_new_text(text)), 'llm'
+            except Exception as e:
+                print(f"Could not classify reply {message['id']}: {e}")
+        status = {'yes': CONFIRMED, 'no': DECLINED}.get(answer, UNCLEAR)
+        received_at = int(message.get('internalDate', 0)) / 1000 or self.clock()
+        with self._lock:
+            # A later reply replaces an earlier one ("Y" then "sorry, N")
+            self._conn.execute(
+                "INSERT INTO replies (event_id, status, message_id, sender, snippet, method, received_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(event_id) DO UPDATE SET status = excluded.status, message_id = excluded.message_id, "
+                "sender = excluded.sender, snippet = excluded.snippet, method = excluded.method, "
+                "received_at = excluded.received_at WHERE excluded.received_at >= replies.received_at",
+                (event_id, status, message['id'], gmail_api.message_header(message, 'From'),
+                 _new_text(text)[:200], method, received_at))
+            self._conn.commit()
+        return status
+
+    def status(self, event_id):
+        """The stored reply for an event (a dict with 'status'), or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM replies WHERE event_id = ?", (event_id,)).fetchone()
+        return dict(row) if row else None
+
+    def statuses(self, event_ids=None):
+        """{event id: reply dict} for the given events (default: all)."""
+        with self._lock:
+            if event_ids is None:
+                rows = self._conn.execute("SELECT * FROM replies").fetchall()
+            else:
+                event_ids = list(event_ids)
+                rows = self._conn.execute(
+                    f"SELECT * FROM replies WHERE event_id IN ({','.join('?' * len(event_ids))})", event_ids).fetchall()
+        return {row['event_id']: dict(row) for row in rows}
+
+    def counts(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM replies GROUP BY status").fetchall()
+        counts = {CONFIRMED: 0, DECLINED: 0, UNCLEAR: 0}
+        counts.update({status: n for status, n in rows})
+        return counts
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_tracker():
+    """Process-wide reply tracker."""
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = ReplyTracker()
+        return _tracker
@@ -0,0 +1,88 @@
+"""
+Shared Google API service objects.
+
+googleapiclient.discovery.build parses a discovery document and sets up a
+transport on every call, so services are built once per (API, version,
+credential) and reused. Discovery documents come from the copies bundled
+with google-api-python-client (static_discovery) instead of the network.
+
+httplib2.Http is not thread-safe, so each request gets an AuthorizedHttp
+around a per-thread httplib2.Http. Threads keep their own keep-alive
+connections and a single service can be shared by worker threads and
+Streamlit sessions.
+
+At most MAX_SERVICES services are kept (several accounts in multi-user
+mode); the least recently used one is dropped first.
+"""
+import collections
+import os
+import threading
+
+MAX_SERVICES = int(os.environ.get('MAX_SERVICES', 64))
+
+_services = collections.OrderedDict()
+_services_lock = threading.Lock()
+_local = threading.local()
+
+
+def credential_key(creds):
+    """Stable identity for a credential, surviving Credentials object rebuilds."""
+    return getattr(creds, 'refresh_token', None) or getattr(creds, 'token', None) or id(creds)
+
+
+def _thread_http():
+    """httplib2.Http reused by every request made on this thread."""
+    import httplib2
+    http = getattr(_local, 'http', None)
+    if http is None:
+        http = _local.http = httplib2.Http(timeout=60)
+    return http
+
+
+def _request_builder(creds):
+    import google_auth_httplib2
+    from googleapiclient.http import HttpRequest
+
+    def build_request(http, *args, **kwargs):
+        return HttpRequest(google_auth_httplib2.AuthorizedHttp(creds, http=_thread_http()), *args, **kwargs)
+
+    return build_request
+
+
+def get_service(api, version, creds):
+    """Returns the shared service for api/version and this credential, building it on first use."""
+    key = (api, version, credential_key(creds))
+    with _services_lock:
+        service = _services.get(key)
+        if service is not None:
+            _services.move_to_end(key)
+    if service is not None:
+        return service
+
+    import google_auth_httplib2
+    from googleapiclient.discovery import build
+    service = build(api, version,
+                    http=google_auth_httplib2.AuthorizedHttp(creds, http=_thread_http()),
+                    requestBuilder=_request_builder(creds),
+                    cache_discovery=False,
+                    static_discovery=True)
+    with _services_lock:
+        # Another thread may have built it meanwhile; keep the first one
+        service = _services.setdefault(key, service)
+        while len(_services) > MAX_SERVICES:
+            _services.popitem(last=False)
+        return service
+
+
+def drop(creds):
+    """Drops the services built for one credential (e.g. a signed-out account)."""
+    key = credential_key(creds)
+    with _services_lock:
+        for cached in [k for k in _services if k[2] == key]:
+            del _services[cached]
+
+
+def clear():
+    """Drops every cached service (e.g. after logging out)."""
+    with _services_lock:
+        _services.clear()
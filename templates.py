@@ -0,0 +1,176 @@
+import re
+
+import event_view
+
+# Fixed-format confirmation emails rendered locally from a Calendar event.
+# These mirror the "Output Format" blocks the Gemini prompts used to describe,
+# so the model is only needed for fields we cannot pull out of the event.
+
+STUDENT_TEMPLATE = """Subject: REMINDER: {student}'s tutoring with {teacher} Teacher - {date} at {time}
+
+Dear {student},
+
+This is a reminder that {student} has a tutoring session with {teacher} Teacher, {date} at {time}
+
+Date: {date}
+Time: {time}
+Type: {type}
+Subject: {subject}
+
+If you cannot attend the tutoring session, please reply with **[N]**, and if you can attend, please reply with **[Y]** as soon as possible.
+
+If you have any questions or need further details, please feel free to contact us anytime.
+
+Best regards,
+
+Andy Lee / Elite Prep Suwanee"""
+
+TEACHER_TEMPLATE = """Subject: REMINDER: {teacher} teacher has tutoring with {student} - {date} at {time}
+
+Dear {teacher} teacher,
+
+This is a reminder that {teacher} teacher has a tutoring session with {student}, {date} at {time}
+
+Date: {date}
+Time: {time}
+Type: {type}
+Subject: {subject}
+
+If you have any questions or need further details, please feel free to contact us.
+
+Best regards,
+
+Andy Lee / Elite Prep Suwanee"""
+
+# One email per student listing a week of sessions (planner digests)
+DIGEST_TEMPLATE = """Subject: REMINDER: {student}'s tutoring sessions for the week of {week}
+
+Dear {student},
+
+This is a reminder of {student}'s tutoring sessions for the week of {week}:
+
+{sessions}
+
+If you cannot attend any of these sessions, please reply with **[N]** and the date, and if you can attend all of them, please reply with **[Y]** as soon as possible.
+
+If you have any questions or need further details, please feel free to contact us anytime.
+
+Best regards,
+
+Andy Lee / Elite Prep Suwanee"""
+
+# Date formats per recipient
+STUDENT_DATE_FORMAT = '%B, %d, %Y'   # December, 06, 2025
+TEACHER_DATE_FORMAT = '%m. %d, %Y'   # 12. 06, 2025
+
+# "Type: Online" / "Subject - SAT Math" style lines in the event description
+_TYPE_LINE = re.compile(r'^\s*(?:session\s+)?(?:type|format|mode)\s*[:\-]\s*(.+?)\s*$', re.I | re.M)
+_SUBJECT_LINE = re.compile(r'^\s*(?:subject|course|topic|class)\s*[:\-]\s*(.+?)\s*$', re.I | re.M)
+
+# Session type keywords, checked against summary + description
+_TYPE_KEYWORDS = [
+    (re.compile(r'\b(?:online|zoom|google meet|virtual|remote)\b', re.I), 'Online'),
+    (re.compile(r'\b(?:in[\s-]?person|offline|on[\s-]?site|in class)\b', re.I), 'In-Person'),
+]
+
+
+def format_date_time(event_details, date_format):
+    """
+    Returns (date_str, time_str) for an event.
+    Time range is 'h:mmam - h:mmpm'; all-day events return 'All Day'.
+    """
+    view = event_view.get_view(event_details)
+    return view.date(date_format), view.time_range
+
+
+def extract_fields(event_details):
+    """
+    Extracts [Type] and [Subject] from the event without calling the model.
+    Missing fields are returned as None so the caller can decide on a fallback.
+    """
+    description = event_details.get('description', '') or ''
+    summary = event_details.get('summary', '') or ''
+
+    session_type = None
+    match = _TYPE_LINE.search(description)
+    if match:
+        session_type = match.group(1)
+    else:
+        text = f"{summary}\n{description}"
+        for pattern, label in _TYPE_KEYWORDS:
+            if pattern.search(text):
+                session_type = label
+                break
+
+    subject = None
+    match = _SUBJECT_LINE.search(description)
+    if match:
+        subject = match.group(1)
+
+    return {'type': session_type, 'subject': subject}
+
+
+def missing_fields(fields):
+    """Names of fields the local extractor could not fill."""
+    return [name for name in ('type', 'subject') if not fields.get(name)]
+
+
+def render_student_email(event_details, teacher_name="Teacher", student_name="Student", fields=None):
+    """Renders the STUDENT confirmation email from the event."""
+    fields = fields or extract_fields(event_details)
+    date_str, time_str = format_date_time(event_details, STUDENT_DATE_FORMAT)
+    return STUDENT_TEMPLATE.format(
+        student=student_name,
+        teacher=teacher_name,
+        date=date_str,
+        time=time_str,
+        type=fields.get('type') or '',
+        subject=fields.get('subject') or '',
+    )
+
+
+def render_teacher_email(event_details, teacher_name="Teacher", student_name="Student", fields=None):
+    """Renders the TEACHER confirmation email from the event."""
+    fields = fields or extract_fields(event_details)
+    date_str, time_str = format_date_time(event_details, TEACHER_DATE_FORMAT)
+    return TEACHER_TEMPLATE.format(
+        student=student_name,
+        teacher=teacher_name,
+        date=date_str,
+        time=time_str,
+        type=fields.get('type') or '',
+        subject=fields.get('subject') or '',
+    )
+
+
+def _split_subject(text):
+    """Splits the leading 'Subject: ...' line off a rendered email."""
+    first, _, rest = text.partition('\n')
+    return {'subject': first[len('Subject:'):].strip(), 'body': rest.strip()}
+
+
+def render_drafts(event_details, teacher_name="Teacher", student_name="Student", fields=None):
+    """Renders both emails as {'student': {'subject', 'body'}, 'teacher': {...}}."""
+    fields = fields or extract_fields(event_details)
+    return {
+        'student': _split_subject(render_student_email(event_details, teacher_name, student_name, fields)),
+        'teacher': _split_subject(render_teacher_email(event_details, teacher_name, student_name, fields)),
+    }
+
+
+def render_digest(student_name, week_start, sessions):
+    """
+    Renders the weekly digest as {'subject', 'body'}. sessions is a list of
+    (event, teacher_name, fields) in time order.
+    """
+    lines = []
+    for event, teacher_name, fields in sessions:
+        date_str, time_str = format_date_time(event, STUDENT_DATE_FORMAT)
+        details = ", ".join(value for value in (fields.get('subject'), fields.get('type')) if value)
+        line = f"- {date_str} at {time_str} with {teacher_name} Teacher"
+        lines.append(f"{line} ({details})" if details else line)
+    return _split_subject(DIGEST_TEMPLATE.format(
+        student=student_name,
+        week=week_start.strftime(STUDENT_DATE_FORMAT),
+        sessions="\n".join(lines),
+    ))
@@ -0,0 +1,210 @@
+"""
+Multi-user mode (MULTI_USER=1): one Tenant per Google account.
+
+Users sign in with a web OAuth flow (auth.authorization_url and
+auth.finish_authorization), so each browser authorizes its own account;
+OAUTH_REDIRECT_URI must be the app's public URL.
+
+Each account gets a directory under TENANTS_DIR with its own token,
+outbox and reply tracker, plus its own CredentialManager and calendar
+sync, so nothing one account reads or sends is visible to another. Every
+browser tab of the same account shares its Tenant. That means the tabs
+share one calendar sync, and it is synced at most once per SYNC_MAX_AGE
+seconds instead of once per tab and rerun.
+
+The layers that don't depend on the account are shared by every tenant
+and bounded:
+- Google API services and their discovery documents (services.MAX_SERVICES)
+- Gemini model clients (model_pool.MAX_MODELS)
+- the event view and extraction caches
+- the draft cache, which is keyed by the prompt inputs
+The roster is shared too.
+
+TenantRegistry keeps at most MAX_TENANTS tenants in memory. When it is
+over the limit, the least recently used tenant that has been idle for at
+least MIN_IDLE seconds is closed: its background token refresh stops and
+its services are dropped. It is opened again from disk on its next request.
+"""
+import collections
+import datetime
+import hashlib
+import os
+import threading
+import time
+
+import auth
+import calendar_sync
+import credential_manager
+import metrics
+import outbox
+import replies
+import services
+
+MULTI_USER = os.environ.get('MULTI_USER', '0') == '1'
+TENANTS_DIR = os.environ.get('TENANTS_DIR', 'tenants')
+MAX_TENANTS = int(os.environ.get('MAX_TENANTS', 32))
+MIN_IDLE = float(os.environ.get('TENANT_MIN_IDLE', 300))
+SYNC_MAX_AGE = float(os.environ.get('TENANT_SYNC_MAX_AGE', 30))
+SYNC_DAYS = 30
+
+
+def tenant_id(email):
+    """Directory name for an account (no raw addresses on disk paths)."""
+    return hashlib.sha256(email.strip().lower().encode('utf-8')).hexdigest()[:16]
+
+
+class Tenant:
+    """Everything that belongs to one Google account."""
+
+    def __init__(self, email, creds, root=TENANTS_DIR, clock=time.time):
+        self.email = email.strip().lower()
+        self.id = tenant_id(email)
+        self.dir = os.path.join(root, self.id)
+        os.makedirs(self.dir, exist_ok=True)
+        self.token_path = os.path.join(self.dir, 'token.json')
+        self.clock = clock
+        self.credentials = credential_manager.CredentialManager(creds, token_path=self.token_path)
+        self.outbox = outbox.Outbox(os.path.join(self.dir, 'outbox.sqlite3'))
+        self.replies = replies.ReplyTracker(os.path.join(self.dir, 'replies.sqlite3'), box=self.outbox)
+        self.last_used = clock()
+        self._worker = None
+        self._sync = None
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+
+    def creds(self):
+        return self.credentials.get()
+
+    def calendar_sync(self, calendar_service, calendars=None):
+        """
+        The account's calendar sync, shared by its sessions. Synced if the
+        calendars changed or the last sync is older than SYNC_MAX_AGE.
+        """
+        with self._lock:
+            if self._sync is None:
+                self._sync = calendar_sync.MultiCalendarSync(
+                    calendar_service, time_min=datetime.date.today() - datetime.timedelta(days=SYNC_DAYS))
+            sync = self._sync
+            changed = calendars is not None and set(sync.syncs) != {c['id'] for c in calendars}
+            if changed:
+                sync.set_calendars(calendars)
+            due = changed or self.clock() - self._synced_at > SYNC_MAX_AGE
+            if due:
+                self._synced_at = self.clock()
+        if due:
+            with metrics.span('tenant.calendar_sync'):
+                sync.sync()
+        return sync
+
+    def start_worker(self, gmail_service):
+        """Starts the account's background sender (once)."""
+        verify = outbox.can_verify(self.creds())
+        with self._lock:
+            if self._worker is None:
+                self._worker = outbox.OutboxWorker(self.outbox, gmail_service, verify=verify)
+                self._worker.start()
+        return self._worker
+
+    def close(self):
+        """Stops the background refresh and sender and drops this account's services."""
+        self.credentials.stop()
+        if self._worker is not None:
+            self._worker.stop(timeout=5)
+        creds = self.credentials.creds
+        if creds is not None:
+            services.drop(creds)
+
+
+class TenantRegistry:
+    """The tenants in memory, LRU-bounded; see the module docstring."""
+
+    def __init__(self, root=TENANTS_DIR, max_tenants=MAX_TENANTS, min_idle=MIN_IDLE, clock=time.time,
+                 load_credentials=auth.load_token_credentials):
+        self.root = root
+        self.max_tenants = max_tenants
+        self.min_idle = min_idle
+        self.clock = clock
+        self.load_credentials = load_credentials
+        self.evictions = 0
+        self._tenants = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _add(self, tenant, replace=False):
+        """Registers tenant; without replace an account already open wins and tenant is discarded."""
+        with self._lock:
+            current = self._tenants.get(tenant.email)
+            if current is not None and not replace:
+                # Another session opened it meanwhile
+                self._tenants.move_to_end(tenant.email)
+                return current
+            self._tenants.pop(tenant.email, None)
+            self._tenants[tenant.email] = tenant
+            evicted = self._evict()
+        tenant.credentials.start()
+        for old in ([current] if current is not None else []) + evicted:
+            old.close()
+        metrics.inc('tenant_opens_total')
+        return tenant
+
+    def _evict(self):
+        """Tenants to close: oldest first while over the limit, skipping any used in the last min_idle seconds."""
+        evicted = []
+        now = self.clock()
+        for email in list(self._tenants):
+            if len(self._tenants) <= self.max_tenants:
+                break
+            if now - self._tenants[email].last_used >= self.min_idle:
+                evicted.append(self._tenants.pop(email))
+        self.evictions += len(evicted)
+        if evicted:
+            metrics.inc('tenant_evictions_total', len(evicted))
+        return evicted
+
+    def login(self, email, creds):
+        """Stores freshly authorized credentials for an account and returns its tenant."""
+        tenant = Tenant(email, creds, self.root, self.clock)
+        credential_manager.write_token_atomically(tenant.token_path, creds)
+        return self._add(tenant, replace=True)
+
+    def get(self, email):
+        """The tenant for an account, reopened from its stored token if needed; None if it never logged in."""
+        email = email.strip().lower()
+        with self._lock:
+            tenant = self._tenants.get(email)
+            if tenant is not None:
+                self._tenants.move_to_end(email)
+                tenant.last_used = self.clock()
+                return tenant
+        token_path = os.path.join(self.root, tenant_id(email), 'token.json')
+        creds = self.load_credentials(token_path)
+        if not creds:
+            return None
+        return self._add(Tenant(email, creds, self.root, self.clock))
+
+    def logout(self, email):
+        """Closes an account's tenant and deletes its stored token."""
+        email = email.strip().lower()
+        with self._lock:
+            tenant = self._tenants.pop(email, None)
+        if tenant is not None:
+            tenant.close()
+        token_path = os.path.join(self.root, tenant_id(email), 'token.json')
+        if os.path.exists(token_path):
+            os.remove(token_path)
+
+    def stats(self):
+        with self._lock:
+            return {'tenants': len(self._tenants), 'evictions': self.evictions}
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Process-wide tenant registry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = TenantRegistry()
+        return _registry